@@ -0,0 +1,53 @@
+"""
+Run the hanmoto benchmarks.
+
+    python -m benchmarks -o result.json
+    python -m benchmarks -k image --baseline benchmarks/baseline.json
+
+Benchmarks with a budget fail the run when they exceed it.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from . import (  # noqa
+    bench_api,
+    bench_image,
+    bench_import,
+    bench_localizer,
+    bench_queue,
+    bench_sequence,
+)
+from .suite import compare, load, over_budget, run, save
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "-k", "--pattern", default="", help="run benchmarks matching this"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument(
+        "-o", "--output", type=Path, help="write results as json"
+    )
+    parser.add_argument(
+        "--baseline", type=Path, help="results json to compare with"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="slowdown ratio over the baseline regarded as a regression",
+    )
+    args = parser.parse_args()
+
+    report = run(args.pattern, repeat=args.repeat)
+    save(report, args.output)
+    failed = over_budget(report)
+    if args.baseline is not None:
+        failed += compare(report, load(args.baseline), args.tolerance)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
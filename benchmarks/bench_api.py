@@ -0,0 +1,142 @@
+import json
+import time
+from typing import List, Optional, Union
+
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from hanmoto import HmtConf, HmtPrinterConf, HmtPrinterType
+from hanmoto.api import (
+    ImageModel,
+    StoredImageModel,
+    TextModel,
+    json_loads,
+    load_app,
+    parse_sequence,
+)
+
+from .suite import Timed, benchmark, resources
+
+REQUESTS = 100
+BATCH_SIZE = 50
+
+BODY = {
+    "contents": [
+        {"type": "text", "content": "hanmoto benchmark\n"},
+        {"type": "text", "content": "item 0001 ...... 1,200\n"},
+        {"type": "text", "content": "item 0002 ...... 3,400\n"},
+        {"type": "text", "content": "total ......... 4,600\n"},
+    ]
+}
+
+
+_client: Optional[TestClient] = None
+
+
+def app_client() -> TestClient:
+    """
+    Client of the app shared by the benchmarks, as the app keeps
+    its printers in module globals.
+    """
+    global _client
+    if _client is None:
+        conf = HmtConf(
+            printer_conf=HmtPrinterConf(printer_type=HmtPrinterType.dummy)
+        )
+        _client = resources.enter_context(TestClient(load_app(conf)))
+    return _client
+
+
+def wait(client: TestClient, job_id: str) -> None:
+    while client.get(f"/jobs/{job_id}").json()["status"] not in (
+        "done",
+        "failed",
+    ):
+        time.sleep(0.001)
+
+
+def print_sequence() -> Timed:
+    """
+    Requests to /print/sequence through the ASGI app,
+    until the last job is printed on a dummy printer.
+    """
+    client = app_client()
+
+    def run() -> None:
+        job_id = ""
+        for _ in range(REQUESTS):
+            job_id = client.post("/print/sequence", json=BODY).json()["job_id"]
+        wait(client, job_id)
+
+    return run, REQUESTS
+
+
+def print_batch() -> Timed:
+    """
+    The same jobs as api.print_sequence, sent to /print/batch
+    in batches of BATCH_SIZE.
+    """
+    client = app_client()
+    batch = {"items": [BODY] * BATCH_SIZE}
+
+    def run() -> None:
+        job_id = ""
+        for _ in range(REQUESTS // BATCH_SIZE):
+            items = client.post("/print/batch", json=batch).json()["items"]
+            job_id = items[-1]["job_id"]
+        wait(client, job_id)
+
+    return run, REQUESTS
+
+
+class TwoPassSequence(BaseModel):
+    """
+    Sequence validated by trying each content model in turn
+    """
+
+    contents: List[Union[ImageModel, StoredImageModel, TextModel]]
+
+
+VALIDATED = json.dumps(
+    {
+        "contents": [
+            {"type": "text", "content": f"item {i:04d} ...... 1,200\n"}
+            for i in range(100)
+        ]
+        + [{"type": "stored_image", "key": "logo"}]
+    }
+).encode()
+
+
+def validate_single_pass() -> Timed:
+    """
+    Parsing and validating a sequence of 100 texts as /print/sequence does
+    """
+
+    def run() -> None:
+        for _ in range(REQUESTS):
+            parse_sequence(json_loads(VALIDATED), "default")
+
+    return run, REQUESTS
+
+
+def validate_two_pass() -> Timed:
+    """
+    The same body parsed twice and validated without the discriminator,
+    as before the validation was done in one pass
+    """
+
+    def run() -> None:
+        for _ in range(REQUESTS):
+            TwoPassSequence.parse_obj(json.loads(VALIDATED))
+            body = json.loads(VALIDATED)
+            for content in body["contents"]:
+                assert "type" in content
+
+    return run, REQUESTS
+
+
+benchmark("api.print_sequence")(print_sequence)
+benchmark("api.print_batch")(print_batch)
+benchmark("api.validate.single_pass")(validate_single_pass)
+benchmark("api.validate.two_pass")(validate_two_pass)
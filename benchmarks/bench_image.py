@@ -0,0 +1,89 @@
+import contextlib
+import io
+from functools import partial
+from typing import Tuple
+
+from escpos.printer import Dummy
+from PIL import Image
+
+from hanmoto import HmtDither, HmtImage, HmtImageImpl, HmtImageStyle
+from hanmoto.compiler import HmtCompiler
+from hanmoto.localizer import HmtLocalizerEnum
+
+from .suite import Timed, benchmark
+
+SIZES = [(384, 384), (576, 1000), (576, 3000)]
+
+
+def photo(size: Tuple[int, int]) -> Image.Image:
+    return Image.effect_noise(size, 64).convert("RGB")
+
+
+def receipt_art(size: Tuple[int, int]) -> Image.Image:
+    """
+    Mostly white image, like a logo centered on the paper.
+    """
+    image = Image.new("L", size, 255)
+    width, height = size
+    image.paste(0, (width // 3, height // 8, width * 2 // 3, height // 4))
+    image.paste(0, (width // 4, height // 2, width * 3 // 4, height // 2 + 40))
+    return image
+
+
+def optimized(size: Tuple[int, int]) -> Timed:
+    compiler = HmtCompiler(HmtLocalizerEnum.en, paper_width=576)
+    image = HmtImage(receipt_art(size)).optimize()
+
+    def render() -> None:
+        compiler.render_image(image)
+
+    return render, 1
+
+
+def escpos(size: Tuple[int, int]) -> Timed:
+    """
+    Escpos.image, the rendering path before HmtRaster, for reference.
+    """
+    image = photo(size)
+
+    def render() -> None:
+        printer = Dummy()
+        # escpos prints a warning for every image without media width
+        with contextlib.redirect_stdout(io.StringIO()):
+            printer.image(image)
+
+    return render, 1
+
+
+def raster(
+    size: Tuple[int, int], impl: HmtImageImpl, dither: HmtDither
+) -> Timed:
+    compiler = HmtCompiler(HmtLocalizerEnum.en, paper_width=576)
+    image = HmtImage(photo(size), HmtImageStyle(impl=impl, dither=dither))
+
+    def render() -> None:
+        compiler.render_image(image)
+
+    return render, 1
+
+
+for size in SIZES:
+    label = f"{size[0]}x{size[1]}"
+    benchmark(f"image.escpos.{label}")(partial(escpos, size))
+    for impl in HmtImageImpl:
+        benchmark(f"image.{impl.value}.{label}")(
+            partial(raster, size, impl, HmtDither.floyd_steinberg)
+        )
+    for dither in (HmtDither.ordered, HmtDither.none):
+        benchmark(f"image.bitImageRaster.{dither.value}.{label}")(
+            partial(raster, size, HmtImageImpl.bitImageRaster, dither)
+        )
+benchmark("image.resize.2000x2000")(
+    partial(
+        raster,
+        (2000, 2000),
+        HmtImageImpl.bitImageRaster,
+        HmtDither.floyd_steinberg,
+    )
+)
+benchmark("image.optimize.576x1000")(partial(optimized, (576, 1000)))
@@ -0,0 +1,63 @@
+"""
+Import time of hanmoto, measured with python -X importtime.
+
+Every run imports in a fresh interpreter, and only the modules that
+the interpreter has not imported on its own at startup are counted.
+Scripts printing with hanmoto start many short-lived processes, so the
+common entry points have budgets.
+"""
+import subprocess
+import sys
+from functools import partial
+from typing import List, Optional, Tuple
+
+from .suite import Timed, benchmark
+
+
+def import_times(code: str) -> List[Tuple[str, int]]:
+    """
+    Modules imported by the code at the top level,
+    with their cumulative import time in microseconds
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stderr
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented after the separator
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            times.append((name.strip(), int(cumulative)))
+    return times
+
+
+def measure_import(code: str) -> Timed:
+    startup = {name for name, _ in import_times("pass")}
+
+    def run() -> float:
+        return (
+            sum(
+                microseconds
+                for name, microseconds in import_times(code)
+                if name not in startup
+            )
+            / 1_000_000
+        )
+
+    return run, 1
+
+
+IMPORTS: List[Tuple[str, str, Optional[float]]] = [
+    ("import.printables", "from hanmoto import HmtImage, HmtText", 150),
+    ("import.compiler", "from hanmoto import HmtCompiler, HmtText", 400),
+    ("import.cli", "import hanmoto.cli", 150),
+    ("import.api", "import hanmoto.api", None),
+]
+
+for name, code, budget_ms in IMPORTS:
+    benchmark(name, budget_ms)(partial(measure_import, code))
@@ -0,0 +1,42 @@
+from functools import partial
+
+from escpos.printer import Dummy
+
+from hanmoto import HmtText, HmtTextStyle
+from hanmoto.localizer import HmtLocalizerEnum
+
+from .suite import Timed, benchmark
+
+LINES = 100
+
+TEXTS = {
+    "en": "hanmoto makes your esc/pos printer accessible",
+    "jp": "本日はご来店いただき誠にありがとうございます",
+}
+
+
+def text_per_line(lang: str, styled: bool) -> Timed:
+    printer = Dummy()
+    localizer = HmtLocalizerEnum.get_localizer(lang).value(printer)
+    texts = [
+        HmtText(
+            TEXTS[lang],
+            properties=HmtTextStyle(bold=styled and i % 2 == 0),
+        )
+        for i in range(LINES)
+    ]
+
+    def render() -> None:
+        printer.clear()
+        localizer.reset()
+        for text in texts:
+            localizer.text(text)
+        localizer.finish()
+
+    return render, LINES
+
+
+for lang in TEXTS:
+    for styled in (False, True):
+        name = f"localizer.{lang}.text" + (".styled" if styled else "")
+        benchmark(name)(partial(text_per_line, lang, styled))
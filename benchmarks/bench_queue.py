@@ -0,0 +1,80 @@
+import asyncio
+from functools import partial
+from typing import List, Optional
+
+from PIL import Image
+
+from hanmoto import AsyncHanmoto, HmtImage, HmtText, Printable
+from hanmoto.events import HmtJobEvents, HmtJobEventType
+from hanmoto.jobs import HmtJob, HmtJobQueue
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.render import HmtRenderPool
+from hanmoto.testing import FakePrinterServer
+
+from .suite import Timed, benchmark, resources
+
+JOBS = 8
+# terminals watching the jobs of their own client
+TERMINALS = 2000
+# bytes per second, about a TM printer on 100BASE-T printing images
+BANDWIDTH = 2_000_000
+
+
+def image_job(i: int) -> List[Printable]:
+    photo = Image.effect_noise((576, 800), 64)
+    return [HmtText(f"job {i}\n"), HmtImage(photo)]
+
+
+def print_jobs(workers: Optional[int]) -> Timed:
+    server = resources.enter_context(FakePrinterServer(bandwidth=BANDWIDTH))
+    pool = (
+        None if workers is None else HmtRenderPool(workers, image_cache_size=0)
+    )
+    if pool is not None:
+        resources.callback(pool.shutdown)
+    jobs = [image_job(i) for i in range(JOBS)]
+
+    async def run_async() -> None:
+        hmt = AsyncHanmoto.from_network(
+            HmtLocalizerEnum.en,
+            host=server.host,
+            port=server.port,
+            paper_width=576,
+        )
+        # images are compiled anew every run
+        hmt.image_cache.max_bytes = 0
+        queue = HmtJobQueue(hmt, render_pool=pool)
+        await queue.start()
+        for job in jobs:
+            await queue.submit(job)
+        await queue.join()
+        await queue.stop()
+
+    def run() -> None:
+        asyncio.run(run_async())
+
+    return run, JOBS
+
+
+benchmark("queue.images.serial")(partial(print_jobs, None))
+benchmark("queue.images.render_pool")(partial(print_jobs, 2))
+
+
+@benchmark("queue.events.terminals")
+def publish_events() -> Timed:
+    jobs = [HmtJob(printer="default", client=f"pos{i}") for i in range(1000)]
+
+    async def run_async() -> None:
+        broker = HmtJobEvents()
+        subscriptions = [
+            broker.subscribe(client=f"pos{i}") for i in range(TERMINALS)
+        ]
+        for job in jobs:
+            broker.publish(job, HmtJobEventType.done)
+        for subscription in subscriptions:
+            subscription.close()
+
+    def run() -> None:
+        asyncio.run(run_async())
+
+    return run, len(jobs)
@@ -0,0 +1,85 @@
+from functools import partial
+from typing import List
+
+from PIL import Image
+
+from hanmoto import Hanmoto, HmtImage, HmtText, HmtTextStyle, Printable
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.templates import HmtTemplate, HmtTemplateSection
+from hanmoto.testing import FakePrinterServer
+
+from .suite import Timed, benchmark, resources
+
+SIZES = [10, 100, 1000]
+
+
+def receipt(size: int) -> List[Printable]:
+    logo = Image.effect_noise((256, 64), 64)
+    sequence: List[Printable] = [HmtImage(logo).center()]
+    for i in range(size - 1):
+        style = HmtTextStyle(bold=i % 5 == 0, align="left")
+        sequence.append(HmtText(f"item {i:04d} ........ 1,200\n", style))
+    return sequence
+
+
+def print_sequence(hmt: Hanmoto, size: int) -> Timed:
+    sequence = receipt(size)
+
+    def run() -> None:
+        with hmt:
+            hmt.print_sequence(sequence)
+
+    return run, size
+
+
+def dummy(size: int) -> Timed:
+    hmt = Hanmoto.from_dummy(HmtLocalizerEnum.en)
+    timed, ops = print_sequence(hmt, size)
+
+    def run() -> None:
+        timed()
+        hmt.printer.clear()
+
+    return run, ops
+
+
+def network(size: int) -> Timed:
+    server = resources.enter_context(FakePrinterServer())
+    hmt = Hanmoto.from_network(
+        HmtLocalizerEnum.en, host=server.host, port=server.port
+    )
+    return print_sequence(hmt, size)
+
+
+for size in SIZES:
+    benchmark(f"print_sequence.dummy.{size}")(partial(dummy, size))
+    benchmark(f"print_sequence.network.{size}")(partial(network, size))
+
+
+def template(size: int) -> Timed:
+    hmt = Hanmoto.from_dummy(HmtLocalizerEnum.en)
+    logo = Image.effect_noise((256, 64), 64)
+    receipt = HmtTemplate(
+        "receipt",
+        [
+            HmtImage(logo).center(),
+            HmtText("Hanmoto store\n", HmtTextStyle(bold=True)),
+            HmtTemplateSection(
+                "items", [HmtText("item {name} ........ {price:,}\n")]
+            ),
+        ],
+    )
+    variables = {
+        "items": [{"name": f"{i:04d}", "price": 1200} for i in range(size)]
+    }
+
+    def run() -> None:
+        with hmt:
+            hmt.print_sequence(receipt.fill(hmt.compiler, variables))
+        hmt.printer.clear()
+
+    return run, size
+
+
+for size in SIZES:
+    benchmark(f"print_template.dummy.{size}")(partial(template, size))
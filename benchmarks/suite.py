@@ -0,0 +1,133 @@
+"""
+Registry and runner of hanmoto benchmarks.
+
+Every benchmark is a factory that sets up its fixtures and returns the
+function to time with the number of operations one call performs.
+Fixtures that need closing are registered to resources, which is closed
+when the run finishes. A function may return the seconds it measured
+itself, e.g. in a subprocess, which are recorded instead of its wall
+time. Results are written as JSON, so a run can be compared with a
+stored baseline, and with the budget of a benchmark if it has one.
+"""
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+Timed = Tuple[Callable[[], Any], int]
+Factory = Callable[[], Timed]
+
+BENCHMARKS: Dict[str, Factory] = {}
+# milliseconds the best run of a benchmark may take at most
+BUDGETS: Dict[str, float] = {}
+resources = ExitStack()
+
+
+def benchmark(
+    name: str, budget_ms: Optional[float] = None
+) -> Callable[[Factory], Factory]:
+    def register(factory: Factory) -> Factory:
+        if name in BENCHMARKS:
+            raise ValueError(f"benchmark {name} is already registered")
+        BENCHMARKS[name] = factory
+        if budget_ms is not None:
+            BUDGETS[name] = budget_ms
+        return factory
+
+    return register
+
+
+def measure(factory: Factory, repeat: int, warmup: int) -> Dict[str, float]:
+    func, ops = factory()
+    for _ in range(warmup):
+        func()
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        measured = func()
+        elapsed = time.perf_counter() - start
+        timings.append(measured if isinstance(measured, float) else elapsed)
+    best = min(timings)
+    return {
+        "ops": ops,
+        "best_ms": best * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+        "per_op_us": best / ops * 1_000_000,
+        "ops_per_sec": ops / best if best > 0 else float("inf"),
+    }
+
+
+def run(pattern: str = "", repeat: int = 5, warmup: int = 1) -> Dict[str, Any]:
+    results = {}
+    with resources:
+        for name, factory in BENCHMARKS.items():
+            if pattern not in name:
+                continue
+            results[name] = measure(factory, repeat, warmup)
+            print(
+                f"{name:<48} {results[name]['best_ms']:10.3f} ms"
+                f" {results[name]['ops_per_sec']:14.1f} ops/s"
+            )
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """
+    Names of the benchmarks slower than the baseline by more than tolerance
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["best_ms"] / base["best_ms"]
+        mark = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print(f"{name:<48} {ratio:6.2f}x{mark}")
+    return regressions
+
+
+def over_budget(report: Dict[str, Any]) -> List[str]:
+    """
+    Names of the benchmarks slower than their budgets
+    """
+    exceeded = []
+    for name, result in report["results"].items():
+        budget = BUDGETS.get(name)
+        if budget is None:
+            continue
+        mark = ""
+        if result["best_ms"] > budget:
+            exceeded.append(name)
+            mark = "  OVER BUDGET"
+        print(f"{name:<48} {result['best_ms']:8.1f} / {budget:.0f} ms{mark}")
+    return exceeded
+
+
+def load(path: Path) -> Dict[str, Any]:
+    report: Dict[str, Any] = json.loads(path.read_text())
+    return report
+
+
+def save(report: Dict[str, Any], path: Optional[Path]) -> None:
+    if path is None:
+        return
+    path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
@@ -1,19 +1,82 @@
-from hanmoto.config import (
-    HmtApiConf,
-    HmtConf,
-    HmtDummyConf,
-    HmtNetworkConf,
-    HmtPrinterConf,
-    HmtPrinterType,
-)
-from hanmoto.exceptions import HmtException, HmtValueException
-from hanmoto.printables import (
-    PROPERTIES_TYPE,
-    HmtImage,
-    HmtImageImpl,
-    HmtImageStyle,
-    HmtText,
-    HmtTextStyle,
-    Printable,
-)
-from hanmoto.printer import Hanmoto
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from hanmoto.aio import AsyncHanmoto
+    from hanmoto.cache import HmtImageCache
+    from hanmoto.compiler import HmtCompiler
+    from hanmoto.config import (
+        HmtApiConf,
+        HmtConf,
+        HmtDummyConf,
+        HmtGraphicsMemory,
+        HmtNetworkConf,
+        HmtPrinterConf,
+        HmtPrinterType,
+    )
+    from hanmoto.exceptions import HmtException, HmtValueException
+    from hanmoto.printables import (
+        PROPERTIES_TYPE,
+        HmtDither,
+        HmtImage,
+        HmtImageImpl,
+        HmtImageStyle,
+        HmtRaster,
+        HmtRaw,
+        HmtStoredImage,
+        HmtStoredImageStyle,
+        HmtText,
+        HmtTextStyle,
+        Printable,
+    )
+    from hanmoto.printer import Hanmoto, HmtSession
+    from hanmoto.status import HmtPrinterStatus
+    from hanmoto.stored import HmtStoredGraphics
+
+# module of each name, imported when the name is first used, so that
+# printables are used without loading escpos, PIL or numpy
+_EXPORTS = {
+    "AsyncHanmoto": "hanmoto.aio",
+    "HmtImageCache": "hanmoto.cache",
+    "HmtCompiler": "hanmoto.compiler",
+    "HmtApiConf": "hanmoto.config",
+    "HmtConf": "hanmoto.config",
+    "HmtDummyConf": "hanmoto.config",
+    "HmtGraphicsMemory": "hanmoto.config",
+    "HmtNetworkConf": "hanmoto.config",
+    "HmtPrinterConf": "hanmoto.config",
+    "HmtPrinterType": "hanmoto.config",
+    "HmtException": "hanmoto.exceptions",
+    "HmtValueException": "hanmoto.exceptions",
+    "PROPERTIES_TYPE": "hanmoto.printables",
+    "HmtDither": "hanmoto.printables",
+    "HmtImage": "hanmoto.printables",
+    "HmtImageImpl": "hanmoto.printables",
+    "HmtImageStyle": "hanmoto.printables",
+    "HmtRaster": "hanmoto.printables",
+    "HmtRaw": "hanmoto.printables",
+    "HmtStoredImage": "hanmoto.printables",
+    "HmtStoredImageStyle": "hanmoto.printables",
+    "HmtText": "hanmoto.printables",
+    "HmtTextStyle": "hanmoto.printables",
+    "Printable": "hanmoto.printables",
+    "Hanmoto": "hanmoto.printer",
+    "HmtSession": "hanmoto.printer",
+    "HmtPrinterStatus": "hanmoto.status",
+    "HmtStoredGraphics": "hanmoto.stored",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted([*globals(), *_EXPORTS])
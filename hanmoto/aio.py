@@ -0,0 +1,660 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import os
+import time
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from logging import getLogger
+from types import TracebackType
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
+
+from escpos.printer import Dummy
+
+from .cache import HmtImageCache
+from .compiler import HmtCompiler
+from .config import HmtConf, HmtPrinterConf, HmtPrinterType
+from .connection import set_keepalive
+from .exceptions import HmtPrinterStatusException, HmtValueException
+from .localizer import HmtLocalizerEnum
+from .metrics import BYTES_SENT, STAGE_SECONDS
+from .printables import HmtImage, Printable
+from .status import (
+    ASB_ENABLE,
+    STATUS_REQUEST,
+    HmtPrinterStatus,
+    HmtStatusReader,
+)
+from .tracing import tracer
+
+logger = getLogger(__name__)
+
+
+class HmtAsyncTransport(ABC):
+    """
+    Base class of transports that write ESC/POS programs asynchronously.
+    """
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    async def connection(self) -> int:
+        """
+        Id of the live connection. It changes on every new connection.
+        """
+        return 0
+
+    async def status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Read the status of the printer, None if the transport cannot read it
+        """
+        return None
+
+    @property
+    def printer_status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Latest status of the printer, None until it is read
+        """
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class HmtAsyncNetwork(HmtAsyncTransport):
+    """
+    Transport that writes to a network printer over asyncio streams.
+    ...
+
+    The connection is opened lazily, checked before every write and
+    reconnected with bounded exponential backoff like HmtNetwork.
+    Every write waits for the stream to drain, so a slow printer pushes
+    back on the writer instead of growing the buffer.
+    With status_check, the status of the printer is read with DLE EOT
+    before writing, and kept up to date by automatic status back, so
+    writes to a printer that is out of paper or has its cover open fail
+    right away instead of stalling until the timeout. Programs are sent
+    in chunks, and sending stops as soon as the printer stops printing.
+
+    Parameters
+    ----------
+    host : str
+        hostname, ip address of the printer
+    port : int, optional
+        port number of the printer
+    timeout : float, optional
+        timeout in seconds for writing to the printer
+    connect_timeout : float, optional
+        timeout in seconds for connecting to the printer
+    keepalive : bool, optional
+        enable TCP keepalive on the connection
+    max_retries : int, optional
+        number of connection attempts after the first one fails
+    retry_backoff : float, optional
+        seconds to wait before the first retry. doubled on every retry.
+    max_backoff : float, optional
+        upper bound of the seconds to wait between retries
+    status_check : bool, optional
+        read the status of the printer and fail writes it cannot print
+    status_timeout : float, optional
+        timeout in seconds for the printer to answer a status request
+    status_interval : float, optional
+        seconds a status is trusted before it is read again
+    chunk_size : int, optional
+        bytes sent at a time when the status is checked
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 9100,
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        keepalive: bool = True,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        max_backoff: float = 8,
+        status_check: bool = False,
+        status_timeout: float = 2,
+        status_interval: float = 1,
+        chunk_size: int = 4096,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.status_check = status_check
+        self.status_timeout = status_timeout
+        self.status_interval = status_interval
+        self.chunk_size = chunk_size
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.reconnects = 0
+        self.connected_at: Optional[float] = None
+        self._opened = False
+        self._status = HmtStatusReader(f"{host}:{port}")
+        # created on the event loop of the connection
+        self._status_reader: Optional[asyncio.Task[None]] = None
+        self._replies: Optional[asyncio.Queue[int]] = None
+        self._status_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def connection_age(self) -> Optional[float]:
+        if self.connected_at is None:
+            return None
+        return time.monotonic() - self.connected_at
+
+    @property
+    def printer_status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Latest status of the printer, None until it is read
+        """
+        return self._status.status
+
+    def stats(self) -> Dict[str, Any]:
+        status = self.printer_status
+        return {
+            "connected": self.writer is not None,
+            "reconnects": self.reconnects,
+            "connection_age": self.connection_age,
+            "status": None if status is None else status.dict(),
+        }
+
+    async def open(self) -> None:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            self.connect_timeout,
+        )
+        device = writer.get_extra_info("socket")
+        if self.keepalive and device is not None:
+            set_keepalive(device)
+        self.reader, self.writer = reader, writer
+        self.connected_at = time.monotonic()
+        if self._opened:
+            self.reconnects += 1
+        self._opened = True
+        if self.status_check:
+            self._replies = asyncio.Queue()
+            self._status_reader = asyncio.create_task(
+                self._read_status(reader)
+            )
+            writer.write(ASB_ENABLE)
+
+    async def close(self) -> None:
+        writer, self.writer, self.reader = self.writer, None, None
+        self.connected_at = None
+        self._status.reset()
+        status_reader, self._status_reader = self._status_reader, None
+        if status_reader is not None:
+            status_reader.cancel()
+            with suppress(asyncio.CancelledError):
+                await status_reader
+        if writer is None:
+            return
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    def is_alive(self) -> bool:
+        return (
+            self.reader is not None
+            and self.writer is not None
+            and not self.writer.is_closing()
+            and not self.reader.at_eof()
+        )
+
+    async def ensure_connected(self) -> None:
+        if self.is_alive():
+            return
+        if self.writer is not None:
+            logger.info(f"connection to {self.host}:{self.port} is dead")
+        await self.close()
+
+        backoff = self.retry_backoff
+        for retry in range(self.max_retries + 1):
+            try:
+                await self.open()
+                return
+            except OSError as e:
+                if retry == self.max_retries:
+                    raise
+                logger.warning(
+                    f"failed to connect to {self.host}:{self.port}: {e}. "
+                    f"retry in {backoff} seconds"
+                )
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def connection(self) -> int:
+        await self.ensure_connected()
+        return self.reconnects
+
+    async def status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Read the status of the printer with DLE EOT.
+        None without status_check.
+        """
+        if not self.status_check:
+            return None
+        await self.ensure_connected()
+        if self._status_lock is None:
+            self._status_lock = asyncio.Lock()
+        async with self._status_lock:
+            assert self.writer is not None and self._replies is not None
+            replies = self._replies
+            while not replies.empty():
+                replies.get_nowait()
+            # real-time commands are answered even while the printer
+            # is offline, so the request is not drained with the data
+            self.writer.write(STATUS_REQUEST)
+            try:
+                received = await asyncio.wait_for(
+                    self._receive(replies, 4), self.status_timeout
+                )
+            except asyncio.TimeoutError:
+                raise HmtPrinterStatusException(
+                    f"printer {self.host}:{self.port} "
+                    "does not answer status requests"
+                )
+            status = HmtPrinterStatus.from_replies(received)
+            self._status.update(status)
+            return status
+
+    @staticmethod
+    async def _receive(replies: asyncio.Queue[int], count: int) -> List[int]:
+        return [await replies.get() for _ in range(count)]
+
+    async def write(self, data: bytes) -> None:
+        await self.ensure_connected()
+        try:
+            if self.status_check:
+                await self._check_status()
+            await self._write(data)
+        except ConnectionError as e:
+            logger.warning(f"failed to write to {self.host}:{self.port}: {e}")
+            await self.close()
+            await self.ensure_connected()
+            await self._write(data)
+        except HmtPrinterStatusException:
+            # data stuck in the buffers would be printed after the job
+            # failed, so the connection is dropped with it
+            if self.writer is not None:
+                self.writer.transport.abort()
+            await self.close()
+            raise
+
+    async def _write(self, data: bytes) -> None:
+        assert self.writer is not None
+        if not self.status_check:
+            self.writer.write(data)
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+            return
+        for start in range(0, len(data), self.chunk_size):
+            # automatic status back tells when the printer stops printing
+            status = self.printer_status
+            if status is not None:
+                status.check(f"{self.host}:{self.port}")
+            self.writer.write(data[start : start + self.chunk_size])
+            await self._drain()
+
+    async def _drain(self) -> None:
+        """
+        Wait for the stream to drain, failing when the printer reports
+        that it stopped printing while the stream is stalled.
+        """
+        assert self.writer is not None
+        drain = asyncio.ensure_future(self.writer.drain())
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                done, _ = await asyncio.wait(
+                    {drain}, timeout=min(self.status_timeout, remaining)
+                )
+                if done:
+                    drain.result()
+                    return
+                status = self.printer_status
+                if status is not None:
+                    status.check(f"{self.host}:{self.port}")
+        finally:
+            drain.cancel()
+
+    async def _check_status(self) -> None:
+        status = self.printer_status
+        if self._status.stale(self.status_interval):
+            status = await self.status()
+        if status is not None:
+            status.check(f"{self.host}:{self.port}")
+
+    async def _read_status(self, reader: asyncio.StreamReader) -> None:
+        """
+        Read the replies to DLE EOT and automatic status back
+        """
+        try:
+            while True:
+                data = await reader.read(256)
+                if not data:
+                    return
+                for reply in self._status.feed(data):
+                    if self._replies is not None:
+                        self._replies.put_nowait(reply)
+        except OSError as e:
+            logger.debug(f"status of {self.host}:{self.port} is lost: {e}")
+
+
+class HmtAsyncDummy(HmtAsyncTransport):
+    """
+    Transport that keeps written programs on a Dummy printer.
+    """
+
+    def __init__(self) -> None:
+        self.printer = Dummy()
+
+    @property
+    def output(self) -> bytes:
+        output: bytes = self.printer.output
+        return output
+
+    async def write(self, data: bytes) -> None:
+        self.printer._raw(data)
+
+    async def close(self) -> None:
+        ...
+
+
+class AsyncHanmoto(object):
+    """
+    Printer class for printing printable objects from asyncio.
+    ...
+
+    Sequences are compiled into ESC/POS programs off the event loop and
+    written by an asynchronous transport, so one event loop can drive
+    many printers without a thread per connection.
+
+    Attributes
+    ----------
+    transport : HmtAsyncTransport
+        transport that writes programs to the printer
+    localizer_type : HmtLocalizerEnum
+        localizer used to render texts
+    compiler : HmtCompiler
+        compiler that renders sequences into ESC/POS programs
+    image_cache : HmtImageCache
+        cache of rendered images
+    graphics : HmtStoredGraphics
+        images stored in the printer
+
+    Parameters
+    ----------
+    transport : HmtAsyncTransport
+        transport that writes programs to the printer
+    localizer : HmtLocalizerEnum
+        localizer used to render texts
+    image_cache : HmtImageCache, optional
+        cache of rendered images. a new cache is created if None.
+    paper_width : int, optional
+        printable width of the paper in dots.
+        taken from the printer profile if None.
+    """
+
+    def __init__(
+        self,
+        transport: HmtAsyncTransport,
+        localizer: HmtLocalizerEnum,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
+    ) -> None:
+        self.transport = transport
+        self.localizer_type = localizer
+        self.image_cache = (
+            HmtImageCache() if image_cache is None else image_cache
+        )
+        self.compiler = HmtCompiler(
+            localizer, image_cache=self.image_cache, paper_width=paper_width
+        )
+        self.graphics = self.compiler.graphics
+        self.in_with = False
+
+        cut_target = Dummy()
+        cut_target.cut()
+        self._cut: bytes = cut_target.output
+
+    @classmethod
+    def from_conf(cls, conf: HmtConf) -> AsyncHanmoto:
+        return cls.from_printer_conf(conf.get_printer_confs()[0])
+
+    @classmethod
+    def from_printer_conf(cls, printer_conf: HmtPrinterConf) -> AsyncHanmoto:
+        printer_type = printer_conf.printer_type
+        localizer = HmtLocalizerEnum.get_localizer(printer_conf.lang)
+        image_cache = HmtImageCache(printer_conf.image_cache_size)
+        if printer_type == HmtPrinterType.network:
+            instance = cls.from_network(
+                **printer_conf.conf.dict(),
+                localizer=localizer,
+                image_cache=image_cache,
+                paper_width=printer_conf.paper_width,
+            )
+        elif printer_type == HmtPrinterType.dummy:
+            instance = cls.from_dummy(
+                localizer=localizer,
+                image_cache=image_cache,
+                paper_width=printer_conf.paper_width,
+            )
+        else:
+            raise HmtValueException(f"Unknown printer type: {printer_type}")
+        instance.name = printer_conf.name
+        instance.graphics.memory = printer_conf.graphics_memory
+        for key, image_src in printer_conf.stored_images.items():
+            instance.store_image(key, HmtImage(image_src))
+        return instance
+
+    @classmethod
+    def from_network(
+        cls,
+        localizer: Union[HmtLocalizerEnum, str],
+        host: str = "",
+        port: int = 9100,
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        keepalive: bool = True,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        max_backoff: float = 8,
+        status_check: bool = False,
+        status_timeout: float = 2,
+        status_interval: float = 1,
+        chunk_size: int = 4096,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
+    ) -> AsyncHanmoto:
+        """
+        Initialize AsyncHanmoto with network connected printer
+
+        Parameters are the same as Hanmoto.from_network.
+        The printer is connected on the first print.
+        """
+        if (
+            "HANMOTO_PRINTER_IP" in os.environ
+            and os.environ["HANMOTO_PRINTER_IP"]
+        ):
+            host = os.environ["HANMOTO_PRINTER_IP"]
+        if not host:
+            raise HmtValueException("host param is needed to be specified")
+
+        transport = HmtAsyncNetwork(
+            host,
+            port=port,
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            keepalive=keepalive,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            max_backoff=max_backoff,
+            status_check=status_check,
+            status_timeout=status_timeout,
+            status_interval=status_interval,
+            chunk_size=chunk_size,
+        )
+        localizer = (
+            HmtLocalizerEnum.get_localizer(localizer)
+            if isinstance(localizer, str)
+            else localizer
+        )
+        return cls(
+            transport,
+            localizer,
+            image_cache=image_cache,
+            paper_width=paper_width,
+        )
+
+    @classmethod
+    def from_dummy(
+        cls,
+        localizer: HmtLocalizerEnum,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
+    ) -> AsyncHanmoto:
+        """
+        Initialize AsyncHanmoto with dummy printer
+        """
+        return cls(
+            HmtAsyncDummy(),
+            localizer,
+            image_cache=image_cache,
+            paper_width=paper_width,
+        )
+
+    def store_image(self, key: str, image: HmtImage) -> None:
+        """
+        Store an image in the printer to print it by key with HmtStoredImage
+        """
+        self.graphics.register(key, image)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "image_cache": self.image_cache.stats(),
+            "stored_graphics": self.graphics.stats(),
+        }
+        transport_stats = self.transport.stats()
+        if transport_stats:
+            stats["connection"] = transport_stats
+        return stats
+
+    async def status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Read the status of the printer, None if it cannot be read
+        """
+        return await self.transport.status()
+
+    @property
+    def printer_status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Latest status of the printer, None until it is read
+        """
+        return self.transport.printer_status
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the printer, used to label metrics.
+        """
+        return self.compiler.name
+
+    @name.setter
+    def name(self, name: str) -> None:
+        self.compiler.name = name
+
+    def compile(self, sequence: Iterable[Printable]) -> bytes:
+        with STAGE_SECONDS.time(printer=self.name, stage="compile"):
+            with tracer.span("compile", printer=self.name):
+                return self.compiler.compile(sequence)
+
+    async def print_sequence(
+        self, sequence: Iterable[Printable], program: Optional[bytes] = None
+    ) -> None:
+        """
+        Print sequence. Parameters are the same as Hanmoto.print_sequence.
+        """
+        if not self.in_with:
+            logger.warning(
+                (
+                    "You are printing sequence from out-side of with "
+                    "statement. This may prevent the cut from being "
+                    "performed correctly."
+                )
+            )
+        printables: List[Printable] = list(sequence)
+        uploads: List[str] = []
+        stored = self.graphics.keys_in(printables)
+        if stored:
+            connection = await self.transport.connection()
+            uploads = self.graphics.missing(stored, connection)
+        if program is None:
+            loop = asyncio.get_running_loop()
+            # the executor does not carry the context, i.e. the current span
+            context = contextvars.copy_context()
+            compiled: bytes = await loop.run_in_executor(
+                None, context.run, self.compile, printables
+            )
+            program = compiled
+        if uploads:
+            program = self.graphics.define(uploads) + program
+        if program:
+            with STAGE_SECONDS.time(
+                printer=self.name, stage="send"
+            ), tracer.span(
+                "send",
+                printer=self.name,
+                bytes=len(program),
+                uploads=len(uploads),
+            ):
+                await self.transport.write(program)
+            BYTES_SENT.inc(len(program), printer=self.name)
+        if uploads:
+            # a write retried on a new connection uploads to that one
+            self.graphics.loaded(uploads, await self.transport.connection())
+
+    async def cut(self) -> None:
+        with STAGE_SECONDS.time(printer=self.name, stage="cut"), tracer.span(
+            "cut", printer=self.name
+        ):
+            await self.transport.write(self._cut)
+
+    async def close(self) -> None:
+        await self.transport.close()
+
+    async def __aenter__(self) -> AsyncHanmoto:
+        self.in_with = True
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.in_with = False
+        if exc_type is None:
+            await self.cut()
+        elif not issubclass(exc_type, OSError):
+            # a failed cut must not hide the error of the block
+            try:
+                await self.cut()
+            except Exception:
+                logger.exception(f"cut of printer {self.name} failed")
@@ -1,23 +1,81 @@
+import asyncio
 import base64
+import binascii
+import contextvars
+import hashlib
+import json
+import math
+import tempfile
 from abc import abstractmethod
-from io import BytesIO
-from typing import Dict, List, Literal, Optional, Union
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request
-from PIL import Image
-from pydantic import BaseModel, BaseSettings
+from fastapi import (
+    APIRouter,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, BaseSettings, Field, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import FormData, UploadFile
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing_extensions import Annotated
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 from hanmoto import (
     Hanmoto,
     HmtImage,
     HmtImageStyle,
+    HmtStoredImage,
+    HmtStoredImageStyle,
     HmtText,
     HmtTextStyle,
     Printable,
 )
-from hanmoto.exceptions import HmtValueException, HmtWebAPISequenceException
+from hanmoto.aio import AsyncHanmoto
+from hanmoto.compiler import HmtCompiler
+from hanmoto.events import HmtJobSubscription, events
+from hanmoto.exceptions import (
+    HmtException,
+    HmtJobException,
+    HmtValueException,
+    HmtWebAPISequenceException,
+)
+from hanmoto.jobs import HmtJob, HmtJobQueue
+from hanmoto.metrics import STAGE_SECONDS, count_error, metrics
 from hanmoto.printer import HmtConf
+from hanmoto.registry import HmtPrinterRegistry
+from hanmoto.scheduler import HmtPriority
+from hanmoto.templates import HmtTemplate, HmtTemplateSection, TemplateContent
+from hanmoto.tracing import configure, parse_traceparent, tracer
 
 
 class Settings(BaseSettings):
@@ -27,17 +85,115 @@ class Settings(BaseSettings):
 
 load_dotenv()
 
-printer: Hanmoto
+# orjson parses and serializes json faster when it is installed
+if orjson is not None:
+    json_loads: Callable[[Union[str, bytes]], Any] = orjson.loads
+    response_class: Type[Response] = ORJSONResponse
+else:
+    json_loads = json.loads
+    response_class = JSONResponse
+
+printer: Union[Hanmoto, AsyncHanmoto]
+registry = HmtPrinterRegistry()
+templates: Dict[str, HmtTemplate] = {}
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+MISSING_TYPE = "value_error.discriminated_union.missing_discriminator"
+# uploaded bodies larger than this are spooled to disk
+UPLOAD_SPOOL_SIZE = 1024 * 1024
+PRIORITY_HEADER = "x-priority"
+CLIENT_HEADER = "x-client-id"
+# seconds between comments keeping idle event streams open through proxies
+SSE_KEEPALIVE = 15.0
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+UploadFiles = Dict[str, IO[bytes]]
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def collect_queues(
+    value: Callable[[HmtJobQueue], float]
+) -> Callable[[], Iterator[Tuple[Dict[str, str], float]]]:
+    def collect() -> Iterator[Tuple[Dict[str, str], float]]:
+        for name, queue in registry.queues.items():
+            yield {"printer": name}, value(queue)
+
+    return collect
+
+
+metrics.gauge(
+    "hanmoto_jobs_queued",
+    "Jobs waiting to be printed.",
+    ("printer",),
+    collect_queues(lambda queue: queue.pending),
+)
+metrics.gauge(
+    "hanmoto_jobs_in_flight",
+    "Jobs being printed.",
+    ("printer",),
+    collect_queues(lambda queue: queue.current is not None),
+)
+metrics.gauge(
+    "hanmoto_printer_online",
+    "Whether the printer is regarded as online.",
+    ("printer",),
+    collect_queues(lambda queue: queue.online),
+)
 
 
 def load_app(conf: HmtConf) -> FastAPI:
-    global printer
-    app = FastAPI()
+    global printer, registry, templates
+    configure(conf.trace_conf)
+    app = FastAPI(default_response_class=response_class)
     setup_app(app)
-    printer = Hanmoto.from_conf(conf)
+    registry = HmtPrinterRegistry.from_conf(conf)
+    printer = registry.route().printer
+    templates = {
+        name: TemplateModel(contents=contents).to_hmt(name)
+        for name, contents in conf.templates.items()
+    }
     return app
 
 
+class HmtTracingMiddleware(object):
+    """
+    ASGI middleware that opens a span for every request while tracing.
+    ...
+
+    The trace joins the W3C traceparent header of the request if given,
+    and its id is returned in the X-Trace-Id response header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        parent: Dict[str, str] = {}
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                parent = parse_traceparent(value.decode("latin-1")) or {}
+        span = tracer.span(
+            "request", method=scope["method"], path=scope["path"], **parent
+        )
+
+        async def send_with_trace_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set(status=message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", span.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with span:
+            await self.app(scope, receive, send_with_trace_id)
+
+
 class PrintableModel(BaseModel):
     @abstractmethod
     def to_hmt(self) -> Printable:
@@ -60,61 +216,899 @@ class ImageModel(PrintableModel):
     type: Literal["image"] = "image"
     base64: str = ""
     image_src: str = ""
+    upload: str = ""
     style: HmtImageStyle = HmtImageStyle()
 
     def to_hmt(self) -> Printable:
         if self.base64:
-            img_base64_bytes = base64.b64decode(self.base64)
-            image = Image.open(BytesIO(img_base64_bytes))
+            try:
+                img_base64_bytes = base64.b64decode(self.base64)
+                return HmtImage.from_bytes(
+                    img_base64_bytes, properties=self.style
+                )
+            except (binascii.Error, OSError) as e:
+                # PIL raises UnidentifiedImageError, an OSError
+                raise HmtValueException(f"image cannot be decoded: {e}")
         elif self.image_src:
-            image = self.image_src
+            return HmtImage(self.image_src, properties=self.style)
         else:
             raise HmtValueException("Specify image source")
-        return HmtImage(image, properties=self.style)
+
+
+class StoredImageModel(PrintableModel):
+    type: Literal["stored_image"] = "stored_image"
+    key: str
+    style: HmtStoredImageStyle = HmtStoredImageStyle()
+
+    def to_hmt(self) -> Printable:
+        return HmtStoredImage(self.key, properties=self.style)
+
+
+ContentModel = Union[ImageModel, StoredImageModel, TextModel]
+# contents are validated by the model their type names, in one pass
+Content = Annotated[ContentModel, Field(discriminator="type")]
 
 
 class Sequence(BaseModel):
-    contents: List[Union[ImageModel, TextModel]]
+    contents: List[Content]
+    priority: Optional[HmtPriority] = None
 
 
-def setup_app(app: FastAPI) -> None:
-    @app.post("/print/sequence")
-    async def print_sequence(
-        sequence: Sequence, request: Request
-    ) -> Dict[str, str]:
-        def validate_sequence(sequence_list: List[Dict]) -> None:
-            for i, content in enumerate(sequence_list):
-                if "type" not in content:
-                    raise HmtWebAPISequenceException(
-                        (
-                            f"content: {content} (at index {i}) has no 'type' field. "
-                            "Please specify type field for all content in 'contents'. "
-                            "e.g. '{{'type': 'text', 'content': 'string'}}'"
-                        )
+class BatchItemModel(BaseModel):
+    contents: List[Content]
+    cut: bool = True
+
+
+class BatchModel(BaseModel):
+    items: List[BatchItemModel]
+    priority: Optional[HmtPriority] = None
+
+
+class SectionModel(BaseModel):
+    type: Literal["section"] = "section"
+    name: str
+    contents: List["TemplateContentModel"]
+
+    def to_hmt(self) -> HmtTemplateSection:
+        return HmtTemplateSection(
+            self.name, to_template_contents(self.contents)
+        )
+
+
+TemplateContentModel = Annotated[
+    Union[ImageModel, StoredImageModel, TextModel, SectionModel],
+    Field(discriminator="type"),
+]
+SectionModel.update_forward_refs()
+
+
+class TemplateModel(BaseModel):
+    contents: List[TemplateContentModel]
+
+    def to_hmt(self, name: str) -> HmtTemplate:
+        return HmtTemplate(name, to_template_contents(self.contents))
+
+
+class TemplateVariables(BaseModel):
+    variables: Dict[str, Any] = {}
+
+
+def to_template_contents(
+    models: List[Union[ContentModel, SectionModel]]
+) -> List[TemplateContent]:
+    for model in models:
+        if isinstance(model, ImageModel) and model.upload:
+            raise HmtValueException(
+                "'upload' is only allowed in multipart requests"
+            )
+    return [model.to_hmt() for model in models]
+
+
+def openapi_body(model: Type[BaseModel], multipart: Dict) -> Dict:
+    """
+    Request body of endpoints that read the body by hand
+    """
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": model.schema()},
+                "multipart/form-data": {"schema": multipart},
+            },
+        }
+    }
+
+
+SEQUENCE_OPENAPI = openapi_body(
+    Sequence,
+    {
+        "type": "object",
+        "properties": {
+            "sequence": {"type": "string", "description": "Sequence json"},
+        },
+        "additionalProperties": {"type": "string", "format": "binary"},
+    },
+)
+IMAGE_OPENAPI = openapi_body(
+    ImageModel,
+    {
+        "type": "object",
+        "properties": {
+            "image": {"type": "string", "format": "binary"},
+            "style": {"type": "string", "description": "HmtImageStyle json"},
+        },
+    },
+)
+IMAGE_OPENAPI["requestBody"]["content"]["image/*"] = {
+    "schema": {"type": "string", "format": "binary"}
+}
+
+
+def job_response(job: HmtJob) -> Dict[str, str]:
+    return {"status": job.status.value, "job_id": job.id}
+
+
+def get_job_queue(name: Optional[str] = None) -> HmtJobQueue:
+    """
+    Job queue to submit a job to, refusing the job if it is backlogged.
+    ...
+
+    A backlogged queue answers 429 while its printer is online, and 503
+    while the printer is offline or cannot print, with Retry-After so
+    that clients back off instead of piling up jobs.
+    """
+    try:
+        queue = registry.route(name)
+    except HmtValueException as e:
+        count_error(registry.default if name is None else name, e)
+        raise HTTPException(status_code=404, detail=e.message)
+    if queue.backlogged:
+        online = queue.online
+        error = HmtJobException(
+            f"printer {queue.name} has {queue.load} jobs in its backlog"
+            if online
+            else f"printer {queue.name} is offline with {queue.load} jobs"
+        )
+        count_error(queue.name, error)
+        raise HTTPException(
+            status_code=429 if online else 503,
+            detail=error.message,
+            headers={"Retry-After": str(math.ceil(queue.retry_after()))},
+        )
+    return queue
+
+
+def job_options(
+    request: HTTPConnection, priority: Optional[HmtPriority] = None
+) -> Tuple[HmtPriority, str]:
+    """
+    Priority and client id of the jobs of a request.
+    ...
+
+    The priority is given in the body, or in the X-Priority header,
+    and is normal by default. Clients are told apart by the X-Client-Id
+    header, or by their addresses.
+    """
+    if priority is None:
+        header = request.headers.get(PRIORITY_HEADER)
+        try:
+            priority = (
+                HmtPriority.normal if header is None else HmtPriority(header)
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=422,
+                detail=(
+                    f"{PRIORITY_HEADER} must be one of "
+                    f"{', '.join(priority.value for priority in HmtPriority)}"
+                ),
+            )
+    client = request.headers.get(CLIENT_HEADER)
+    if client is None:
+        client = "" if request.client is None else request.client.host
+    return priority, client
+
+
+def last_event_id(request: Request) -> Optional[int]:
+    header = request.headers.get("last-event-id")
+    try:
+        return None if header is None else int(header)
+    except ValueError:
+        return None
+
+
+async def stream_events(
+    subscription: HmtJobSubscription,
+) -> AsyncIterator[str]:
+    """
+    Server-sent events of a subscription, closing it when the client leaves
+    """
+    try:
+        while True:
+            try:
+                event = await subscription.get(SSE_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            yield (
+                f"id: {event.id}\nevent: {event.type.value}\n"
+                f"data: {event.data()}\n\n"
+            )
+    finally:
+        subscription.close()
+
+
+def parse_model(model: Type[ModelT], body: Any) -> ModelT:
+    """
+    Validate a body read by hand, failing like a body parsed by FastAPI
+    """
+    try:
+        return model.parse_obj(body)
+    except ValidationError as e:
+        raise body_error(e, body)
+
+
+def body_error(e: ValidationError, body: Any) -> RequestValidationError:
+    return RequestValidationError([ErrorWrapper(e, ("body",))], body=body)
+
+
+def parse_json(text: Optional[str], field: str) -> Any:
+    if text is None:
+        return {}
+    try:
+        return json_loads(text)
+    except ValueError:
+        raise HTTPException(
+            status_code=422, detail=f"'{field}' field is not valid json"
+        )
+
+
+async def read_json(request: Request) -> Any:
+    try:
+        return json_loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=422, detail="body is not valid json")
+
+
+def parse_sequence(body: Any, printer_name: str) -> Sequence:
+    """
+    Validate a sequence, telling which content has no type field
+    """
+    try:
+        return Sequence.parse_obj(body)
+    except ValidationError as e:
+        for error in e.errors():
+            if error["type"] == MISSING_TYPE and error["loc"][0] == "contents":
+                i = error["loc"][1]
+                content = body["contents"][i]
+                exception = HmtWebAPISequenceException(
+                    (
+                        f"content: {content} (at index {i}) "
+                        "has no 'type' field. Please specify type field "
+                        "for all content in 'contents'. "
+                        "e.g. '{{'type': 'text', 'content': 'string'}}'"
                     )
+                )
+                count_error(printer_name, exception)
+                raise HTTPException(status_code=422, detail=exception.message)
+        raise body_error(e, body)
+
+
+async def spool_body(request: Request) -> Tuple[IO[bytes], str]:
+    """
+    Stream the request body to a spooled temporary file
+
+    Returns
+    -------
+    file : IO[bytes]
+        file of the body, rewound
+    digest : str
+        sha256 hex digest of the body, taken while spooling
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    body_hash = hashlib.sha256()
+    async for chunk in request.stream():
+        body_hash.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, body_hash.hexdigest()
+
+
+async def read_form(request: Request) -> Tuple[FormData, UploadFiles]:
+    form = await request.form()
+    uploads: UploadFiles = {
+        key: value.file
+        for key, value in form.multi_items()
+        if isinstance(value, UploadFile)
+    }
+    return form, uploads
+
 
-        body = await request.json()
+async def decode_image(
+    file: IO[bytes],
+    style: HmtImageStyle,
+    paper_width: Optional[int],
+    digest: Optional[str] = None,
+) -> HmtImage:
+    """
+    Decode an uploaded image off the event loop
+    """
+    try:
+        return await run_in_threadpool(
+            HmtImage.from_file, file, style, paper_width, digest
+        )
+    except OSError as e:
+        raise HTTPException(
+            status_code=422, detail=f"image cannot be decoded: {e}"
+        )
+
+
+async def fill_template(
+    template: HmtTemplate, compiler: HmtCompiler, variables: Dict[str, Any]
+) -> List[Printable]:
+    """
+    Fill a template off the event loop, since its static parts are
+    compiled on first use
+    """
+    context = contextvars.copy_context()
+
+    def fill() -> List[Printable]:
+        return context.run(template.fill, compiler, variables)
+
+    return await run_in_threadpool(fill)
+
+
+async def to_printables(
+    models: List[Union[ImageModel, StoredImageModel, TextModel]],
+    name: Optional[str] = None,
+    uploads: Optional[UploadFiles] = None,
+    paper_width: Optional[int] = None,
+) -> List[Printable]:
+    printer_name = registry.default if name is None else name
+    try:
+        with STAGE_SECONDS.time(printer=printer_name, stage="decode"):
+            printables: List[Printable] = []
+            for model in models:
+                with tracer.span("to_hmt", type=model.type):
+                    if isinstance(model, ImageModel) and model.upload:
+                        if uploads is None or model.upload not in uploads:
+                            raise HTTPException(
+                                status_code=422,
+                                detail=(
+                                    f"file '{model.upload}' is not uploaded"
+                                ),
+                            )
+                        printables.append(
+                            await decode_image(
+                                uploads[model.upload], model.style, paper_width
+                            )
+                        )
+                    elif isinstance(model, ImageModel):
+                        # images are decoded and opened off the event loop
+                        printables.append(
+                            await run_in_threadpool(model.to_hmt)
+                        )
+                    else:
+                        printables.append(model.to_hmt())
+            return printables
+    except (HmtException, HTTPException) as e:
+        count_error(printer_name, e)
+        raise
+
+
+router = APIRouter()
+
+
+@router.on_event("startup")
+async def start_job_queues() -> None:
+    await registry.start()
+
+
+@router.on_event("shutdown")
+async def stop_job_queues() -> None:
+    await registry.stop()
+
+
+@router.get("/jobs/events")
+async def get_job_events(
+    request: Request,
+    printer: Optional[str] = None,
+    client: Optional[str] = None,
+    job_id: List[str] = Query([]),
+) -> StreamingResponse:
+    if printer is not None and printer not in registry.queues:
+        raise HTTPException(
+            status_code=404, detail=f"printer {printer} is not found"
+        )
+    unfinished = set()
+    for watched_id in job_id:
+        job = registry.get_job(watched_id)
+        if job is None:
+            raise HTTPException(
+                status_code=404, detail=f"job {watched_id} is not found"
+            )
+        if not job.status.finished:
+            unfinished.add(job.id)
+    subscription = events.subscribe(
+        printer, client, job_id or None, last_event_id(request)
+    )
+    if job_id:
+        # the stream of given jobs ends when they are finished
+        subscription.unfinished = unfinished
+    return StreamingResponse(
+        stream_events(subscription),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+async def socket_print(
+    websocket: WebSocket,
+    message: Dict[str, Any],
+    subscription: HmtJobSubscription,
+) -> Dict[str, Any]:
+    name = message.get("printer")
+    printer_name = registry.default if name is None else name
+    queue = get_job_queue(name)
+    sequence = parse_sequence(message, printer_name)
+    printables = await to_printables(sequence.contents, name)
+    job = await queue.submit(
+        printables, *job_options(websocket, sequence.priority)
+    )
+    subscription.watch([job.id])
+    return {"type": "submitted", **job_response(job)}
+
+
+def socket_watch(
+    message: Dict[str, Any], subscription: HmtJobSubscription
+) -> Dict[str, Any]:
+    job_ids = message.get("job_ids")
+    if not isinstance(job_ids, list):
+        raise HTTPException(status_code=422, detail="job_ids must be a list")
+    for watched_id in job_ids:
+        if registry.get_job(str(watched_id)) is None:
+            raise HTTPException(
+                status_code=404, detail=f"job {watched_id} is not found"
+            )
+    subscription.watch(map(str, job_ids))
+    return {"type": "watching", "job_ids": job_ids}
+
+
+async def socket_message(
+    websocket: WebSocket, text: str, subscription: HmtJobSubscription
+) -> Dict[str, Any]:
+    """
+    Submit a job or watch jobs as told by a websocket message
+    """
+    try:
+        message = json_loads(text)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict):
+        return {
+            "type": "error",
+            "status": 422,
+            "detail": "message is not a json object",
+        }
+    ref = message.get("ref")
+    try:
+        if message.get("type") == "print":
+            reply = await socket_print(websocket, message, subscription)
+        elif message.get("type") == "watch":
+            reply = socket_watch(message, subscription)
+        else:
+            raise HTTPException(
+                status_code=422, detail="type must be print or watch"
+            )
+        return {**reply, "ref": ref}
+    except HTTPException as e:
+        status, detail = e.status_code, e.detail
+    except RequestValidationError as e:
+        status, detail = 422, jsonable_encoder(e.errors())
+    except HmtException as e:
+        status, detail = 422, e.message
+    return {
+        "type": "error",
+        "ref": ref,
+        "status": status,
+        "detail": detail,
+    }
+
+
+@router.websocket("/jobs/ws")
+async def job_socket(
+    websocket: WebSocket,
+    printer: Optional[str] = None,
+    client: Optional[str] = None,
+) -> None:
+    await websocket.accept()
+    # without filters, the socket watches the jobs submitted on it
+    subscription = events.subscribe(
+        printer, client, None if printer or client else ()
+    )
+    lock = asyncio.Lock()
+
+    async def push_events() -> None:
+        while True:
+            event = await subscription.get()
+            if event is None:
+                return
+            async with lock:
+                await websocket.send_text(
+                    f'{{"type":"event","event":{event.data()}}}'
+                )
+
+    pusher = asyncio.create_task(push_events())
+    try:
+        while True:
+            text = await websocket.receive_text()
+            reply = await socket_message(websocket, text, subscription)
+            async with lock:
+                await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+        pusher.cancel()
+        await asyncio.gather(pusher, return_exceptions=True)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict:
+    job = registry.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404, detail=f"job {job_id} is not found"
+        )
+    return job.info()
+
+
+@router.get("/metrics")
+async def get_metrics() -> Response:
+    return Response(metrics.expose(), media_type=METRICS_CONTENT_TYPE)
+
+
+@router.get("/debug/traces")
+async def get_traces(trace_id: Optional[str] = None) -> Dict:
+    ring_buffer = tracer.ring_buffer()
+    if ring_buffer is None:
+        raise HTTPException(
+            status_code=404,
+            detail="traces are kept only with the ring_buffer sink",
+        )
+    return {"traces": ring_buffer.traces(trace_id)}
+
+
+@router.get("/printers")
+async def get_printers() -> Dict:
+    return {
+        "default": registry.default,
+        "printers": {
+            name: {
+                "online": queue.online,
+                "pending": queue.pending,
+                "printing": queue.current is not None,
+                **queue.printer.stats(),
+            }
+            for name, queue in registry.queues.items()
+        },
+        "pools": {
+            name: {
+                "strategy": pool.strategy.value,
+                "printers": [queue.name for queue in pool.queues],
+            }
+            for name, pool in registry.pools.items()
+        },
+        "spool": (None if registry.spool is None else registry.spool.stats()),
+    }
+
+
+@router.get("/printers/{name}/status")
+async def get_printer_status(name: str) -> Dict:
+    queue = registry.queues.get(name)
+    if queue is None:
+        raise HTTPException(
+            status_code=404, detail=f"printer {name} is not found"
+        )
+    try:
+        if isinstance(queue.printer, AsyncHanmoto):
+            status = await queue.printer.status()
+        else:
+            status = await run_in_threadpool(queue.printer.status)
+    except (OSError, HmtException) as e:
+        count_error(name, e)
+        raise HTTPException(
+            status_code=503, detail=f"{e.__class__.__name__}: {e}"
+        )
+    return {
+        "online": queue.online,
+        "load": queue.load,
+        "status": None if status is None else status.dict(),
+    }
+
+
+def paper_width(queue: HmtJobQueue) -> Optional[int]:
+    return queue.printer.compiler.paper_width
+
+
+async def submit_sequence(
+    request: Request, name: Optional[str] = None
+) -> Dict[str, str]:
+    printer_name = registry.default if name is None else name
+    queue = get_job_queue(name)
+    form: Optional[FormData] = None
+    uploads: UploadFiles = {}
+    try:
+        with STAGE_SECONDS.time(
+            printer=printer_name, stage="parse"
+        ), tracer.span("validate") as span:
+            if request.headers.get("content-type", "").startswith(
+                "multipart/form-data"
+            ):
+                form, uploads = await read_form(request)
+                sequence_field = form.get("sequence")
+                body = parse_json(
+                    sequence_field
+                    if isinstance(sequence_field, str)
+                    else None,
+                    "sequence",
+                )
+            else:
+                body = await read_json(request)
+            sequence = parse_sequence(body, printer_name)
+            span.set(contents=len(sequence.contents))
+
+        printables = await to_printables(
+            sequence.contents,
+            name,
+            uploads,
+            paper_width(queue) if uploads else None,
+        )
+    finally:
+        if form is not None:
+            await form.close()
+    return job_response(
+        await queue.submit(
+            printables, *job_options(request, sequence.priority)
+        )
+    )
+
+
+async def submit_image(
+    request: Request, style: Optional[str], name: Optional[str] = None
+) -> Dict[str, str]:
+    printer_name = registry.default if name is None else name
+    queue = get_job_queue(name)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("image/"):
+        image_style = parse_model(HmtImageStyle, parse_json(style, "style"))
+        spool, digest = await spool_body(request)
+        try:
+            with STAGE_SECONDS.time(printer=printer_name, stage="decode"):
+                image = await decode_image(
+                    spool, image_style, paper_width(queue), digest
+                )
+        finally:
+            spool.close()
+        return job_response(await queue.submit([image], *job_options(request)))
+
+    if content_type.startswith("multipart/form-data"):
+        form, uploads = await read_form(request)
+        try:
+            if "image" not in uploads:
+                raise HTTPException(
+                    status_code=422, detail="file 'image' is not uploaded"
+                )
+            style_field = form.get("style")
+            model = ImageModel(
+                upload="image",
+                style=parse_model(
+                    HmtImageStyle,
+                    parse_json(
+                        style_field if isinstance(style_field, str) else style,
+                        "style",
+                    ),
+                ),
+            )
+            printables = await to_printables(
+                [model], name, uploads, paper_width(queue)
+            )
+        finally:
+            await form.close()
+        return job_response(
+            await queue.submit(printables, *job_options(request))
+        )
+
+    if content_type and not content_type.startswith("application/json"):
+        raise HTTPException(
+            status_code=415,
+            detail=f"content type {content_type} is not supported",
+        )
+    model = parse_model(ImageModel, await read_json(request))
+    if model.upload:
+        raise HTTPException(
+            status_code=422,
+            detail="'upload' is only allowed in multipart requests",
+        )
+    return job_response(
+        await queue.submit(
+            await to_printables([model], name), *job_options(request)
+        )
+    )
+
+
+@router.post(
+    "/print/sequence",
+    status_code=202,
+    openapi_extra=SEQUENCE_OPENAPI,
+)
+async def print_sequence(request: Request) -> Dict[str, str]:
+    return await submit_sequence(request)
+
+
+@router.post(
+    "/printers/{name}/print/sequence",
+    status_code=202,
+    openapi_extra=SEQUENCE_OPENAPI,
+)
+async def print_sequence_on(name: str, request: Request) -> Dict[str, str]:
+    return await submit_sequence(request, name)
+
+
+async def submit_batch(
+    request: Request, batch: BatchModel, name: Optional[str] = None
+) -> Dict[str, Any]:
+    queue = get_job_queue(name)
+    results: List[Dict[str, str]] = []
+    sequences: List[Tuple[List[Printable], bool]] = []
+    for item in batch.items:
         try:
-            validate_sequence(body["contents"])
-        except HmtWebAPISequenceException as e:
-            raise HTTPException(status_code=422, detail=e.message)
+            printables = await to_printables(item.contents, name)
+        except HmtException as e:
+            results.append({"status": "failed", "error": e.message})
+        else:
+            results.append({})
+            sequences.append((printables, item.cut))
+
+    jobs = iter(
+        await queue.submit_batch(
+            sequences, *job_options(request, batch.priority)
+        )
+        if sequences
+        else []
+    )
+    batch_id = None
+    for i, result in enumerate(results):
+        if not result:
+            job = next(jobs)
+            batch_id = job.batch_id
+            results[i] = job_response(job)
+    return {"batch_id": batch_id, "items": results}
+
 
-        with printer:
-            printables = [elem.to_hmt() for elem in sequence.contents]
-            printer.print_sequence(printables)
+@router.post("/print/batch", status_code=202)
+async def print_batch(request: Request, batch: BatchModel) -> Dict[str, Any]:
+    return await submit_batch(request, batch)
 
-        return {"status": "success"}
 
-    @app.post("/print/text")
-    def print_text(text: TextModel) -> Dict[str, str]:
-        with printer:
-            printer.print_sequence([text.to_hmt()])
+@router.post("/printers/{name}/print/batch", status_code=202)
+async def print_batch_on(
+    name: str, request: Request, batch: BatchModel
+) -> Dict[str, Any]:
+    return await submit_batch(request, batch, name)
 
-        return {"status": "success"}
 
-    @app.post("/print/image")
-    def print_image(image: ImageModel) -> Dict[str, str]:
-        with printer:
-            printer.print_sequence([image.to_hmt()])
+async def submit_template(
+    request: Request,
+    template_name: str,
+    variables: TemplateVariables,
+    name: Optional[str] = None,
+) -> Dict[str, str]:
+    printer_name = registry.default if name is None else name
+    queue = get_job_queue(name)
+    template = templates.get(template_name)
+    if template is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"template {template_name} is not found",
+        )
+    try:
+        with STAGE_SECONDS.time(
+            printer=printer_name, stage="decode"
+        ), tracer.span("fill", template=template_name):
+            printables = await fill_template(
+                template, queue.printer.compiler, variables.variables
+            )
+    except HmtException as e:
+        count_error(printer_name, e)
+        raise HTTPException(status_code=422, detail=e.message)
+    return job_response(await queue.submit(printables, *job_options(request)))
 
-        return {"status": "success"}
+
+@router.get("/templates")
+async def get_templates() -> Dict:
+    return {
+        "templates": {
+            name: {"variables": sorted(template.variables)}
+            for name, template in templates.items()
+        }
+    }
+
+
+@router.put("/templates/{template_name}")
+async def put_template(template_name: str, template: TemplateModel) -> Dict:
+    try:
+        # images of the template are decoded off the event loop
+        templates[template_name] = await run_in_threadpool(
+            template.to_hmt, template_name
+        )
+    except HmtException as e:
+        raise HTTPException(status_code=422, detail=e.message)
+    return {
+        "name": template_name,
+        "variables": sorted(templates[template_name].variables),
+    }
+
+
+@router.post("/print/template/{template_name}", status_code=202)
+async def print_template(
+    request: Request, template_name: str, variables: TemplateVariables
+) -> Dict[str, str]:
+    return await submit_template(request, template_name, variables)
+
+
+@router.post(
+    "/printers/{name}/print/template/{template_name}", status_code=202
+)
+async def print_template_on(
+    name: str,
+    request: Request,
+    template_name: str,
+    variables: TemplateVariables,
+) -> Dict[str, str]:
+    return await submit_template(request, template_name, variables, name)
+
+
+@router.post("/print/text", status_code=202)
+async def print_text(request: Request, text: TextModel) -> Dict[str, str]:
+    return job_response(
+        await get_job_queue().submit(
+            await to_printables([text]), *job_options(request)
+        )
+    )
+
+
+@router.post("/printers/{name}/print/text", status_code=202)
+async def print_text_on(
+    name: str, request: Request, text: TextModel
+) -> Dict[str, str]:
+    return job_response(
+        await get_job_queue(name).submit(
+            await to_printables([text], name), *job_options(request)
+        )
+    )
+
+
+@router.post("/print/image", status_code=202, openapi_extra=IMAGE_OPENAPI)
+async def print_image(
+    request: Request, style: Optional[str] = None
+) -> Dict[str, str]:
+    return await submit_image(request, style)
+
+
+@router.post(
+    "/printers/{name}/print/image",
+    status_code=202,
+    openapi_extra=IMAGE_OPENAPI,
+)
+async def print_image_on(
+    name: str, request: Request, style: Optional[str] = None
+) -> Dict[str, str]:
+    return await submit_image(request, style, name)
+
+
+def setup_app(app: FastAPI) -> None:
+    app.add_middleware(HmtTracingMiddleware)
+    app.include_router(router)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+from .config import DEFAULT_IMAGE_CACHE_SIZE
+from .printables import HmtImage
+
+
+class HmtImageCache(object):
+    """
+    LRU cache of ESC/POS commands of rendered images.
+    ...
+
+    Entries are keyed by the content digest of the image and its style,
+    so the same image printed with the same style is rendered only once.
+    The least recently used entries are evicted when the total size of
+    the cached commands exceeds max_bytes.
+
+    Attributes
+    ----------
+    max_bytes : int
+        upper bound of the total size of cached commands
+    size : int
+        current total size of cached commands
+    hits : int
+        number of lookups that found cached commands
+    misses : int
+        number of lookups that did not find cached commands
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        upper bound of the total size of cached commands.
+        0 disables caching.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_IMAGE_CACHE_SIZE) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(image: HmtImage, paper_width: Optional[int] = None) -> str:
+        style = image.properties
+        return ":".join(
+            (
+                image.digest,
+                style.impl.value,
+                str(int(style.center)),
+                str(int(style.high_density_vertical)),
+                str(int(style.high_density_horizontal)),
+                str(style.fragment_height),
+                style.dither.value,
+                str(style.threshold),
+                str(int(style.optimize)),
+                str(paper_width),
+            )
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            program = self._entries.get(key)
+            if program is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return program
+
+    def put(self, key: str, program: bytes) -> None:
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            if len(program) > self.max_bytes:
+                return
+            self._entries[key] = program
+            self.size += len(program)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+        }
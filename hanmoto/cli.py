@@ -1,6 +1,3 @@
-import uvicorn
-
-from hanmoto.api import load_app
 from hanmoto.config import (
     HmtApiConf,
     HmtConf,
@@ -16,6 +13,9 @@ from hanmoto.options import parse_options
 def load_conf_from_cli() -> HmtConf:
     args = parse_options()
     args_dict = vars(args)
+    config_path = args_dict.pop("config")
+    if config_path is not None:
+        return HmtConf.parse_file(config_path)
     printer_type_str = args_dict.pop("printer_type")
     if printer_type_str is None:
         raise HmtValueException(
@@ -44,6 +44,11 @@ def load_conf_from_cli() -> HmtConf:
 
 def run() -> int:
     conf = load_conf_from_cli()
+    # the web stack is imported only to serve, after the options are valid
+    import uvicorn
+
+    from hanmoto.api import load_app
+
     app = load_app(conf)
     api_conf = conf.api_conf
     uvicorn.run(
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+from logging import getLogger
+from typing import Any, Dict, Iterable, Optional
+
+from escpos.capabilities import BaseProfile
+from escpos.printer import Dummy, Escpos
+
+from .cache import HmtImageCache
+from .localizer import HmtLocalizer, HmtLocalizerEnum
+from .metrics import IMAGE_BYTES, STAGE_SECONDS
+from .printables import HmtImage, HmtRaw, HmtStoredImage, HmtText, Printable
+from .stored import HmtStoredGraphics
+from .tracing import tracer
+
+logger = getLogger(__name__)
+
+
+def get_paper_width(profile: Optional[BaseProfile]) -> Optional[int]:
+    """
+    Printable width in dots from the escpos printer profile, if known.
+    """
+    if profile is None:
+        return None
+    try:
+        return int(profile.profile_data["media"]["width"]["pixels"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class HmtCompiler(object):
+    """
+    Compiler that renders printables into a single ESC/POS program.
+    ...
+
+    Printables are rendered on an in-memory Dummy printer, so the program
+    can be sent to the printer with one write.
+    Every program starts from a fresh localizer and is self-contained.
+
+    Attributes
+    ----------
+    localizer : HmtLocalizerEnum
+        localizer used to render texts
+    profile : BaseProfile, optional
+        escpos printer profile of the target printer
+    image_cache : HmtImageCache, optional
+        cache of rendered images
+    paper_width : int, optional
+        printable width of the paper in dots
+    graphics : HmtStoredGraphics
+        images stored in the printer
+    name : str
+        name of the printer, used to label metrics
+
+    Parameters
+    ----------
+    localizer : HmtLocalizerEnum
+        localizer used to render texts
+    profile : BaseProfile, optional
+        escpos printer profile of the target printer
+    image_cache : HmtImageCache, optional
+        cache of rendered images. images are rendered every time if None.
+    paper_width : int, optional
+        printable width of the paper in dots, e.g. 384, 512 or 576.
+        wider images are scaled down to it.
+        taken from the profile if None.
+    graphics : HmtStoredGraphics, optional
+        images stored in the printer. no image is stored if None.
+    """
+
+    def __init__(
+        self,
+        localizer: HmtLocalizerEnum,
+        profile: Optional[BaseProfile] = None,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
+        graphics: Optional[HmtStoredGraphics] = None,
+    ) -> None:
+        self.localizer = localizer
+        self.profile = profile
+        self.image_cache = image_cache
+        self.paper_width = (
+            get_paper_width(profile) if paper_width is None else paper_width
+        )
+        self.graphics = (
+            HmtStoredGraphics(paper_width=self.paper_width)
+            if graphics is None
+            else graphics
+        )
+        self.name = "default"
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        State sent to render workers. The image cache stays in this
+        process, and the profile is sent as its data, since escpos
+        profile classes are created at runtime and cannot be pickled.
+        """
+        state = self.__dict__.copy()
+        state["image_cache"] = None
+        if self.profile is not None:
+            state["profile"] = self.profile.profile_data
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        profile_data = state["profile"]
+        if profile_data is not None:
+            profile_class = type(
+                "HmtWorkerProfile",
+                (BaseProfile,),
+                {"profile_data": profile_data},
+            )
+            state["profile"] = profile_class()
+        self.__dict__.update(state)
+
+    def compile(self, sequence: Iterable[Printable]) -> bytes:
+        target = self._target()
+        localizer = self.localizer.value(target)
+        self.render(target, localizer, sequence)
+        program: bytes = target.output
+        return program
+
+    def compile_part(self, sequence: Iterable[Printable]) -> bytes:
+        """
+        Compile printables into commands to splice into other programs
+
+        The commands leave out the setup every program starts with,
+        and are sent with HmtRaw.
+        """
+        target = self._target()
+        localizer = self.localizer.value(target)
+        start = len(target.output)
+        self.render(target, localizer, sequence)
+        part: bytes = target.output[start:]
+        return part
+
+    def render(
+        self,
+        target: Escpos,
+        localizer: HmtLocalizer,
+        sequence: Iterable[Printable],
+    ) -> None:
+        for elem in sequence:
+            with tracer.span("render", printable=elem.__class__.__name__):
+                if isinstance(elem, HmtText):
+                    localizer.text(elem)
+                elif isinstance(elem, HmtImage):
+                    localizer.finish()
+                    self.image(target, elem)
+                elif isinstance(elem, HmtStoredImage):
+                    localizer.finish()
+                    target._raw(self.graphics.print_command(elem))
+                elif isinstance(elem, HmtRaw):
+                    localizer.finish()
+                    target._raw(elem.data)
+                    # the printer state after the commands is unknown
+                    localizer.reset()
+                    target.magic.encoding = None
+        localizer.finish()
+
+    def image(self, target: Escpos, image: HmtImage) -> None:
+        if self.image_cache is None:
+            target._raw(self.render_image(image))
+            return
+
+        key = self.image_cache.key(image, self.paper_width)
+        program = self.image_cache.get(key)
+        if program is None:
+            program = self.render_image(image)
+            self.image_cache.put(key, program)
+        target._raw(program)
+
+    def render_image(self, image: HmtImage) -> bytes:
+        """
+        Rasterize image into ESC/POS commands for the paper width
+        """
+        # numpy is imported with the first image, not with the compiler
+        from .printables import HmtRaster
+
+        style = image.properties
+        with STAGE_SECONDS.time(printer=self.name, stage="rasterize"):
+            raster = HmtRaster.from_image(
+                image.image_src,
+                paper_width=self.paper_width,
+                center=style.center,
+                dither=style.dither,
+                threshold=style.threshold,
+            )
+            program = raster.to_escpos(
+                style.impl.value,
+                high_density_vertical=style.high_density_vertical,
+                high_density_horizontal=style.high_density_horizontal,
+                fragment_height=style.fragment_height,
+                optimize=style.optimize,
+            )
+        raw_size = raster.escpos_size(
+            style.impl.value,
+            high_density_vertical=style.high_density_vertical,
+            fragment_height=style.fragment_height,
+        )
+        IMAGE_BYTES.inc(raw_size, printer=self.name, encoding="raw")
+        IMAGE_BYTES.inc(len(program), printer=self.name, encoding="sent")
+        span = tracer.current()
+        if span is not None:
+            span.set(raw_bytes=raw_size, bytes=len(program))
+        if style.optimize:
+            logger.debug(
+                f"image {image.digest[:8]} is optimized "
+                f"from {raw_size} to {len(program)} bytes"
+            )
+        return program
+
+    def _target(self) -> Dummy:
+        target = Dummy()
+        if self.profile is not None:
+            target.profile = self.profile
+        return target
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 from enum import Enum
+from typing import Any, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+
+DEFAULT_IMAGE_CACHE_SIZE = 8 * 1024 * 1024
 
 
 class HmtPrinterType(Enum):
@@ -14,6 +17,12 @@ class HmtPrinterType(Enum):
         return [i.name for i in cls]
 
 
+class HmtGraphicsMemory(str, Enum):
+    download = "download"
+    nv = "nv"
+    nv_bit_image = "nv_bit_image"
+
+
 class HmtPrinterTypeConf(BaseModel):
     ...
 
@@ -21,7 +30,16 @@ class HmtPrinterTypeConf(BaseModel):
 class HmtNetworkConf(HmtPrinterTypeConf):
     host: str = ""
     port: int = 9100
-    timeout: int = 60
+    timeout: float = 60
+    connect_timeout: float = 5
+    keepalive: bool = True
+    max_retries: int = 3
+    retry_backoff: float = 0.5
+    max_backoff: float = 8
+    status_check: bool = False
+    status_timeout: float = 2
+    status_interval: float = 1
+    chunk_size: int = 4096
 
 
 class HmtDummyConf(HmtPrinterTypeConf):
@@ -29,9 +47,35 @@ class HmtDummyConf(HmtPrinterTypeConf):
 
 
 class HmtPrinterConf(BaseModel):
+    name: str = "default"
     printer_type: HmtPrinterType = HmtPrinterType.network
     conf: HmtPrinterTypeConf = HmtPrinterTypeConf()
     lang: str = "en"
+    image_cache_size: int = DEFAULT_IMAGE_CACHE_SIZE
+    paper_width: Optional[int] = None
+    graphics_memory: HmtGraphicsMemory = HmtGraphicsMemory.download
+    stored_images: Dict[str, str] = {}
+    # jobs queued or printing at which new jobs are refused
+    max_backlog: Optional[int] = None
+
+    @validator("conf", pre=True)
+    def parse_type_conf(cls, conf: Any, values: Dict[str, Any]) -> Any:
+        if not isinstance(conf, dict):
+            return conf
+        if values.get("printer_type") is HmtPrinterType.network:
+            return HmtNetworkConf(**conf)
+        return HmtDummyConf(**conf)
+
+
+class HmtPoolStrategy(str, Enum):
+    least_busy = "least_busy"
+    round_robin = "round_robin"
+
+
+class HmtPoolConf(BaseModel):
+    name: str
+    printers: List[str]
+    strategy: HmtPoolStrategy = HmtPoolStrategy.least_busy
 
 
 class HmtApiConf(BaseModel):
@@ -40,6 +84,53 @@ class HmtApiConf(BaseModel):
     reload: bool = False
 
 
+class HmtTraceSinkType(str, Enum):
+    ring_buffer = "ring_buffer"
+    jsonl = "jsonl"
+    opentelemetry = "opentelemetry"
+
+
+class HmtTraceConf(BaseModel):
+    enabled: bool = False
+    sinks: List[HmtTraceSinkType] = [HmtTraceSinkType.ring_buffer]
+    path: str = "hanmoto-traces.jsonl"
+    buffer_size: int = 1000
+
+
+class HmtRenderConf(BaseModel):
+    workers: int = 0
+    ahead: Optional[int] = None
+
+
+class HmtSpoolConf(BaseModel):
+    # jobs are kept only in memory when empty
+    path: str = ""
+    max_attempts: int = 5
+    retry_delay: float = 1.0
+
+
+class HmtSchedulerConf(BaseModel):
+    # jobs of higher priorities taken before a waiting lower one
+    fair_share: int = 8
+    # share of each printer by client id, 1 for clients not listed
+    client_weights: Dict[str, float] = {}
+
+
 class HmtConf(BaseModel):
     printer_conf: HmtPrinterConf = HmtPrinterConf()
+    printers: List[HmtPrinterConf] = []
+    pools: List[HmtPoolConf] = []
     api_conf: HmtApiConf = HmtApiConf()
+    trace_conf: HmtTraceConf = HmtTraceConf()
+    render_conf: HmtRenderConf = HmtRenderConf()
+    spool_conf: HmtSpoolConf = HmtSpoolConf()
+    scheduler_conf: HmtSchedulerConf = HmtSchedulerConf()
+    # contents of templates by name, in the json of /templates/{name}
+    templates: Dict[str, List[Dict[str, Any]]] = {}
+
+    def get_printer_confs(self) -> List[HmtPrinterConf]:
+        """
+        Printers to set up. The first one is the default printer.
+        printer_conf is used when no printers are listed.
+        """
+        return self.printers if self.printers else [self.printer_conf]
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import select
+import socket
+import struct
+import time
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+from escpos.printer import Escpos, Network
+
+from .exceptions import HmtPrinterStatusException
+from .status import (
+    ASB_ENABLE,
+    STATUS_REQUEST,
+    HmtPrinterStatus,
+    HmtStatusReader,
+)
+
+logger = getLogger(__name__)
+
+
+def set_keepalive(device: socket.socket) -> None:
+    """
+    Enable TCP keepalive so that a silently dropped connection is detected.
+    """
+    device.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (
+        ("TCP_KEEPIDLE", 30),
+        ("TCP_KEEPINTVL", 10),
+        ("TCP_KEEPCNT", 3),
+    ):
+        if hasattr(socket, option):
+            device.setsockopt(
+                socket.IPPROTO_TCP, getattr(socket, option), value
+            )
+
+
+class HmtNetwork(Network):
+    """
+    Network printer whose connection is managed by hanmoto.
+    ...
+
+    The connection is opened lazily on the first write, and checked before
+    every write. A dead connection, e.g. after the printer is power-cycled,
+    is reconnected with bounded exponential backoff. A write that fails
+    with a connection error is sent again once on a new connection,
+    while a write that times out is not.
+    With status_check, writes fail right away while the printer reports
+    that it cannot print, as HmtAsyncNetwork.
+
+    Attributes
+    ----------
+    reconnects : int
+        number of times the connection was opened again
+    connected_at : float, optional
+        time.monotonic() when the current connection was opened
+
+    Parameters
+    ----------
+    host : str
+        hostname, ip address of the printer
+    port : int, optional
+        port number of the printer
+    timeout : float, optional
+        timeout in seconds for writing to the printer
+    connect_timeout : float, optional
+        timeout in seconds for connecting to the printer
+    keepalive : bool, optional
+        enable TCP keepalive on the connection
+    max_retries : int, optional
+        number of connection attempts after the first one fails
+    retry_backoff : float, optional
+        seconds to wait before the first retry. doubled on every retry.
+    max_backoff : float, optional
+        upper bound of the seconds to wait between retries
+    status_check : bool, optional
+        read the status of the printer and fail writes it cannot print
+    status_timeout : float, optional
+        timeout in seconds for the printer to answer a status request
+    status_interval : float, optional
+        seconds a status is trusted before it is read again
+    chunk_size : int, optional
+        bytes sent at a time when the status is checked
+
+    See Also
+    --------
+    https://github.com/python-escpos/python-escpos/blob/master/src/escpos/printer.py#L209
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 9100,
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        keepalive: bool = True,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        max_backoff: float = 8,
+        status_check: bool = False,
+        status_timeout: float = 2,
+        status_interval: float = 1,
+        chunk_size: int = 4096,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        Escpos.__init__(self, *args, **kwargs)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.keepalive = keepalive
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.status_check = status_check
+        self.status_timeout = status_timeout
+        self.status_interval = status_interval
+        self.chunk_size = chunk_size
+        self.device: Optional[socket.socket] = None
+        self.reconnects = 0
+        self.connected_at: Optional[float] = None
+        self._opened = False
+        self._status = HmtStatusReader(f"{host}:{port}")
+        self._replies: List[int] = []
+
+    @property
+    def connection_age(self) -> Optional[float]:
+        if self.connected_at is None:
+            return None
+        return time.monotonic() - self.connected_at
+
+    @property
+    def printer_status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Latest status of the printer, None until it is read
+        """
+        return self._status.status
+
+    def stats(self) -> Dict[str, Any]:
+        status = self.printer_status
+        return {
+            "connected": self.device is not None,
+            "reconnects": self.reconnects,
+            "connection_age": self.connection_age,
+            "status": None if status is None else status.dict(),
+        }
+
+    def open(self) -> None:
+        """Open TCP connection to the printer"""
+        device = socket.create_connection(
+            (self.host, self.port), timeout=self.connect_timeout
+        )
+        device.settimeout(self.timeout)
+        if self.keepalive:
+            set_keepalive(device)
+        self.device = device
+        self.connected_at = time.monotonic()
+        if self._opened:
+            self.reconnects += 1
+        self._opened = True
+        if self.status_check:
+            device.sendall(ASB_ENABLE)
+
+    def close(self) -> None:
+        """Close TCP connection"""
+        device, self.device = self.device, None
+        self.connected_at = None
+        self._status.reset()
+        self._replies.clear()
+        if device is None:
+            return
+        try:
+            device.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        device.close()
+
+    def is_alive(self) -> bool:
+        """
+        Check the connection without blocking.
+        A connection closed by the printer is readable with no data.
+        """
+        if self.device is None:
+            return False
+        try:
+            readable, _, _ = select.select([self.device], [], [], 0)
+            if not readable:
+                return True
+            return bool(self.device.recv(1, socket.MSG_PEEK))
+        except (OSError, ValueError):
+            return False
+
+    def ensure_connected(self) -> None:
+        if self.is_alive():
+            return
+        if self.device is not None:
+            logger.info(f"connection to {self.host}:{self.port} is dead")
+        self.close()
+
+        backoff = self.retry_backoff
+        for retry in range(self.max_retries + 1):
+            try:
+                self.open()
+                return
+            except OSError as e:
+                if retry == self.max_retries:
+                    raise
+                logger.warning(
+                    f"failed to connect to {self.host}:{self.port}: {e}. "
+                    f"retry in {backoff} seconds"
+                )
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def connection(self) -> int:
+        """
+        Id of the live connection, connecting if needed.
+        The id changes every time the connection is opened again.
+        """
+        self.ensure_connected()
+        return self.reconnects
+
+    def status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Read the status of the printer with DLE EOT.
+        None without status_check.
+        """
+        if not self.status_check:
+            return None
+        self.ensure_connected()
+        assert self.device is not None
+        self._poll_status()
+        self._replies.clear()
+        self.device.sendall(STATUS_REQUEST)
+        deadline = time.monotonic() + self.status_timeout
+        while len(self._replies) < 4:
+            remaining = deadline - time.monotonic()
+            readable, _, _ = select.select(
+                [self.device], [], [], max(remaining, 0)
+            )
+            if not readable:
+                raise HmtPrinterStatusException(
+                    f"printer {self.host}:{self.port} "
+                    "does not answer status requests"
+                )
+            data = self.device.recv(256)
+            if not data:
+                raise ConnectionResetError("connection closed by printer")
+            self._replies += self._status.feed(data)
+        status = HmtPrinterStatus.from_replies(self._replies[:4])
+        self._replies.clear()
+        self._status.update(status)
+        return status
+
+    def _raw(self, msg: bytes) -> None:
+        self.ensure_connected()
+        assert self.device is not None
+        try:
+            if self.status_check:
+                self._check_status()
+            self._send(msg)
+        except socket.timeout:
+            raise
+        except HmtPrinterStatusException:
+            # data stuck in the buffers would be printed after the job
+            # failed, so the connection is dropped with it
+            self._abort()
+            raise
+        except OSError as e:
+            logger.warning(f"failed to write to {self.host}:{self.port}: {e}")
+            self.close()
+            self.ensure_connected()
+            self._send(msg)
+
+    def _send(self, msg: bytes) -> None:
+        assert self.device is not None
+        if not self.status_check:
+            self.device.sendall(msg)
+            return
+        view = memoryview(msg)
+        deadline = time.monotonic() + self.timeout
+        while view:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("timed out")
+            _, writable, _ = select.select(
+                [], [self.device], [], min(self.status_timeout, remaining)
+            )
+            # automatic status back tells why the printer stopped
+            self._poll_status()
+            status = self.printer_status
+            if status is not None:
+                status.check(f"{self.host}:{self.port}")
+            if writable:
+                sent = self.device.send(view[: self.chunk_size])
+                view = view[sent:]
+                deadline = time.monotonic() + self.timeout
+
+    def _check_status(self) -> None:
+        status = self.printer_status
+        if self._status.stale(self.status_interval):
+            status = self.status()
+        if status is not None:
+            status.check(f"{self.host}:{self.port}")
+
+    def _poll_status(self) -> None:
+        """
+        Read the status the printer sent without blocking
+        """
+        assert self.device is not None
+        while select.select([self.device], [], [], 0)[0]:
+            data = self.device.recv(256)
+            if not data:
+                return
+            self._replies += self._status.feed(data)
+
+    def _abort(self) -> None:
+        """
+        Close with RST, dropping the data not sent yet
+        """
+        if self.device is not None:
+            try:
+                self.device.setsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_LINGER,
+                    struct.pack("ii", 1, 0),
+                )
+            except OSError:
+                pass
+        self.close()
+
+    def _read(self) -> bytes:
+        self.ensure_connected()
+        assert self.device is not None
+        return self.device.recv(16)
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from logging import getLogger
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Optional, Set
+
+from pydantic import BaseModel, PrivateAttr
+
+if TYPE_CHECKING:
+    from .jobs import HmtJob
+
+logger = getLogger(__name__)
+
+
+class HmtJobEventType(str, Enum):
+    queued = "queued"
+    rendering = "rendering"
+    sending = "sending"
+    done = "done"
+    failed = "failed"
+
+    @property
+    def finished(self) -> bool:
+        return self in (HmtJobEventType.done, HmtJobEventType.failed)
+
+
+class HmtJobEvent(BaseModel):
+    """
+    Transition of a job.
+    ...
+
+    Attributes
+    ----------
+    id : int
+        sequence number of the event, increasing by one
+    type : HmtJobEventType
+        state the job has entered
+    job_id : str
+        id of the job
+    printer : str
+        name of the printer of the job
+    batch_id : str, optional
+        id of the batch of the job
+    client : str
+        id of the client that submitted the job
+    at : datetime
+        when the job entered the state
+    elapsed : float
+        seconds since the job was submitted
+    error : str, optional
+        why the job failed
+    """
+
+    id: int
+    type: HmtJobEventType
+    job_id: str
+    printer: str
+    batch_id: Optional[str] = None
+    client: str = ""
+    at: datetime
+    elapsed: float
+    error: Optional[str] = None
+    _data: Optional[str] = PrivateAttr(None)
+
+    def data(self) -> str:
+        """
+        The event as json, encoded once for all subscribers
+        """
+        if self._data is None:
+            self._data = self.json()
+        return self._data
+
+
+class HmtJobSubscription(object):
+    """
+    Events of the jobs a client watches.
+    ...
+
+    Events are delivered in order through a buffer of max_pending events.
+    A subscriber that falls behind is not given events while its buffer
+    is full, and catches up from the history of the broker instead, so
+    publishing never waits for subscribers. Events that have already
+    left the history are skipped.
+
+    Attributes
+    ----------
+    printer : str, optional
+        printer of the jobs. any printer if None.
+    client : str, optional
+        client of the jobs. any client if None.
+    job_ids : Set[str], optional
+        ids of the jobs. any job if None.
+    unfinished : Set[str], optional
+        jobs not finished yet. the subscription ends once it is empty.
+    last_id : int
+        id of the last event delivered
+    """
+
+    def __init__(
+        self,
+        broker: HmtJobEvents,
+        printer: Optional[str] = None,
+        client: Optional[str] = None,
+        job_ids: Optional[Iterable[str]] = None,
+        max_pending: int = 256,
+    ) -> None:
+        self.broker = broker
+        self.printer = printer
+        self.client = client
+        self.job_ids = None if job_ids is None else set(job_ids)
+        self.unfinished: Optional[Set[str]] = None
+        self.last_id = 0
+        self.max_pending = max_pending
+        self.closed = False
+        self._pending: Deque[HmtJobEvent] = deque()
+        self._lagging = False
+        self._ready = asyncio.Event()
+
+    def matches(self, event: HmtJobEvent) -> bool:
+        return (
+            (self.printer is None or event.printer == self.printer)
+            and (self.client is None or event.client == self.client)
+            and (self.job_ids is None or event.job_id in self.job_ids)
+        )
+
+    def push(self, event: HmtJobEvent) -> None:
+        if self._lagging:
+            return
+        if len(self._pending) >= self.max_pending:
+            self._lagging = True
+        else:
+            self._pending.append(event)
+        self._ready.set()
+
+    def catch_up(self, last_id: int) -> None:
+        """
+        Deliver the events after last_id still kept in the history
+        """
+        self.last_id = last_id
+        self._pending.clear()
+        self._lagging = True
+        self._ready.set()
+
+    def watch(self, job_ids: Iterable[str]) -> None:
+        """
+        Watch more jobs, with their events so far
+        """
+        if self.job_ids is None:
+            return
+        self.job_ids.update(job_ids)
+        self.catch_up(self.last_id)
+
+    async def get(
+        self, timeout: Optional[float] = None
+    ) -> Optional[HmtJobEvent]:
+        """
+        Next event, or None once the subscription has ended
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            no event is published within timeout seconds
+        """
+        while True:
+            if self._pending:
+                event = self._pending.popleft()
+                self.last_id = event.id
+                if self.unfinished is not None and event.type.finished:
+                    self.unfinished.discard(event.job_id)
+                return event
+            if self._lagging:
+                self._refill()
+                continue
+            if self.closed or self.unfinished == set():
+                return None
+            self._ready.clear()
+            # the event is waited for, not the get, so that no event is
+            # lost when the wait times out
+            await asyncio.wait_for(self._ready.wait(), timeout)
+
+    def _refill(self) -> None:
+        history = self.broker.history
+        if self.last_id and history and history[0].id > self.last_id + 1:
+            logger.debug(
+                f"{history[0].id - self.last_id - 1} job events are "
+                "skipped by a subscriber that fell behind"
+            )
+        for event in history:
+            if event.id <= self.last_id or not self.matches(event):
+                continue
+            if len(self._pending) >= self.max_pending:
+                return
+            self._pending.append(event)
+        self._lagging = False
+
+    def close(self) -> None:
+        self.closed = True
+        self.broker.unsubscribe(self)
+        self._ready.set()
+
+
+class HmtJobEvents(object):
+    """
+    Broker of job events to the clients watching them.
+    ...
+
+    Job queues publish each transition of their jobs, and the event is
+    passed to the matching subscriptions without waiting for them.
+    Subscriptions are indexed by the client they watch, so an event
+    is matched only against the subscriptions of its client and the
+    ones watching any client. The latest events are kept in the history,
+    from which reconnecting clients resume.
+
+    Attributes
+    ----------
+    history : Deque[HmtJobEvent]
+        latest events, oldest first
+    max_pending : int
+        events buffered for each subscriber
+    """
+
+    def __init__(self, history: int = 1000, max_pending: int = 256) -> None:
+        self.history: Deque[HmtJobEvent] = deque(maxlen=history)
+        self.max_pending = max_pending
+        self._subscriptions: Dict[Optional[str], Set[HmtJobSubscription]] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def subscribers(self) -> int:
+        return sum(map(len, self._subscriptions.values()))
+
+    def publish(
+        self,
+        job: HmtJob,
+        event_type: HmtJobEventType,
+        at: Optional[datetime] = None,
+    ) -> HmtJobEvent:
+        at = datetime.now() if at is None else at
+        event = HmtJobEvent(
+            id=next(self._ids),
+            type=event_type,
+            job_id=job.id,
+            printer=job.printer,
+            batch_id=job.batch_id,
+            client=job.client,
+            at=at,
+            elapsed=(at - job.created_at).total_seconds(),
+            error=job.error,
+        )
+        self.history.append(event)
+        for key in (None, event.client):
+            for subscription in self._subscriptions.get(key, ()):
+                if subscription.matches(event):
+                    subscription.push(event)
+        return event
+
+    def subscribe(
+        self,
+        printer: Optional[str] = None,
+        client: Optional[str] = None,
+        job_ids: Optional[Iterable[str]] = None,
+        last_id: Optional[int] = None,
+    ) -> HmtJobSubscription:
+        """
+        Watch the events of jobs from now on
+
+        Parameters
+        ----------
+        printer : str, optional
+            printer of the jobs. any printer if None.
+        client : str, optional
+            client of the jobs. any client if None.
+        job_ids : Iterable[str], optional
+            ids of the jobs. any job if None.
+            events of the jobs kept in the history are delivered first.
+        last_id : int, optional
+            id of the last event the client has received.
+            the events after it kept in the history are delivered first.
+
+        Returns
+        -------
+        subscription : HmtJobSubscription
+            subscription to close when the client leaves
+        """
+        subscription = HmtJobSubscription(
+            self, printer, client, job_ids, self.max_pending
+        )
+        self._subscriptions.setdefault(client, set()).add(subscription)
+        if last_id is not None:
+            subscription.catch_up(last_id)
+        elif job_ids is not None:
+            subscription.catch_up(0)
+        elif self.history:
+            subscription.last_id = self.history[-1].id
+        return subscription
+
+    def unsubscribe(self, subscription: HmtJobSubscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.client)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.client]
+
+
+events = HmtJobEvents()
@@ -30,3 +30,15 @@ class HmtWebAPISequenceException(HmtWebAPIException):
     """
     Hanmoto API Sequence Print Exception.
     """
+
+
+class HmtJobException(HmtException):
+    """
+    Hanmoto Print Job Exception.
+    """
+
+
+class HmtPrinterStatusException(HmtException):
+    """
+    Hanmoto Printer Not Ready Exception.
+    """
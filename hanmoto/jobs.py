@@ -0,0 +1,693 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from datetime import datetime
+from enum import Enum
+from logging import getLogger
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from pydantic import BaseModel, Field
+
+from .aio import AsyncHanmoto
+from .events import HmtJobEventType, events
+from .exceptions import HmtJobException, HmtPrinterStatusException
+from .metrics import JOBS, STAGE_SECONDS, count_error
+from .printables import Printable
+from .printer import Hanmoto
+from .render import HmtRenderPool
+from .scheduler import HmtJobScheduler, HmtPriority
+from .tracing import tracer
+
+if TYPE_CHECKING:
+    from .spool import HmtSpool
+
+logger = getLogger(__name__)
+
+
+class HmtJobStatus(str, Enum):
+    queued = "queued"
+    printing = "printing"
+    done = "done"
+    failed = "failed"
+
+    @property
+    def finished(self) -> bool:
+        return self in (HmtJobStatus.done, HmtJobStatus.failed)
+
+
+class HmtJob(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    printer: str = ""
+    status: HmtJobStatus = HmtJobStatus.queued
+    created_at: datetime = Field(default_factory=datetime.now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    trace_id: Optional[str] = None
+    parent_span_id: Optional[str] = None
+    batch_id: Optional[str] = None
+    cut: bool = True
+    priority: HmtPriority = HmtPriority.normal
+    client: str = ""
+    printables: List[Printable] = []
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def info(self) -> Dict:
+        return self.dict(exclude={"printables"})
+
+
+class HmtJobQueue(object):
+    """
+    Job queue that prints jobs one by one on a dedicated worker.
+    ...
+
+    Jobs are submitted from the event loop and returned immediately.
+    The worker takes them by priority, and in turns between clients
+    (see HmtJobScheduler). AsyncHanmoto is awaited on the
+    event loop, while the blocking I/O of Hanmoto runs on a single thread
+    owned by this queue, so the event loop is never blocked by the printer.
+    With a render pool, the jobs waiting in the queue are compiled in
+    worker processes while the current job is sent to the printer.
+    Jobs submitted as a batch are taken together and printed in one
+    printer session, each with its own status.
+    With a spool, jobs are compiled and stored in the spool before they
+    are queued, sent again on connection errors, and restored
+    from the spool when the queue starts.
+    A queue whose load reaches max_backlog is backlogged, and callers
+    are expected to hold new jobs back for retry_after seconds.
+
+    Attributes
+    ----------
+    printer : Hanmoto or AsyncHanmoto
+        printer that the jobs are printed with
+    name : str
+        name of the printer
+    jobs : OrderedDict[str, HmtJob]
+        submitted jobs by id, oldest first
+    current : HmtJob, optional
+        job that is printing now
+
+    Parameters
+    ----------
+    printer : Hanmoto or AsyncHanmoto
+        printer that the jobs are printed with
+    name : str, optional
+        name of the printer
+    max_history : int, optional
+        number of jobs kept for status lookup.
+        the oldest finished jobs are forgotten first.
+    retry_interval : float, optional
+        seconds the printer is regarded as offline after a connection error
+        or a status that it cannot print
+    render_pool : HmtRenderPool, optional
+        pool that compiles jobs ahead. jobs are compiled when printed if None.
+    render_ahead : int, optional
+        number of waiting jobs compiled ahead. the workers of the pool if None.
+    spool : HmtSpool, optional
+        durable spool of the compiled jobs. jobs are kept in memory if None.
+    max_backlog : int, optional
+        load at which the queue is backlogged. never backlogged if None.
+    fair_share : int, optional
+        jobs of higher priorities taken before a waiting lower one
+    client_weights : Mapping[str, float], optional
+        share of the printer by client id. 1 for clients not listed.
+    """
+
+    def __init__(
+        self,
+        printer: Union[Hanmoto, AsyncHanmoto],
+        name: str = "default",
+        max_history: int = 1000,
+        retry_interval: float = 30.0,
+        render_pool: Optional[HmtRenderPool] = None,
+        render_ahead: Optional[int] = None,
+        spool: Optional[HmtSpool] = None,
+        max_backlog: Optional[int] = None,
+        fair_share: int = 8,
+        client_weights: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        self.printer = printer
+        self.name = name
+        self.max_history = max_history
+        self.retry_interval = retry_interval
+        self.render_pool = render_pool
+        self.render_ahead = (
+            render_ahead
+            if render_ahead is not None or render_pool is None
+            else render_pool.workers
+        )
+        self.spool = spool
+        self.max_backlog = max_backlog
+        self.fair_share = fair_share
+        self.client_weights = dict(client_weights or {})
+        self.jobs: OrderedDict[str, HmtJob] = OrderedDict()
+        self.current: Optional[HmtJob] = None
+        self._offline_until = 0.0
+        # moving average of the seconds spent printing a job
+        self._job_seconds: Optional[float] = None
+        self._queue: Optional[HmtJobScheduler] = None
+        self._worker: Optional[asyncio.Task[None]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._renders: Dict[str, asyncio.Future[Tuple[bytes, float]]] = {}
+        self._spooled: Dict[str, asyncio.Future[bytes]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def pending(self) -> int:
+        return 0 if self._queue is None else self._queue.qsize()
+
+    @property
+    def load(self) -> int:
+        return self.pending + (0 if self.current is None else 1)
+
+    @property
+    def online(self) -> bool:
+        """
+        False for retry_interval seconds after a connection error,
+        and while the printer reports that it cannot print.
+        """
+        if time.monotonic() < self._offline_until:
+            return False
+        status = self.printer.printer_status
+        return status is None or status.ready
+
+    @property
+    def backlogged(self) -> bool:
+        return self.max_backlog is not None and self.load >= self.max_backlog
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the queue is expected to take new jobs again
+        """
+        offline = self._offline_until - time.monotonic()
+        if offline > 0:
+            return offline
+        excess = self.load - (self.max_backlog or 0) + 1
+        return max(excess, 1) * (self._job_seconds or 1.0)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = HmtJobScheduler(self.fair_share, self.client_weights)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="hanmoto-job"
+        )
+        if self.spool is not None:
+            loop = asyncio.get_running_loop()
+            pending = await loop.run_in_executor(
+                None, self.spool.pending, self.name
+            )
+            for job, program in pending:
+                self._restore(job, program)
+            if pending:
+                logger.info(
+                    f"{len(pending)} jobs of {self.name} are restored "
+                    "from the spool"
+                )
+        self._worker = asyncio.create_task(self._work())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+        self._spooled.clear()
+        for render in self._renders.values():
+            render.cancel()
+        self._renders.clear()
+        if isinstance(self.printer, AsyncHanmoto):
+            await self.printer.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._queue = None
+
+    async def join(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def submit(
+        self,
+        printables: List[Printable],
+        priority: HmtPriority = HmtPriority.normal,
+        client: str = "",
+    ) -> HmtJob:
+        jobs = await self.submit_batch([(printables, True)], priority, client)
+        return jobs[0]
+
+    async def submit_batch(
+        self,
+        sequences: List[Tuple[List[Printable], bool]],
+        priority: HmtPriority = HmtPriority.normal,
+        client: str = "",
+    ) -> List[HmtJob]:
+        """
+        Submit sequences printed one after another in one printer session
+
+        With a spool, the jobs are compiled and stored in the spool before
+        they are queued and returned, so returned jobs survive a crash.
+
+        Parameters
+        ----------
+        sequences : List[Tuple[List[Printable], bool]]
+            printables of each job, and whether the paper is cut after it.
+            the session always ends with a cut.
+        priority : HmtPriority, optional
+            priority of the jobs
+        client : str, optional
+            id of the client, whose jobs take turns with other clients
+
+        Returns
+        -------
+        jobs : List[HmtJob]
+            jobs of the sequences, sharing a batch id if more than one
+        """
+        if self._queue is None or not self.running:
+            raise HmtJobException("job queue is not running")
+        batch_id = uuid.uuid4().hex if len(sequences) > 1 else None
+        span = tracer.current()
+        jobs = []
+        for printables, cut in sequences:
+            job = HmtJob(
+                printer=self.name,
+                printables=printables,
+                batch_id=batch_id,
+                cut=cut,
+                priority=priority,
+                client=client,
+            )
+            if span is not None:
+                job.trace_id, job.parent_span_id = span.trace_id, span.span_id
+            jobs.append(job)
+        if self.spool is not None:
+            await self._spool_all(jobs, self.spool)
+            if self._queue is None:
+                # stopped while spooling, printed after a restart
+                raise HmtJobException("job queue is not running")
+        for job in jobs:
+            self._remember(job)
+            # jobs of a batch are put without awaiting, so they are
+            # next to each other in the queue
+            self._queue.put_nowait(job)
+            events.publish(job, HmtJobEventType.queued, job.created_at)
+        self._render_ahead()
+        return jobs
+
+    async def _spool_all(self, jobs: List[HmtJob], spool: HmtSpool) -> None:
+        """
+        Compile jobs and store them in the spool, keeping their programs
+        for the worker. A job that cannot be compiled fails when printed.
+        """
+        results = await asyncio.gather(
+            *(self._spool(job, spool) for job in jobs), return_exceptions=True
+        )
+        loop = asyncio.get_running_loop()
+        for job, result in zip(jobs, results):
+            spooled = loop.create_future()
+            if isinstance(result, BaseException):
+                spooled.set_exception(result)
+            else:
+                spooled.set_result(result)
+            self._spooled[job.id] = spooled
+
+    def _restore(self, job: HmtJob, program: bytes) -> None:
+        assert self._queue is not None
+        spooled = asyncio.get_running_loop().create_future()
+        spooled.set_result(program)
+        self._spooled[job.id] = spooled
+        self._remember(job)
+        self._queue.put_nowait(job)
+        events.publish(job, HmtJobEventType.queued)
+
+    async def _spool(self, job: HmtJob, spool: HmtSpool) -> bytes:
+        """
+        Compile a job and store it in the spool
+        """
+        loop = asyncio.get_running_loop()
+        if self.render_pool is not None:
+            program, seconds = await self.render_pool.submit(
+                self.printer.compiler, job.printables
+            )
+            STAGE_SECONDS.observe(seconds, printer=self.name, stage="compile")
+        else:
+            context = contextvars.copy_context()
+            program = await loop.run_in_executor(
+                None, context.run, self.printer.compile, job.printables
+            )
+        await loop.run_in_executor(None, spool.put, job, program)
+        return program
+
+    def get(self, job_id: str) -> Optional[HmtJob]:
+        return self.jobs.get(job_id)
+
+    def _remember(self, job: HmtJob) -> None:
+        self.jobs[job.id] = job
+        overflow = len(self.jobs) - self.max_history
+        if overflow <= 0:
+            return
+        finished = [
+            job_id
+            for job_id, old_job in self.jobs.items()
+            if old_job.status.finished
+        ]
+        for job_id in finished[:overflow]:
+            del self.jobs[job_id]
+
+    async def _work(self) -> None:
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            batch = [job]
+            # higher priority jobs wait for the rest of the batch
+            while self._queue.remaining():
+                batch.append(self._queue.get_nowait())
+            self._render_ahead()
+            try:
+                if len(batch) == 1:
+                    await self._run(job, lambda: self._print_job(job))
+                else:
+                    await self._print_batch(batch)
+                # before the jobs are done, so that join waits for it
+                if self.spool is not None and self._queue.empty():
+                    await self._compact(self.spool)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _run(
+        self, job: HmtJob, print_job: Callable[[], Awaitable[None]]
+    ) -> None:
+        self.current = job
+        job.status = HmtJobStatus.printing
+        job.started_at = datetime.now()
+        STAGE_SECONDS.observe(
+            (job.started_at - job.created_at).total_seconds(),
+            printer=self.name,
+            stage="queue",
+        )
+        span = tracer.span(
+            "job",
+            trace_id=job.trace_id,
+            parent_id=job.parent_span_id,
+            job_id=job.id,
+            printer=self.name,
+        )
+        try:
+            with span:
+                await print_job()
+        except Exception as e:
+            logger.exception(f"print job {job.id} failed")
+            job.status = HmtJobStatus.failed
+            job.error = f"{e.__class__.__name__}: {e}"
+            self._failed(e)
+        else:
+            job.status = HmtJobStatus.done
+            self._offline_until = 0.0
+        finally:
+            self.current = None
+            job.finished_at = datetime.now()
+            job.printables = []
+            seconds = (job.finished_at - job.started_at).total_seconds()
+            STAGE_SECONDS.observe(seconds, printer=self.name, stage="job")
+            self._job_seconds = (
+                seconds
+                if self._job_seconds is None
+                else 0.8 * self._job_seconds + 0.2 * seconds
+            )
+            JOBS.inc(printer=self.name, status=job.status.value)
+            if job.status.finished:
+                events.publish(
+                    job, HmtJobEventType(job.status.value), job.finished_at
+                )
+            if self.spool is not None:
+                await self._finish_spooled(job, self.spool)
+
+    async def _finish_spooled(self, job: HmtJob, spool: HmtSpool) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, spool.finish, job)
+        except Exception:
+            logger.exception(f"job {job.id} cannot be finished in the spool")
+
+    async def _compact(self, spool: HmtSpool) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            deleted = await loop.run_in_executor(None, spool.compact)
+        except Exception:
+            logger.exception("spool cannot be compacted")
+        else:
+            if deleted:
+                logger.debug(f"{deleted} finished jobs are compacted")
+
+    def _failed(self, e: Exception) -> None:
+        count_error(self.name, e)
+        if isinstance(e, (OSError, HmtPrinterStatusException)):
+            self._offline_until = time.monotonic() + self.retry_interval
+
+    def _render_ahead(self) -> None:
+        """
+        Start compiling the jobs likely to be taken next in the pool.
+        """
+        if (
+            self.render_pool is None
+            or self.spool is not None
+            or self._queue is None
+        ):
+            return
+        for job in self._queue.upcoming(max(1, self.render_ahead or 0)):
+            if job.id not in self._renders:
+                self._renders[job.id] = self.render_pool.submit(
+                    self.printer.compiler, job.printables
+                )
+
+    async def _rendered(self, job: HmtJob) -> Optional[bytes]:
+        spooled = self._spooled.pop(job.id, None)
+        if spooled is not None:
+            return await spooled
+        render = self._renders.pop(job.id, None)
+        if render is None:
+            return None
+        program, seconds = await render
+        STAGE_SECONDS.observe(seconds, printer=self.name, stage="compile")
+        return program
+
+    async def _print_job(self, job: HmtJob) -> None:
+        events.publish(job, HmtJobEventType.rendering, job.started_at)
+        program = await self._rendered(job)
+        events.publish(job, HmtJobEventType.sending)
+        await self._retry([job], lambda: self._send_job(job, program))
+
+    async def _retry(
+        self, jobs: List[HmtJob], send: Callable[[], Awaitable[None]]
+    ) -> None:
+        """
+        Send jobs, again after connection errors while the spool allows.
+        Every failed attempt is counted in the spool.
+        """
+        attempts = 0
+        while True:
+            try:
+                await send()
+                return
+            except OSError as e:
+                attempts += 1
+                if self.spool is None or attempts >= self.spool.max_attempts:
+                    raise
+                error = f"{e.__class__.__name__}: {e}"
+                label = (
+                    f"job {jobs[0].id}"
+                    if len(jobs) == 1
+                    else f"batch {jobs[0].batch_id}"
+                )
+                logger.warning(
+                    f"sending {label} failed ({error}). "
+                    f"retrying ({attempts}/{self.spool.max_attempts})"
+                )
+                count_error(self.name, e)
+                loop = asyncio.get_running_loop()
+                for job in jobs:
+                    await loop.run_in_executor(
+                        None, self.spool.attempted, job.id, error
+                    )
+                await asyncio.sleep(self.spool.retry_delay * attempts)
+
+    async def _send_job(self, job: HmtJob, program: Optional[bytes]) -> None:
+        if isinstance(self.printer, AsyncHanmoto):
+            async with self.printer:
+                if program is None:
+                    await self.printer.print_sequence(job.printables)
+                else:
+                    await self.printer.print_sequence(job.printables, program)
+        else:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            await loop.run_in_executor(
+                self._executor,
+                context.run,
+                self._print,
+                job.printables,
+                program,
+            )
+
+    def _print(
+        self, printables: List[Printable], program: Optional[bytes]
+    ) -> None:
+        assert isinstance(self.printer, Hanmoto)
+        with self.printer.session() as session:
+            session.print_sequence(printables, program)
+
+    async def _print_batch(self, jobs: List[HmtJob]) -> None:
+        """
+        Print the jobs of a batch in one printer session.
+        All jobs are compiled before the first one is sent.
+        """
+        for job in jobs:
+            events.publish(job, HmtJobEventType.rendering)
+        programs = await self._compile_batch(jobs)
+        if isinstance(self.printer, Hanmoto):
+            await self._commit_batch(jobs, programs)
+            return
+        try:
+            async with self.printer:
+                await self._send_batch(jobs, programs)
+        except Exception as e:
+            # jobs are finished before the last cut
+            logger.exception(f"cut of batch {jobs[0].batch_id} failed")
+            self._failed(e)
+
+    async def _compile_batch(
+        self, jobs: List[HmtJob]
+    ) -> List[Union[bytes, Exception]]:
+        if self.render_pool is not None and self.spool is None:
+            for job in jobs:
+                if job.id not in self._renders:
+                    self._renders[job.id] = self.render_pool.submit(
+                        self.printer.compiler, job.printables
+                    )
+        if self.render_pool is not None or self.spool is not None:
+            # spooled jobs are compiled when they are submitted
+            programs: List[Union[bytes, Exception]] = []
+            for job in jobs:
+                try:
+                    program = await self._rendered(job)
+                    assert program is not None
+                    programs.append(program)
+                except Exception as e:
+                    programs.append(e)
+            return programs
+
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, context.run, self._compile_all, jobs
+        )
+
+    def _compile_all(
+        self, jobs: List[HmtJob]
+    ) -> List[Union[bytes, Exception]]:
+        programs: List[Union[bytes, Exception]] = []
+        for job in jobs:
+            try:
+                programs.append(self.printer.compile(job.printables))
+            except Exception as e:
+                programs.append(e)
+        return programs
+
+    async def _send_batch(
+        self, jobs: List[HmtJob], programs: List[Union[bytes, Exception]]
+    ) -> None:
+        assert isinstance(self.printer, AsyncHanmoto)
+        printer = self.printer
+        last = jobs[-1]
+
+        async def write(job: HmtJob, program: bytes, cut: bool) -> None:
+            await printer.print_sequence(job.printables, program)
+            if cut:
+                await printer.cut()
+
+        async def send(job: HmtJob, program: Union[bytes, Exception]) -> None:
+            if isinstance(program, Exception):
+                raise program
+            events.publish(job, HmtJobEventType.sending)
+            # the session ends with a cut after the last job
+            cut = job.cut and job is not last
+            data = program
+            await self._retry([job], lambda: write(job, data, cut))
+
+        for job, program in zip(jobs, programs):
+            await self._run(job, lambda: send(job, program))
+
+    async def _commit_batch(
+        self, jobs: List[HmtJob], programs: List[Union[bytes, Exception]]
+    ) -> None:
+        """
+        Send the compiled jobs of a batch and the cuts between them
+        in one session of a sync printer, so that the batch is written
+        at once and no other caller prints in between.
+        """
+        compiled = [
+            (job, program)
+            for job, program in zip(jobs, programs)
+            if not isinstance(program, Exception)
+        ]
+        sent: Optional[asyncio.Future[None]] = None
+
+        async def send(job: HmtJob, program: Union[bytes, Exception]) -> None:
+            nonlocal sent
+            if isinstance(program, Exception):
+                raise program
+            if sent is None:
+                # the first job sends the batch, which the others wait for
+                for compiled_job, _ in compiled:
+                    events.publish(compiled_job, HmtJobEventType.sending)
+                sent = asyncio.ensure_future(
+                    self._retry(
+                        [compiled_job for compiled_job, _ in compiled],
+                        lambda: self._send_session(compiled),
+                    )
+                )
+            await sent
+
+        for job, program in zip(jobs, programs):
+            await self._run(job, lambda: send(job, program))
+
+    async def _send_session(
+        self, compiled: List[Tuple[HmtJob, bytes]]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        await loop.run_in_executor(
+            self._executor, context.run, self._commit, compiled
+        )
+
+    def _commit(self, compiled: List[Tuple[HmtJob, bytes]]) -> None:
+        assert isinstance(self.printer, Hanmoto)
+        last, _ = compiled[-1]
+        with self.printer.session() as session:
+            for job, program in compiled:
+                session.print_sequence(job.printables, program)
+                # the session ends with a cut after the last job
+                if job.cut and job is not last:
+                    session.cut()
@@ -2,14 +2,32 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from enum import Enum, unique
+from typing import Dict, Optional
 
+from escpos.constants import SET_FONT, TXT_NORMAL, TXT_SIZE, TXT_STYLE
 from escpos.printer import Escpos
 
 from .exceptions import HmtValueException
-from .printables import HmtText
+from .printables import HmtText, HmtTextStyle
+
+# styles that ESC ! sets along with the character size
+RESET_BY_SIZE = ("bold", "underline", "font")
 
 
 class HmtLocalizer(ABC):
+    """
+    Base class of localizers that render texts on the printer.
+    ...
+
+    Localizers keep track of the text style the printer is in,
+    and send only the style commands that differ from it.
+    The style is unknown until the first text is rendered,
+    so the first text sets every style.
+    """
+
+    printer: Escpos
+    style_commands: Optional[Dict[str, bytes]] = None
+
     @abstractmethod
     def __init__(self, printer: Escpos) -> None:
         ...
@@ -18,14 +36,83 @@ class HmtLocalizer(ABC):
     def text(self, text: HmtText) -> None:
         ...
 
+    def reset(self) -> None:
+        """
+        Forget the printer state, e.g. after the printer is initialized.
+        """
+        self.style_commands = None
+
+    def finish(self) -> None:
+        """
+        Leave the text mode before other commands or the end of a program.
+        """
+
+    def set_style(self, style: HmtTextStyle) -> None:
+        style_commands = self.get_style_commands(style)
+        previous = self.style_commands
+        if previous is None:
+            commands = b"".join(style_commands.values())
+        else:
+            size = style_commands["size"]
+            # ESC ! also turns bold, underline and font off,
+            # so they are sent again after it
+            reset = size != previous["size"] and size.startswith(TXT_NORMAL)
+            commands = b"".join(
+                command
+                for name, command in style_commands.items()
+                if command != previous[name]
+                or (reset and name in RESET_BY_SIZE)
+            )
+        if commands:
+            self.printer._raw(commands)
+        self.style_commands = style_commands
+
+    def get_style_commands(self, style: HmtTextStyle) -> Dict[str, bytes]:
+        """
+        Commands for each text style in the same order as Escpos.set.
+        """
+        if style.custom_size:
+            size = TXT_SIZE + bytes(
+                [
+                    TXT_STYLE["width"][style.width]
+                    + TXT_STYLE["height"][style.height]
+                ]
+            )
+        elif style.double_width and style.double_height:
+            size = TXT_NORMAL + TXT_STYLE["size"]["2x"]
+        elif style.double_width:
+            size = TXT_NORMAL + TXT_STYLE["size"]["2w"]
+        elif style.double_height:
+            size = TXT_NORMAL + TXT_STYLE["size"]["2h"]
+        else:
+            size = TXT_NORMAL + TXT_STYLE["size"]["normal"]
+
+        font = self.printer.profile.get_font(style.font)
+        return {
+            "size": size,
+            "flip": TXT_STYLE["flip"][style.flip],
+            "smooth": TXT_STYLE["smooth"][style.smooth],
+            "bold": TXT_STYLE["bold"][style.bold],
+            "underline": TXT_STYLE["underline"][style.underline],
+            "font": SET_FONT(bytes([font])),
+            "align": TXT_STYLE["align"][style.align],
+            "density": (
+                TXT_STYLE["density"][style.density]
+                if style.density != 9
+                else b""
+            ),
+            "invert": TXT_STYLE["invert"][style.invert],
+        }
+
 
 class HmtLocalizerEn(HmtLocalizer):
     def __init__(self, printer: Escpos) -> None:
         self.printer = printer
+        self.reset()
 
     def text(self, text: HmtText) -> None:
         style_params = text.properties
-        self.printer.set(**style_params.dict())
+        self.set_style(style_params)
         text_str = text.text
 
         self.printer.text(text_str)
@@ -36,25 +123,39 @@ class HmtLocalizerJp(HmtLocalizer):
         self.printer = printer
         self.printer.charcode("CP932")
         self.printer._raw(b"\x1c\x43\x02")
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.kanji_mode = False
+        self.kanji_size = 0x00
 
     def text(self, text: HmtText) -> None:
         style_params = text.properties
-        self.printer.set(**style_params.dict())
+        self.set_style(style_params)
         text_str = text.text
 
-        self.printer._raw(b"\x1c\x26")
+        if not self.kanji_mode:
+            self.printer._raw(b"\x1c\x26")
+            self.kanji_mode = True
         n = 0x00
         if style_params.double_width:
             n += 0x04
         if style_params.double_height:
             n += 0x08
-        if n != 0x00:
+        if n != self.kanji_size:
             self.printer._raw(b"\x1c\x21" + n.to_bytes(1, byteorder="big"))
+            self.kanji_size = n
 
         self.printer._raw(text_str.encode("sjis_2004", "ignore"))
-        if n != 0x00:
+
+    def finish(self) -> None:
+        if self.kanji_size != 0x00:
             self.printer._raw(b"\x1c\x21\x00")
-        self.printer._raw(b"\x1c\x2e")
+            self.kanji_size = 0x00
+        if self.kanji_mode:
+            self.printer._raw(b"\x1c\x2e")
+            self.kanji_mode = False
 
 
 @unique
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from threading import Lock
+from types import TracebackType
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+LabelValues = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class HmtMetric(ABC):
+    """
+    Base class of metrics exposed in the Prometheus text format.
+    ...
+
+    Values are kept per combination of label values.
+    Updates take a lock and touch a dict entry only,
+    and the text is built when the metrics are scraped.
+
+    Attributes
+    ----------
+    name : str
+        name of the metric
+    documentation : str
+        help text of the metric
+    labelnames : Tuple[str, ...]
+        names of the labels
+    """
+
+    type = ""
+
+    def __init__(
+        self,
+        metrics: HmtMetrics,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    @abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    def expose(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.samples():
+            if labels:
+                label_str = ",".join(
+                    f'{label}="{_escape(label_value)}"'
+                    for label, label_value in labels.items()
+                )
+                name = f"{name}{{{label_str}}}"
+            lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class HmtCounter(HmtMetric):
+    type = "counter"
+
+    def __init__(
+        self,
+        metrics: HmtMetrics,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        super().__init__(metrics, name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not self.metrics.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class HmtGauge(HmtMetric):
+    """
+    Gauge whose values are set, or collected by a callback on scrape.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        metrics: HmtMetrics,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[
+            Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+        ] = None,
+    ) -> None:
+        super().__init__(metrics, name, documentation, labelnames)
+        self.collect = collect
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        if not self.metrics.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> Iterator[Sample]:
+        if self.collect is not None:
+            for labels, value in self.collect():
+                yield self.name, labels, value
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class HmtTimer(object):
+    """
+    Context manager that observes the seconds spent in the block.
+    """
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(
+        self, histogram: HmtHistogram, labels: Dict[str, str]
+    ) -> None:
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> HmtTimer:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class HmtHistogram(HmtMetric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        metrics: HmtMetrics,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(metrics, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # counts per bucket, the last one is +Inf, followed by the sum
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not self.metrics.enabled:
+            return
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def time(self, **labels: str) -> HmtTimer:
+        return HmtTimer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        values = self._values.get(self._key(labels))
+        return 0 if values is None else int(sum(values[:-1]))
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = [
+                (key, list(value)) for key, value in self._values.items()
+            ]
+        for key, counts in values:
+            labels = self._labels(key)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    {**labels, "le": _format_value(bound)},
+                    cumulative,
+                )
+            yield f"{self.name}_sum", labels, counts[-1]
+            yield f"{self.name}_count", labels, cumulative
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class HmtMetrics(object):
+    """
+    Registry of metrics exposed together.
+    ...
+
+    Attributes
+    ----------
+    enabled : bool
+        metrics are not updated while False
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._metrics: Dict[str, HmtMetric] = {}
+
+    def _register(self, metric: HmtMetric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def counter(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> HmtCounter:
+        counter = HmtCounter(self, name, documentation, labelnames)
+        self._register(counter)
+        return counter
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[
+            Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+        ] = None,
+    ) -> HmtGauge:
+        gauge = HmtGauge(self, name, documentation, labelnames, collect)
+        self._register(gauge)
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> HmtHistogram:
+        histogram = HmtHistogram(
+            self, name, documentation, labelnames, buckets
+        )
+        self._register(histogram)
+        return histogram
+
+    def expose(self) -> str:
+        return "".join(metric.expose() for metric in self._metrics.values())
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+def count_error(printer: str, error: BaseException) -> None:
+    ERRORS.inc(printer=printer, exception=error.__class__.__name__)
+
+
+metrics = HmtMetrics()
+
+STAGE_SECONDS = metrics.histogram(
+    "hanmoto_stage_seconds",
+    "Seconds spent in each stage of printing.",
+    ("printer", "stage"),
+)
+BYTES_SENT = metrics.counter(
+    "hanmoto_bytes_sent_total",
+    "Bytes of ESC/POS programs written to the printer.",
+    ("printer",),
+)
+IMAGE_BYTES = metrics.counter(
+    "hanmoto_image_bytes_total",
+    "Bytes of rendered images, as raw raster and as sent.",
+    ("printer", "encoding"),
+)
+JOBS = metrics.counter(
+    "hanmoto_jobs_total",
+    "Print jobs finished, by status.",
+    ("printer", "status"),
+)
+ERRORS = metrics.counter(
+    "hanmoto_errors_total",
+    "Errors, by exception class.",
+    ("printer", "exception"),
+)
@@ -24,8 +24,22 @@ def subparse_network(subparsers: _SubParsersAction) -> None:
         "-t",
         "--timeout",
         default=60,
+        type=float,
+        help="timeout in seconds for writing to the printer",
+    )
+
+    parser_network.add_argument(
+        "--connect_timeout",
+        default=5,
+        type=float,
+        help="timeout in seconds for connecting to the printer",
+    )
+
+    parser_network.add_argument(
+        "--max_retries",
+        default=3,
         type=int,
-        help="timeout in seconds for the escpos-library",
+        help="number of reconnection attempts to the printer",
     )
 
 
@@ -50,6 +64,14 @@ def server_options(parser: ArgumentParser) -> None:
     parser.add_argument(
         "-l", "--lang", default="en", type=str, help="language to print"
     )
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=None,
+        type=str,
+        help="json file of hanmoto config that lists printers and pools. "
+        "other options are ignored when this is specified",
+    )
 
 
 def parse_options() -> Namespace:
@@ -1,3 +1,33 @@
-from ._image import HmtImage, HmtImageImpl, HmtImageStyle
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
 from ._printable import PROPERTIES_TYPE, Printable
+from ._raw import HmtRaw
+from ._stored import HmtStoredImage, HmtStoredImageStyle
 from ._text import HmtText, HmtTextStyle
+
+if TYPE_CHECKING:
+    from ._image import HmtDither, HmtImage, HmtImageImpl, HmtImageStyle
+    from ._raster import HmtRaster
+
+# images need PIL, and rasters numpy, so they are imported when first used
+_LAZY = {
+    "HmtDither": "._image",
+    "HmtImage": "._image",
+    "HmtImageImpl": "._image",
+    "HmtImageStyle": "._image",
+    "HmtRaster": "._raster",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted([*globals(), *_LAZY])
@@ -0,0 +1,6 @@
+GS = b"\x1d"
+ESC = b"\x1b"
+
+
+def _int_low_high(number: int, size: int = 2) -> bytes:
+    return number.to_bytes(size, byteorder="little")
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import hashlib
 from enum import Enum
-from typing import Union
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Optional, Union
 
 from PIL import Image
 from pydantic import BaseModel
@@ -9,6 +12,24 @@ from pydantic import BaseModel
 from ._printable import PROPERTIES_TYPE, Printable
 
 
+class HmtDither(str, Enum):
+    floyd_steinberg = "floyd_steinberg"
+    ordered = "ordered"
+    none = "none"
+
+
+def _to_grayscale(image: Image.Image) -> Image.Image:
+    """
+    Flatten transparent pixels onto white and convert to grayscale.
+    """
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        flat = Image.new("RGB", image.size, (255, 255, 255))
+        flat.paste(image, mask=image.split()[3])
+        image = flat
+    return image.convert("L")
+
+
 class HmtImageImpl(str, Enum):
     bitImageRaster = "bitImageRaster"
     graphics = "graphics"
@@ -21,6 +42,9 @@ class HmtImageStyle(BaseModel):
     high_density_horizontal: bool = False
     impl: HmtImageImpl = HmtImageImpl.bitImageRaster
     fragment_height: int = 960
+    dither: HmtDither = HmtDither.floyd_steinberg
+    threshold: int = 128
+    optimize: bool = False
 
 
 class HmtImage(Printable):
@@ -50,8 +74,89 @@ class HmtImage(Printable):
     ) -> None:
         self.image_src = image_src
         self.__properties: HmtImageStyle = properties
+        self.__digest: Optional[str] = None
         super().__init__()
 
+    @classmethod
+    def from_bytes(
+        cls, data: bytes, properties: HmtImageStyle = HmtImageStyle()
+    ) -> HmtImage:
+        """
+        Initialize HmtImage with encoded image data
+
+        The digest is taken from the encoded data,
+        so it is known without decoding the image.
+
+        Parameters
+        ----------
+        data : bytes
+            encoded image data such as png or jpeg file content
+        properties : HmtImageStyle, optional
+            Dict that specify image style.
+
+        Returns
+        -------
+        image : HmtImage
+            instance of HmtImage whose source is the decoded image
+        """
+        instance = cls(Image.open(BytesIO(data)), properties=properties)
+        instance.__digest = hashlib.sha256(data).hexdigest()
+        return instance
+
+    @classmethod
+    def from_file(
+        cls,
+        file: IO[bytes],
+        properties: HmtImageStyle = HmtImageStyle(),
+        paper_width: Optional[int] = None,
+        digest: Optional[str] = None,
+    ) -> HmtImage:
+        """
+        Initialize HmtImage by decoding an image file right away
+
+        Images wider than the paper are scaled down while decoding,
+        JPEG images by decoding them at a reduced scale in draft mode,
+        so only the grayscale image of the paper width is kept
+        and the file can be closed.
+
+        Parameters
+        ----------
+        file : IO[bytes]
+            binary file of encoded image data such as png or jpeg
+        properties : HmtImageStyle, optional
+            Dict that specify image style.
+        paper_width : int, optional
+            printable width of the paper in dots. not scaled if None.
+        digest : str, optional
+            sha256 hex digest of the file content.
+            taken from the file if None.
+
+        Returns
+        -------
+        image : HmtImage
+            instance of HmtImage whose source is the decoded image
+        """
+        if digest is None:
+            file_hash = hashlib.sha256()
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                file_hash.update(chunk)
+            file.seek(0)
+            digest = file_hash.hexdigest()
+
+        image = Image.open(file)
+        if paper_width is not None and image.width > paper_width:
+            height = max(1, round(image.height * paper_width / image.width))
+            # only JPEG supports draft, which keeps the scale >= the size
+            image.draft("L", (paper_width, height))
+        gray = _to_grayscale(image)
+        if paper_width is not None and gray.width > paper_width:
+            height = max(1, round(gray.height * paper_width / gray.width))
+            gray = gray.resize((paper_width, height), Image.LANCZOS)
+
+        instance = cls(gray, properties=properties)
+        instance.__digest = digest
+        return instance
+
     def __eq__(self, __o: object) -> bool:
         if not isinstance(__o, HmtImage):
             raise NotImplementedError()
@@ -67,6 +172,23 @@ class HmtImage(Printable):
     def properties(self) -> HmtImageStyle:
         return self.__properties
 
+    @property
+    def digest(self) -> str:
+        """
+        Digest of the image content.
+        Image files are hashed as they are, without decoding.
+        """
+        if self.__digest is None:
+            image_hash = hashlib.sha256()
+            if isinstance(self.image_src, Image.Image):
+                image_hash.update(self.image_src.mode.encode())
+                image_hash.update(str(self.image_src.size).encode())
+                image_hash.update(self.image_src.tobytes())
+            else:
+                image_hash.update(Path(self.image_src).read_bytes())
+            self.__digest = image_hash.hexdigest()
+        return self.__digest
+
     def high_density_vertical(self) -> HmtImage:
         self.__properties.high_density_vertical = True
         return self
@@ -94,3 +216,18 @@ class HmtImage(Printable):
     def center(self) -> HmtImage:
         self.__properties.center = True
         return self
+
+    def dither(
+        self, dither: HmtDither = HmtDither.floyd_steinberg
+    ) -> HmtImage:
+        self.__properties.dither = dither
+        return self
+
+    def optimize(self) -> HmtImage:
+        self.__properties.optimize = True
+        return self
+
+    def threshold(self, threshold: int = 128) -> HmtImage:
+        self.__properties.dither = HmtDither.none
+        self.__properties.threshold = threshold
+        return self
@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from ._commands import ESC, GS, _int_low_high
+from ._image import HmtDither, _to_grayscale
+
+# largest data of a single GS ( L command, whose length is two bytes
+GRAPHICS_MAX_BYTES = 0xFFFF - 12
+# blank rows are fed only when more bytes than this are saved,
+# which pays for the feed and the header of the next command
+MIN_SKIPPED_BYTES = 32
+
+
+def _bayer_matrix(size: int) -> np.ndarray:
+    matrix = np.array([[0, 2], [3, 1]])
+    while matrix.shape[0] < size:
+        matrix = np.block(
+            [[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]]
+        )
+    return matrix
+
+
+BAYER_8 = (_bayer_matrix(8) + 0.5) * (256 / 64)
+
+
+def _feed(dots: int) -> bytes:
+    """
+    ESC J commands that feed the paper by dots.
+    """
+    commands = []
+    while dots > 0:
+        commands.append(ESC + b"J" + bytes([min(dots, 255)]))
+        dots -= 255
+    return b"".join(commands)
+
+
+def _runs(flags: np.ndarray) -> List[Tuple[int, int, bool]]:
+    """
+    Runs of equal values as (start, stop, value).
+    """
+    edges = np.flatnonzero(np.diff(flags.astype(np.int8))) + 1
+    bounds = [0, *edges.tolist(), len(flags)]
+    return [
+        (start, stop, bool(flags[start]))
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+class HmtRaster(object):
+    """
+    Monochrome raster of an image ready to be printed.
+    ...
+
+    Rows are kept as a boolean array where True is a dot to print,
+    and are packed into the ESC/POS raster and column formats
+    with numpy instead of per-pixel loops.
+
+    Attributes
+    ----------
+    bits : np.ndarray
+        2d boolean array of height x width. True is a dot to print.
+    """
+
+    def __init__(self, bits: np.ndarray) -> None:
+        self.bits = bits
+
+    @classmethod
+    def from_image(
+        cls,
+        image_src: Union[str, Image.Image],
+        paper_width: Optional[int] = None,
+        center: bool = False,
+        dither: HmtDither = HmtDither.floyd_steinberg,
+        threshold: int = 128,
+    ) -> HmtRaster:
+        """
+        Rasterize an image to fit the paper
+
+        Parameters
+        ----------
+        image_src : str or Image.Image
+            image path or PIL image
+        paper_width : int, optional
+            printable width of the paper in dots, e.g. 384, 512 or 576.
+            wider images are scaled down to it. nothing is resized if None.
+        center : bool, optional
+            center the image on the paper. needs paper_width.
+        dither : HmtDither, optional
+            how gray levels are turned into dots
+        threshold : int, optional
+            gray level under which a pixel is printed
+            when dither is HmtDither.none
+
+        Returns
+        -------
+        raster : HmtRaster
+            rasterized image
+        """
+        image = (
+            image_src
+            if isinstance(image_src, Image.Image)
+            else Image.open(image_src)
+        )
+        gray = _to_grayscale(image)
+        if paper_width is not None and gray.width > paper_width:
+            height = max(1, round(gray.height * paper_width / gray.width))
+            gray = gray.resize((paper_width, height), Image.LANCZOS)
+
+        if dither is HmtDither.floyd_steinberg:
+            # error diffusion is serial, so it is left to Pillow's C loop.
+            # the image is inverted first to match the escpos output.
+            dithered = ImageOps.invert(gray).convert(
+                "1", dither=Image.FLOYDSTEINBERG
+            )
+            bits = np.asarray(dithered, dtype=bool)
+        elif dither is HmtDither.ordered:
+            pixels = np.asarray(gray)
+            height, width = pixels.shape
+            thresholds = np.tile(BAYER_8, (height // 8 + 1, width // 8 + 1))
+            bits = pixels < thresholds[:height, :width]
+        else:
+            bits = np.asarray(gray) < threshold
+
+        raster = cls(bits)
+        if center and paper_width is not None:
+            raster = raster.center(paper_width)
+        return raster
+
+    @property
+    def width(self) -> int:
+        return int(self.bits.shape[1])
+
+    @property
+    def height(self) -> int:
+        return int(self.bits.shape[0])
+
+    @property
+    def width_bytes(self) -> int:
+        return (self.width + 7) >> 3
+
+    def center(self, paper_width: int) -> HmtRaster:
+        if self.width >= paper_width:
+            return self
+        left = (paper_width - self.width) // 2
+        right = paper_width - self.width - left
+        return HmtRaster(np.pad(self.bits, ((0, 0), (left, right))))
+
+    def split(self, fragment_height: int) -> List[HmtRaster]:
+        return [
+            HmtRaster(self.bits[top : top + fragment_height])
+            for top in range(0, self.height, fragment_height)
+        ]
+
+    def to_raster_format(self) -> bytes:
+        """
+        Rows packed 8 dots per byte, MSB first, padded to whole bytes.
+        """
+        data: bytes = np.packbits(self.bits, axis=1).tobytes()
+        return data
+
+    def to_column_format(self, high_density_vertical: bool) -> List[bytes]:
+        """
+        Bands of 24 or 8 rows, each packed column by column.
+        """
+        line_height = 24 if high_density_vertical else 8
+        bands = -(-self.height // line_height)
+        bits = np.pad(
+            self.bits, ((0, bands * line_height - self.height), (0, 0))
+        )
+        columns = bits.reshape(bands, line_height, self.width).transpose(
+            0, 2, 1
+        )
+        packed = np.packbits(columns, axis=2)
+        return [band.tobytes() for band in packed]
+
+    def to_escpos(
+        self,
+        impl: str = "bitImageRaster",
+        high_density_vertical: bool = False,
+        high_density_horizontal: bool = False,
+        fragment_height: int = 960,
+        optimize: bool = False,
+    ) -> bytes:
+        """
+        ESC/POS commands that print the raster
+
+        The commands are the same as Escpos.image unless optimized,
+        so the output is interchangeable with it.
+
+        Parameters
+        ----------
+        impl : str, optional
+            bitImageRaster, graphics or bitImageColumn
+        high_density_vertical : bool, optional
+            print in high density in vertical direction
+        high_density_horizontal : bool, optional
+            print in high density in horizontal direction
+        fragment_height : int, optional
+            rasters taller than this are split into multiple commands
+        optimize : bool, optional
+            leave out blank margins and blank rows. see to_escpos_optimized.
+
+        Returns
+        -------
+        program : bytes
+            ESC/POS commands
+        """
+        if optimize:
+            return self.to_escpos_optimized(
+                impl,
+                high_density_vertical,
+                high_density_horizontal,
+                fragment_height,
+            )
+        if impl == "graphics":
+            fragment_height = max(
+                1,
+                min(fragment_height, GRAPHICS_MAX_BYTES // self.width_bytes),
+            )
+        if self.height > fragment_height:
+            return b"".join(
+                fragment.to_escpos(
+                    impl,
+                    high_density_vertical,
+                    high_density_horizontal,
+                    fragment_height,
+                )
+                for fragment in self.split(fragment_height)
+            )
+
+        if impl == "bitImageRaster":
+            density = (0 if high_density_horizontal else 1) + (
+                0 if high_density_vertical else 2
+            )
+            return (
+                GS
+                + b"v0"
+                + bytes([density])
+                + _int_low_high(self.width_bytes)
+                + _int_low_high(self.height)
+                + self.to_raster_format()
+            )
+
+        if impl == "graphics":
+            header = (
+                b"0"
+                + bytes([1 if high_density_horizontal else 2])
+                + bytes([1 if high_density_vertical else 2])
+                + b"1"
+                + _int_low_high(self.width)
+                + _int_low_high(self.height)
+            )
+            data = header + self.to_raster_format()
+            return (
+                GS
+                + b"(L"
+                + _int_low_high(len(data) + 2)
+                + b"0p"
+                + data
+                + GS
+                + b"(L"
+                + _int_low_high(2)
+                + b"02"
+            )
+
+        if impl == "bitImageColumn":
+            density = (1 if high_density_horizontal else 0) + (
+                32 if high_density_vertical else 0
+            )
+            header = ESC + b"*" + bytes([density]) + _int_low_high(self.width)
+            blobs = self.to_column_format(high_density_vertical)
+            return (
+                ESC
+                + b"3"
+                + bytes([16])
+                + b"".join(header + blob + b"\n" for blob in blobs)
+                + ESC
+                + b"2"
+            )
+
+        return b""
+
+    def escpos_size(
+        self,
+        impl: str = "bitImageRaster",
+        high_density_vertical: bool = False,
+        fragment_height: int = 960,
+    ) -> int:
+        """
+        Size of the commands of to_escpos without optimization,
+        computed without encoding the raster.
+        """
+        if impl == "graphics":
+            fragment_height = max(
+                1,
+                min(fragment_height, GRAPHICS_MAX_BYTES // self.width_bytes),
+            )
+        line_height = 24 if high_density_vertical else 8
+        size = 0
+        for top in range(0, self.height, fragment_height):
+            height = min(fragment_height, self.height - top)
+            if impl == "bitImageColumn":
+                bands = -(-height // line_height)
+                size += 5 + bands * (6 + self.width * line_height // 8)
+            elif impl == "graphics":
+                size += 22 + height * self.width_bytes
+            else:
+                size += 8 + height * self.width_bytes
+        return size
+
+    def to_escpos_optimized(
+        self,
+        impl: str = "bitImageRaster",
+        high_density_vertical: bool = False,
+        high_density_horizontal: bool = False,
+        fragment_height: int = 960,
+    ) -> bytes:
+        """
+        ESC/POS commands that print the raster without its blank parts
+
+        Blank columns on the right are cut off, and blank columns on the
+        left are skipped by setting the left margin with GS L.
+        Blank bands of rows are fed with ESC J instead of being sent as
+        dots. Feeds assume the default motion unit of one dot, and the
+        left margin is set back to 0 at the end.
+        Parameters are the same as to_escpos.
+        """
+        # dots of the printer per column and per row of the raster
+        dot_width = 1 if high_density_horizontal else 2
+        dot_height = 1 if high_density_vertical else 2
+
+        columns = np.flatnonzero(self.bits.any(axis=0))
+        if len(columns) == 0:
+            return _feed(self.height * dot_height)
+        left, right = int(columns[0]), int(columns[-1]) + 1
+        trimmed = HmtRaster(self.bits[:, left:right])
+
+        if impl == "bitImageColumn":
+            program = trimmed._to_column_optimized(
+                high_density_vertical, high_density_horizontal
+            )
+        else:
+            program = b"".join(
+                _feed(height * dot_height)
+                if blank
+                else HmtRaster(trimmed.bits[start:stop]).to_escpos(
+                    impl,
+                    high_density_vertical,
+                    high_density_horizontal,
+                    fragment_height,
+                )
+                for start, stop, blank, height in trimmed._bands()
+            )
+        if left == 0:
+            return program
+        margin = _int_low_high(left * dot_width)
+        return GS + b"L" + margin + program + GS + b"L" + _int_low_high(0)
+
+    def _bands(self) -> List[Tuple[int, int, bool, int]]:
+        """
+        Bands of rows as (start, stop, blank, height).
+        Blank bands too short to be worth a feed are kept as dots.
+        """
+        min_rows = MIN_SKIPPED_BYTES // self.width_bytes + 1
+        bands: List[Tuple[int, int, bool, int]] = []
+        for start, stop, printed in _runs(self.bits.any(axis=1)):
+            blank = not printed and stop - start >= min_rows
+            if bands and not blank and not bands[-1][2]:
+                start = bands.pop()[0]
+            bands.append((start, stop, blank, stop - start))
+        return bands
+
+    def _to_column_optimized(
+        self, high_density_vertical: bool, high_density_horizontal: bool
+    ) -> bytes:
+        """
+        Column format where blank bands are sent as bare line feeds,
+        which feed the same line spacing as a printed band.
+        """
+        density = (1 if high_density_horizontal else 0) + (
+            32 if high_density_vertical else 0
+        )
+        header = ESC + b"*" + bytes([density]) + _int_low_high(self.width)
+        blank = bytes(self.width * (3 if high_density_vertical else 1))
+        return (
+            ESC
+            + b"3"
+            + bytes([16])
+            + b"".join(
+                b"\n" if blob == blank else header + blob + b"\n"
+                for blob in self.to_column_format(high_density_vertical)
+            )
+            + ESC
+            + b"2"
+        )
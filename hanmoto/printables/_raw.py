@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from ._printable import Printable
+
+
+class HmtRaw(Printable):
+    """
+    Printable class for sending precompiled ESC/POS commands.
+    ...
+
+    The commands are sent as they are, e.g. the static parts of a
+    template compiled with HmtCompiler.compile_part.
+    Texts after them set every style again, as the commands may
+    leave the printer in any text style.
+
+    Attributes
+    ----------
+    data : bytes
+        ESC/POS commands to send
+
+    Parameters
+    ----------
+    data : bytes
+        ESC/POS commands to send
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        super().__init__()
+
+    def __eq__(self, __o: object) -> bool:
+        if not isinstance(__o, HmtRaw):
+            raise NotImplementedError()
+        return self.data == __o.data
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} bytes={len(self.data)}>"
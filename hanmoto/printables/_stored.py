@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from pydantic import BaseModel
+
+from ._printable import Printable
+
+
+class HmtStoredImageStyle(BaseModel):
+    double_width: bool = False
+    double_height: bool = False
+
+
+class HmtStoredImage(Printable):
+    """
+    Printable class for printing an image stored in the printer.
+    ...
+
+    The image is registered under the key with Hanmoto.store_image.
+    It is uploaded to the printer memory the first time it is printed,
+    and printed by its key code with a few bytes afterwards.
+
+    Attributes
+    ----------
+    key : str
+        key the image is registered under
+
+    Parameters
+    ----------
+    key : str
+        key the image is registered under
+    properties : HmtStoredImageStyle, optional
+        Dict that specify the scale of the image.
+    """
+
+    def __init__(
+        self, key: str, properties: HmtStoredImageStyle = HmtStoredImageStyle()
+    ) -> None:
+        self.key = key
+        self.__properties: HmtStoredImageStyle = properties.copy()
+        super().__init__()
+
+    def __eq__(self, __o: object) -> bool:
+        if not isinstance(__o, HmtStoredImage):
+            raise NotImplementedError()
+        return self.key == __o.key and self.properties == __o.properties
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} key={self.key} "
+            f"properties={self.properties}>"
+        )
+
+    @property
+    def properties(self) -> HmtStoredImageStyle:
+        return self.__properties
+
+    def double_width(self) -> HmtStoredImage:
+        self.__properties.double_width = True
+        return self
+
+    def double_height(self) -> HmtStoredImage:
+        self.__properties.double_height = True
+        return self
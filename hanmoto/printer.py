@@ -2,15 +2,22 @@ from __future__ import annotations
 
 import os
 from logging import getLogger
+from threading import RLock
 from types import TracebackType
-from typing import Iterable, Optional, Type, Union
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
 
-from escpos.printer import Dummy, Escpos, Network
+from escpos.printer import Dummy, Escpos
 
-from .config import HmtConf, HmtPrinterType
+from .cache import HmtImageCache
+from .compiler import HmtCompiler
+from .config import HmtConf, HmtPrinterConf, HmtPrinterType
+from .connection import HmtNetwork
 from .exceptions import HmtValueException
-from .localizer import HmtLocalizerEnum
-from .printables import HmtImage, HmtText, Printable
+from .localizer import HmtLocalizer, HmtLocalizerEnum
+from .metrics import BYTES_SENT, STAGE_SECONDS
+from .printables import HmtImage, Printable
+from .status import HmtPrinterStatus
+from .tracing import tracer
 
 logger = getLogger(__name__)
 
@@ -24,31 +31,85 @@ class Hanmoto(object):
     ----------
     printer : Escpos
         printer class from escpos package
+    localizer : HmtLocalizer
+        localizer that writes texts straight to the printer
+    localizer_type : HmtLocalizerEnum
+        localizer used to render texts
+    compiler : HmtCompiler
+        compiler that renders sequences into ESC/POS programs
+    image_cache : HmtImageCache
+        cache of rendered images
+    graphics : HmtStoredGraphics
+        images stored in the printer
+
+    Writes to the printer are serialized by a lock of the printer.
+    Callers on several threads print with sessions, which are sent
+    to the printer at once and never interleave with each other.
 
     Parameters
     ----------
     printer : Escpos
         printer class from escpos package
+    image_cache : HmtImageCache, optional
+        cache of rendered images. a new cache is created if None.
+    paper_width : int, optional
+        printable width of the paper in dots.
+        taken from the printer profile if None.
     """
 
-    def __init__(self, printer: Escpos, localizer: HmtLocalizerEnum) -> None:
+    def __init__(
+        self,
+        printer: Escpos,
+        localizer: HmtLocalizerEnum,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
+    ) -> None:
         self.printer = printer
-        self.localizer = localizer.value(self.printer)
+        self.localizer_type = localizer
+        self._localizer: Optional[HmtLocalizer] = None
+        self.image_cache = (
+            HmtImageCache() if image_cache is None else image_cache
+        )
+        self.compiler = HmtCompiler(
+            localizer,
+            profile=self.printer.profile,
+            image_cache=self.image_cache,
+            paper_width=paper_width,
+        )
+        self.graphics = self.compiler.graphics
         self.in_with = False
+        self._lock = RLock()
+        self._cut: Optional[bytes] = None
 
     @classmethod
     def from_conf(cls, conf: HmtConf) -> Hanmoto:
-        printer_conf = conf.printer_conf
+        return cls.from_printer_conf(conf.get_printer_confs()[0])
+
+    @classmethod
+    def from_printer_conf(cls, printer_conf: HmtPrinterConf) -> Hanmoto:
         printer_type = printer_conf.printer_type
         localizer = HmtLocalizerEnum.get_localizer(printer_conf.lang)
+        image_cache = HmtImageCache(printer_conf.image_cache_size)
         if printer_type == HmtPrinterType.network:
-            return cls.from_network(
-                **printer_conf.conf.dict(), localizer=localizer
+            instance = cls.from_network(
+                **printer_conf.conf.dict(),
+                localizer=localizer,
+                image_cache=image_cache,
+                paper_width=printer_conf.paper_width,
             )
         elif printer_type == HmtPrinterType.dummy:
-            return cls.from_dummy(localizer=localizer)
+            instance = cls.from_dummy(
+                localizer=localizer,
+                image_cache=image_cache,
+                paper_width=printer_conf.paper_width,
+            )
         else:
             raise HmtValueException(f"Unknown printer type: {printer_type}")
+        instance.name = printer_conf.name
+        instance.graphics.memory = printer_conf.graphics_memory
+        for key, image_src in printer_conf.stored_images.items():
+            instance.store_image(key, HmtImage(image_src))
+        return instance
 
     @classmethod
     def from_network(
@@ -56,7 +117,18 @@ class Hanmoto(object):
         localizer: Union[HmtLocalizerEnum, str],
         host: str = "",
         port: int = 9100,
-        timeout: int = 60,
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        keepalive: bool = True,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        max_backoff: float = 8,
+        status_check: bool = False,
+        status_timeout: float = 2,
+        status_interval: float = 1,
+        chunk_size: int = 4096,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
     ) -> Hanmoto:
         """
         Initialize Hanmoto with network connected printer
@@ -67,17 +139,36 @@ class Hanmoto(object):
             hostname, ip address of the printer
         port : int, optional
             port number of the printer
-        timeout : int, optional
-            timeout in seconds for the escpos-library
+        timeout : float, optional
+            timeout in seconds for writing to the printer
+        connect_timeout : float, optional
+            timeout in seconds for connecting to the printer
+        keepalive : bool, optional
+            enable TCP keepalive on the connection
+        max_retries : int, optional
+            number of connection attempts after the first one fails
+        retry_backoff : float, optional
+            seconds to wait before the first retry. doubled on every retry.
+        max_backoff : float, optional
+            upper bound of the seconds to wait between retries
+        status_check : bool, optional
+            read the status of the printer and fail writes it cannot print
+        status_timeout : float, optional
+            timeout in seconds for the printer to answer a status request
+        status_interval : float, optional
+            seconds a status is trusted before it is read again
+        chunk_size : int, optional
+            bytes sent at a time when the status is checked
+        image_cache : HmtImageCache, optional
+            cache of rendered images
+        paper_width : int, optional
+            printable width of the paper in dots
 
         Returns
         -------
         hanmoto : Hanmoto
-            instance of Hanmoto that is initialized with Network printer
-
-        See Also
-        --------
-        https://github.com/python-escpos/python-escpos/blob/master/src/escpos/printer.py#L209
+            instance of Hanmoto that is initialized with Network printer.
+            the printer is connected on the first print.
         """
         if (
             "HANMOTO_PRINTER_IP" in os.environ
@@ -87,23 +178,50 @@ class Hanmoto(object):
         if not host:
             raise HmtValueException("host param is needed to be specified")
 
-        printer = Network(host, port=port, timeout=timeout)
+        printer = HmtNetwork(
+            host,
+            port=port,
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            keepalive=keepalive,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            max_backoff=max_backoff,
+            status_check=status_check,
+            status_timeout=status_timeout,
+            status_interval=status_interval,
+            chunk_size=chunk_size,
+        )
         localizer = (
             HmtLocalizerEnum.get_localizer(localizer)
             if isinstance(localizer, str)
             else localizer
         )
-        instance = cls(printer, localizer)
+        instance = cls(
+            printer,
+            localizer,
+            image_cache=image_cache,
+            paper_width=paper_width,
+        )
         return instance
 
     @classmethod
     def from_dummy(
         cls,
         localizer: HmtLocalizerEnum,
+        image_cache: Optional[HmtImageCache] = None,
+        paper_width: Optional[int] = None,
     ) -> Hanmoto:
         """
         Initialize Hanmoto with dummy printer
 
+        Parameters
+        ----------
+        image_cache : HmtImageCache, optional
+            cache of rendered images
+        paper_width : int, optional
+            printable width of the paper in dots
+
         Returns
         -------
         hanmoto : Hanmoto
@@ -115,23 +233,181 @@ class Hanmoto(object):
         """
         printer = Dummy()
         printer.open = lambda: None
-        instance = cls(printer, localizer)
+        instance = cls(
+            printer,
+            localizer,
+            image_cache=image_cache,
+            paper_width=paper_width,
+        )
         return instance
 
-    def print_sequence(self, sequence: Iterable[Printable]) -> None:
+    @property
+    def name(self) -> str:
+        """
+        Name of the printer, used to label metrics.
+        """
+        return self.compiler.name
+
+    @name.setter
+    def name(self, name: str) -> None:
+        self.compiler.name = name
+
+    @property
+    def localizer(self) -> HmtLocalizer:
+        """
+        Localizer writing texts straight to the printer.
+        It is created on first use, since it sets the printer up.
+        """
+        if self._localizer is None:
+            self._localizer = self.localizer_type.value(self.printer)
+        return self._localizer
+
+    def compile(self, sequence: Iterable[Printable]) -> bytes:
+        """
+        Compile sequence into ESC/POS program for this printer
+
+        Parameters
+        ----------
+        sequence : Iterable[Printable]
+            printables to compile
+
+        Returns
+        -------
+        program : bytes
+            ESC/POS commands that print the sequence
+        """
+        with STAGE_SECONDS.time(printer=self.name, stage="compile"):
+            with tracer.span("compile", printer=self.name):
+                return self.compiler.compile(sequence)
+
+    def store_image(self, key: str, image: HmtImage) -> None:
+        """
+        Store an image in the printer to print it by key with HmtStoredImage
+
+        The image is uploaded when it is first printed, and again when
+        the printer may have lost it, e.g. after a reconnect.
+
+        Parameters
+        ----------
+        key : str
+            key to print the image by
+        image : HmtImage
+            image to store
+        """
+        self.graphics.register(key, image)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "image_cache": self.image_cache.stats(),
+            "stored_graphics": self.graphics.stats(),
+        }
+        if isinstance(self.printer, HmtNetwork):
+            stats["connection"] = self.printer.stats()
+        return stats
+
+    def status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Read the status of the printer, None if it cannot be read
+        """
+        if isinstance(self.printer, HmtNetwork):
+            with self._lock:
+                return self.printer.status()
+        return None
+
+    @property
+    def printer_status(self) -> Optional[HmtPrinterStatus]:
+        """
+        Latest status of the printer, None until it is read
+        """
+        if isinstance(self.printer, HmtNetwork):
+            return self.printer.printer_status
+        return None
+
+    def print_sequence(
+        self, sequence: Iterable[Printable], program: Optional[bytes] = None
+    ) -> None:
+        """
+        Print sequence
+
+        Parameters
+        ----------
+        sequence : Iterable[Printable]
+            printables to print
+        program : bytes, optional
+            program compiled from the sequence in advance,
+            e.g. by a render pool. the sequence is compiled if None.
+        """
         if not self.in_with:
-            logger.warn(
+            logger.warning(
                 (
-                    "You are printing sequence from out-side of with statement."
-                    "This may prevent the cut from being performed correctly."
+                    "You are printing sequence from out-side of with "
+                    "statement. This may prevent the cut from being "
+                    "performed correctly."
                 )
             )
-        for elem in sequence:
-            if isinstance(elem, HmtText):
-                self.localizer.text(elem)
-            elif isinstance(elem, HmtImage):
-                image_src = elem.image_src
-                self.printer.image(image_src, **elem.properties.dict())
+        printables = list(sequence)
+        stored = self.graphics.keys_in(printables)
+        if program is None:
+            program = self.compile(printables)
+        self._send(program, stored)
+
+    def session(self) -> HmtSession:
+        """
+        Start a print session of the caller
+
+        Returns
+        -------
+        session : HmtSession
+            session that buffers the output until it is committed
+        """
+        return HmtSession(self)
+
+    def _send(self, program: bytes, stored: List[str]) -> None:
+        """
+        Write a program, uploading the stored images it prints first
+        """
+        with self._lock:
+            uploads: List[str] = []
+            if stored:
+                uploads = self.graphics.missing(stored, self._connection())
+            if uploads:
+                program = self.graphics.define(uploads) + program
+            if program:
+                with STAGE_SECONDS.time(
+                    printer=self.name, stage="send"
+                ), tracer.span(
+                    "send",
+                    printer=self.name,
+                    bytes=len(program),
+                    uploads=len(uploads),
+                ):
+                    self.printer._raw(program)
+                BYTES_SENT.inc(len(program), printer=self.name)
+            if uploads:
+                # a write retried on a new connection uploads to that one
+                self.graphics.loaded(uploads, self._connection())
+
+    def _connection(self) -> int:
+        if isinstance(self.printer, HmtNetwork):
+            return self.printer.connection()
+        return 0
+
+    def cut_command(self) -> bytes:
+        """
+        ESC/POS command that cuts the paper on this printer
+        """
+        if self._cut is None:
+            target = Dummy()
+            target.profile = self.printer.profile
+            target.cut()
+            self._cut = target.output
+        return self._cut
+
+    def cut(self) -> None:
+        with self._lock, STAGE_SECONDS.time(
+            printer=self.name, stage="cut"
+        ), tracer.span("cut", printer=self.name):
+            self.printer.cut()
 
     def __enter__(self) -> None:
         self.in_with = True
@@ -143,4 +419,95 @@ class Hanmoto(object):
         traceback: Optional[TracebackType],
     ) -> None:
         self.in_with = False
-        self.printer.cut()
+        self.cut()
+
+
+class HmtSession(object):
+    """
+    Print session of one caller, sent to the printer at once.
+    ...
+
+    Sequences printed in a session are compiled into a buffer of the
+    session without touching the printer. The buffer is sent with one
+    write when the session is committed, holding the lock of the printer
+    only while sending, so sessions of concurrent callers, e.g. requests
+    served on a thread pool, never interleave their bytes and cuts.
+    Used in a with statement, the session is committed with a cut when
+    the block exits, and discarded when the block raises.
+
+    Attributes
+    ----------
+    printer : Hanmoto
+        printer the session is committed to
+
+    Parameters
+    ----------
+    printer : Hanmoto
+        printer the session is committed to
+    """
+
+    def __init__(self, printer: Hanmoto) -> None:
+        self.printer = printer
+        self._buffer: List[bytes] = []
+        self._stored: List[str] = []
+
+    def __len__(self) -> int:
+        """
+        Bytes buffered in the session
+        """
+        return sum(len(data) for data in self._buffer)
+
+    def print_sequence(
+        self, sequence: Iterable[Printable], program: Optional[bytes] = None
+    ) -> None:
+        """
+        Compile sequence into the session. Parameters are the same as
+        Hanmoto.print_sequence.
+        """
+        printables = list(sequence)
+        for key in self.printer.graphics.keys_in(printables):
+            if key not in self._stored:
+                self._stored.append(key)
+        if program is None:
+            program = self.printer.compile(printables)
+        self._buffer.append(program)
+
+    def cut(self) -> None:
+        self._buffer.append(self.printer.cut_command())
+
+    def commit(self, cut: bool = True) -> None:
+        """
+        Send the buffered output to the printer and empty the session
+
+        Parameters
+        ----------
+        cut : bool, optional
+            whether the paper is cut after the output
+        """
+        if cut:
+            self.cut()
+        program = b"".join(self._buffer)
+        stored = self._stored
+        self.discard()
+        self.printer._send(program, stored)
+
+    def discard(self) -> None:
+        """
+        Empty the session without sending it
+        """
+        self._buffer = []
+        self._stored = []
+
+    def __enter__(self) -> HmtSession:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
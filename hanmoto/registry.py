@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import itertools
+from typing import Dict, List, Mapping, Optional, Union
+
+from .aio import AsyncHanmoto
+from .config import HmtConf, HmtPoolStrategy
+from .exceptions import HmtValueException
+from .jobs import HmtJob, HmtJobQueue
+from .printer import Hanmoto
+from .render import HmtRenderPool
+from .spool import HmtSpool
+
+
+class HmtPrinterPool(object):
+    """
+    Group of printers that share the jobs sent to the pool.
+    ...
+
+    Each job goes to one printer of the pool chosen by the strategy.
+    Printers that are offline are skipped while any printer is online.
+
+    Attributes
+    ----------
+    name : str
+        name of the pool
+    queues : List[HmtJobQueue]
+        job queues of the printers in the pool
+    strategy : HmtPoolStrategy
+        how a printer is chosen for a job
+
+    Parameters
+    ----------
+    name : str
+        name of the pool
+    queues : List[HmtJobQueue]
+        job queues of the printers in the pool
+    strategy : HmtPoolStrategy, optional
+        how a printer is chosen for a job
+    """
+
+    def __init__(
+        self,
+        name: str,
+        queues: List[HmtJobQueue],
+        strategy: HmtPoolStrategy = HmtPoolStrategy.least_busy,
+    ) -> None:
+        if not queues:
+            raise HmtValueException(f"pool {name} has no printers")
+        self.name = name
+        self.queues = queues
+        self.strategy = strategy
+        self._turns = itertools.cycle(range(len(queues)))
+
+    def select(self) -> HmtJobQueue:
+        start = next(self._turns)
+        rotated = self.queues[start:] + self.queues[:start]
+        candidates = [queue for queue in rotated if queue.online] or rotated
+        if self.strategy is HmtPoolStrategy.round_robin:
+            return candidates[0]
+        return min(candidates, key=lambda queue: queue.load)
+
+
+class HmtPrinterRegistry(object):
+    """
+    Registry of named printers and printer pools.
+    ...
+
+    Every printer has its own job queue, so jobs for different printers
+    are printed in parallel. Printers set up from config are AsyncHanmoto,
+    so all of them are driven by the event loop.
+
+    Attributes
+    ----------
+    queues : Dict[str, HmtJobQueue]
+        job queues by printer name
+    pools : Dict[str, HmtPrinterPool]
+        printer pools by pool name
+    default : str
+        name of the printer used when no name is given
+    render_pool : HmtRenderPool, optional
+        pool that compiles jobs of all printers ahead of printing
+    spool : HmtSpool, optional
+        durable spool of the jobs of all printers
+    fair_share : int
+        jobs of higher priorities taken before a waiting lower one
+    client_weights : Dict[str, float]
+        share of each printer by client id
+
+    Parameters
+    ----------
+    render_pool : HmtRenderPool, optional
+        pool that compiles jobs of all printers ahead of printing
+    render_ahead : int, optional
+        number of waiting jobs compiled ahead per printer
+    spool : HmtSpool, optional
+        durable spool of the jobs of all printers
+    fair_share : int, optional
+        jobs of higher priorities taken before a waiting lower one
+    client_weights : Mapping[str, float], optional
+        share of each printer by client id. 1 for clients not listed.
+    """
+
+    def __init__(
+        self,
+        render_pool: Optional[HmtRenderPool] = None,
+        render_ahead: Optional[int] = None,
+        spool: Optional[HmtSpool] = None,
+        fair_share: int = 8,
+        client_weights: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        self.queues: Dict[str, HmtJobQueue] = {}
+        self.pools: Dict[str, HmtPrinterPool] = {}
+        self.default = ""
+        self.render_pool = render_pool
+        self.render_ahead = render_ahead
+        self.spool = spool
+        self.fair_share = fair_share
+        self.client_weights = dict(client_weights or {})
+
+    @classmethod
+    def from_conf(cls, conf: HmtConf) -> HmtPrinterRegistry:
+        render_conf = conf.render_conf
+        spool_conf = conf.spool_conf
+        scheduler_conf = conf.scheduler_conf
+        registry = cls(
+            render_pool=(
+                HmtRenderPool(render_conf.workers)
+                if render_conf.workers > 0
+                else None
+            ),
+            render_ahead=render_conf.ahead,
+            spool=(
+                HmtSpool(
+                    spool_conf.path,
+                    max_attempts=spool_conf.max_attempts,
+                    retry_delay=spool_conf.retry_delay,
+                )
+                if spool_conf.path
+                else None
+            ),
+            fair_share=scheduler_conf.fair_share,
+            client_weights=scheduler_conf.client_weights,
+        )
+        for printer_conf in conf.get_printer_confs():
+            printer = AsyncHanmoto.from_printer_conf(printer_conf)
+            registry.add_printer(
+                printer_conf.name,
+                printer,
+                max_backlog=printer_conf.max_backlog,
+            )
+        for pool_conf in conf.pools:
+            registry.add_pool(
+                pool_conf.name, pool_conf.printers, pool_conf.strategy
+            )
+        return registry
+
+    def add_printer(
+        self,
+        name: str,
+        printer: Union[Hanmoto, AsyncHanmoto],
+        max_backlog: Optional[int] = None,
+    ) -> HmtJobQueue:
+        if name in self.queues or name in self.pools:
+            raise HmtValueException(f"printer {name} is already registered")
+        printer.name = name
+        queue = HmtJobQueue(
+            printer,
+            name=name,
+            render_pool=self.render_pool,
+            render_ahead=self.render_ahead,
+            spool=self.spool,
+            max_backlog=max_backlog,
+            fair_share=self.fair_share,
+            client_weights=self.client_weights,
+        )
+        self.queues[name] = queue
+        if not self.default:
+            self.default = name
+        return queue
+
+    def add_pool(
+        self,
+        name: str,
+        printer_names: List[str],
+        strategy: HmtPoolStrategy = HmtPoolStrategy.least_busy,
+    ) -> HmtPrinterPool:
+        if name in self.queues or name in self.pools:
+            raise HmtValueException(f"printer {name} is already registered")
+        unknown = [
+            printer_name
+            for printer_name in printer_names
+            if printer_name not in self.queues
+        ]
+        if unknown:
+            raise HmtValueException(f"unknown printers in pool: {unknown}")
+        queues = [self.queues[printer_name] for printer_name in printer_names]
+        pool = HmtPrinterPool(name, queues, strategy)
+        self.pools[name] = pool
+        return pool
+
+    def route(self, name: Optional[str] = None) -> HmtJobQueue:
+        """
+        Job queue for the printer or pool of the name.
+        Default printer is used if name is None.
+        """
+        if name is None:
+            name = self.default
+        if name in self.queues:
+            return self.queues[name]
+        if name in self.pools:
+            return self.pools[name].select()
+        raise HmtValueException(f"printer {name} is not found")
+
+    def get_job(self, job_id: str) -> Optional[HmtJob]:
+        for queue in self.queues.values():
+            job = queue.get(job_id)
+            if job is not None:
+                return job
+        return None
+
+    async def start(self) -> None:
+        for queue in self.queues.values():
+            await queue.start()
+
+    async def stop(self) -> None:
+        for queue in self.queues.values():
+            await queue.stop()
+        if self.render_pool is not None:
+            self.render_pool.shutdown()
+        if self.spool is not None:
+            self.spool.close()
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging import getLogger
+from typing import List, Optional, Tuple
+
+from .cache import HmtImageCache
+from .compiler import HmtCompiler
+from .config import DEFAULT_IMAGE_CACHE_SIZE
+from .printables import Printable
+
+logger = getLogger(__name__)
+
+# cache of rendered images of a worker process, shared by its printers
+_image_cache: Optional[HmtImageCache] = None
+
+
+def _init_worker(image_cache_size: int) -> None:
+    global _image_cache
+    _image_cache = HmtImageCache(image_cache_size)
+
+
+def render(
+    compiler: HmtCompiler, printables: List[Printable]
+) -> Tuple[bytes, float]:
+    """
+    Compile printables in a worker process
+
+    Returns
+    -------
+    program : bytes
+        ESC/POS commands that print the printables
+    seconds : float
+        seconds spent compiling
+    """
+    if compiler.image_cache is None:
+        compiler.image_cache = _image_cache
+    start = time.perf_counter()
+    program = compiler.compile(printables)
+    return program, time.perf_counter() - start
+
+
+class HmtRenderPool(object):
+    """
+    Process pool that compiles jobs ahead of the printers.
+    ...
+
+    Rasterizing images is CPU-bound, so jobs are compiled in worker
+    processes while the job queues send earlier programs to the printers.
+    Compilers are sent with every job, without the image cache of this
+    process. Each worker keeps its own image cache instead.
+    Workers are spawned on the first job, and the pool is set up again
+    if a worker dies.
+
+    Attributes
+    ----------
+    workers : int
+        number of worker processes
+
+    Parameters
+    ----------
+    workers : int, optional
+        number of worker processes. the number of CPUs if None.
+    image_cache_size : int, optional
+        upper bound of the bytes of the image cache of each worker
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        image_cache_size: int = DEFAULT_IMAGE_CACHE_SIZE,
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.image_cache_size = image_cache_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def submit(
+        self, compiler: HmtCompiler, printables: List[Printable]
+    ) -> asyncio.Future[Tuple[bytes, float]]:
+        """
+        Start compiling printables in a worker process
+
+        Parameters
+        ----------
+        compiler : HmtCompiler
+            compiler of the printer the printables are printed with
+        printables : List[Printable]
+            printables to compile
+
+        Returns
+        -------
+        future : asyncio.Future
+            program and seconds spent compiling it
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return loop.run_in_executor(
+                self._get_executor(), render, compiler, printables
+            )
+        except BrokenProcessPool:
+            logger.warning("render worker died. restarting render pool")
+            self.shutdown()
+            return loop.run_in_executor(
+                self._get_executor(), render, compiler, printables
+            )
+
+    def shutdown(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # workers are spawned, as forking copies the threads and
+            # sockets of the server
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.image_cache_size,),
+            )
+        return self._executor
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from enum import Enum
+from typing import TYPE_CHECKING, Deque, Dict, List, Mapping, Optional
+
+if TYPE_CHECKING:
+    from .jobs import HmtJob
+
+
+class HmtPriority(str, Enum):
+    high = "high"
+    normal = "normal"
+    low = "low"
+
+
+class _Unit(object):
+    """
+    Jobs taken together, i.e. a job or the jobs of a batch.
+    Units are ordered by their start tags.
+    """
+
+    def __init__(self, job: HmtJob, start: float, seq: int) -> None:
+        self.jobs: Deque[HmtJob] = deque([job])
+        self.start = start
+        self.seq = seq
+
+    def __lt__(self, other: _Unit) -> bool:
+        return (self.start, self.seq) < (other.start, other.seq)
+
+
+class HmtJobScheduler(asyncio.Queue["HmtJob"]):
+    """
+    Queue of jobs taken by priority, and fairly between clients.
+    ...
+
+    Jobs of a higher priority are taken first, so they never wait for
+    more than the job being printed and a lower priority job of each
+    class. A priority that has been passed over fair_share times in a row
+    is taken once, so bulk jobs still make progress under a stream of
+    urgent ones. Within a priority, clients take turns by start-time fair
+    queueing weighted by client_weights, so a client that submits many
+    jobs at once delays the jobs of the others by its share only.
+    Jobs of a batch are taken one after another without other jobs
+    in between.
+
+    Attributes
+    ----------
+    fair_share : int
+        jobs of higher priorities taken before a waiting lower one
+    client_weights : Dict[str, float]
+        share of the printer by client id. 1 for clients not listed.
+
+    Parameters
+    ----------
+    fair_share : int, optional
+        jobs of higher priorities taken before a waiting lower one
+    client_weights : Mapping[str, float], optional
+        share of the printer by client id. 1 for clients not listed.
+    """
+
+    def __init__(
+        self,
+        fair_share: int = 8,
+        client_weights: Optional[Mapping[str, float]] = None,
+    ) -> None:
+        self.fair_share = fair_share
+        self.client_weights = dict(client_weights or {})
+        super().__init__()
+
+    def _init(self, maxsize: int) -> None:
+        self._lanes: Dict[HmtPriority, List[_Unit]] = {
+            priority: [] for priority in HmtPriority
+        }
+        # start tag of the unit taken last, and finish tags of the clients
+        self._virtual_time: Dict[HmtPriority, float] = {
+            priority: 0.0 for priority in HmtPriority
+        }
+        self._finish: Dict[HmtPriority, Dict[str, float]] = {
+            priority: {} for priority in HmtPriority
+        }
+        self._passed: Dict[HmtPriority, int] = {
+            priority: 0 for priority in HmtPriority
+        }
+        self._current: Deque[HmtJob] = deque()
+        self._last: Optional[_Unit] = None
+        self._size = 0
+        self._seq = itertools.count()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def remaining(self) -> int:
+        """
+        Jobs left of the batch whose job was taken last
+        """
+        return len(self._current)
+
+    def upcoming(self, count: int) -> List[HmtJob]:
+        """
+        Jobs likely to be taken next, in order
+        """
+        jobs = list(self._current)
+        for priority in HmtPriority:
+            if len(jobs) >= count:
+                break
+            for unit in heapq.nsmallest(count, self._lanes[priority]):
+                jobs.extend(unit.jobs)
+                if len(jobs) >= count:
+                    break
+        return jobs[:count]
+
+    def _put(self, job: HmtJob) -> None:
+        priority = job.priority
+        finish = self._finish[priority]
+        cost = 1 / self.client_weights.get(job.client, 1.0)
+        last = self._last
+        if (
+            job.batch_id is not None
+            and last is not None
+            and last.jobs
+            and last.jobs[-1].batch_id == job.batch_id
+        ):
+            # jobs of a batch are put one after another
+            last.jobs.append(job)
+            finish[job.client] += cost
+        else:
+            start = max(
+                self._virtual_time[priority], finish.get(job.client, 0.0)
+            )
+            finish[job.client] = start + cost
+            unit = _Unit(job, start, next(self._seq))
+            heapq.heappush(self._lanes[priority], unit)
+            self._last = unit
+        self._size += 1
+
+    def _get(self) -> HmtJob:
+        if not self._current:
+            priority = self._next_priority()
+            lane = self._lanes[priority]
+            unit = heapq.heappop(lane)
+            self._virtual_time[priority] = unit.start
+            if not lane:
+                # tags start over when the priority runs out of jobs
+                self._virtual_time[priority] = 0.0
+                self._finish[priority].clear()
+            if unit is self._last:
+                self._last = None
+            self._current = unit.jobs
+        self._size -= 1
+        return self._current.popleft()
+
+    def _next_priority(self) -> HmtPriority:
+        waiting = [
+            priority for priority in HmtPriority if self._lanes[priority]
+        ]
+        chosen = waiting[0]
+        for priority in waiting[1:]:
+            if self._passed[priority] >= self.fair_share:
+                chosen = priority
+                break
+        for priority in waiting[waiting.index(chosen) + 1 :]:
+            self._passed[priority] += 1
+        self._passed[chosen] = 0
+        return chosen
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+from .jobs import HmtJob, HmtJobStatus
+from .printables import HmtStoredImage
+from .scheduler import HmtPriority
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    printer TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    finished_at TEXT,
+    batch_id TEXT,
+    cut INTEGER NOT NULL,
+    priority TEXT NOT NULL,
+    client TEXT NOT NULL,
+    trace_id TEXT,
+    stored TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    program BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (printer, status, created_at);
+"""
+
+
+class HmtSpool(object):
+    """
+    Durable spool of compiled jobs in a SQLite database.
+    ...
+
+    Jobs are written to the spool with their compiled program once they
+    are compiled, and removed when they are finished, so queued jobs
+    survive a restart of the process and are printed when the job queues
+    start again. The database is in WAL mode, so writes are appends to
+    the log and do not wait for the printers.
+    Finished jobs are compacted away when a job queue runs out of jobs.
+
+    Attributes
+    ----------
+    path : str
+        path of the database file
+    max_attempts : int
+        times a job is sent before it fails on connection errors
+    retry_delay : float
+        seconds waited before sending a job again, times the attempts
+
+    Parameters
+    ----------
+    path : str
+        path of the database file. created if it does not exist.
+    max_attempts : int, optional
+        times a job is sent before it fails on connection errors
+    retry_delay : float, optional
+        seconds waited before sending a job again, times the attempts
+    """
+
+    def __init__(
+        self, path: str, max_attempts: int = 5, retry_delay: float = 1.0
+    ) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = Lock()
+        # the connection is shared by the threads of the executors,
+        # and serialized by the lock
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL is durable across process crashes with NORMAL
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def put(self, job: HmtJob, program: bytes) -> None:
+        """
+        Store a compiled job until it is finished
+        """
+        stored = [
+            elem.key
+            for elem in job.printables
+            if isinstance(elem, HmtStoredImage)
+        ]
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, printer, status, created_at,"
+                " batch_id, cut, priority, client, trace_id, stored, program)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id,
+                    job.printer,
+                    HmtJobStatus.queued.value,
+                    job.created_at.isoformat(),
+                    job.batch_id,
+                    int(job.cut),
+                    job.priority.value,
+                    job.client,
+                    job.trace_id,
+                    json.dumps(list(dict.fromkeys(stored))),
+                    program,
+                ),
+            )
+
+    def pending(self, printer: str) -> List[Tuple[HmtJob, bytes]]:
+        """
+        Unfinished jobs of the printer and their programs, oldest first
+
+        The jobs keep their ids, and print the stored images
+        the programs print, so they are uploaded when missing.
+        Jobs that were printing when the process stopped are among them,
+        and are printed again.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, created_at, batch_id, cut, priority, client,"
+                " trace_id, stored, program FROM jobs"
+                " WHERE printer = ? AND status = ?"
+                " ORDER BY created_at, seq",
+                (printer, HmtJobStatus.queued.value),
+            ).fetchall()
+        pending = []
+        for row in rows:
+            (
+                job_id,
+                created_at,
+                batch_id,
+                cut,
+                priority,
+                client,
+                trace_id,
+                stored,
+                program,
+            ) = row
+            job = HmtJob(
+                id=job_id,
+                printer=printer,
+                created_at=datetime.fromisoformat(created_at),
+                batch_id=batch_id,
+                cut=bool(cut),
+                priority=HmtPriority(priority),
+                client=client,
+                trace_id=trace_id,
+                printables=[HmtStoredImage(key) for key in json.loads(stored)],
+            )
+            pending.append((job, bytes(program)))
+        return pending
+
+    def attempted(self, job_id: str, error: str) -> None:
+        """
+        Count a failed attempt to send the job
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET attempts = attempts + 1, error = ?"
+                " WHERE id = ?",
+                (error, job_id),
+            )
+
+    def finish(self, job: HmtJob) -> None:
+        """
+        Mark the job finished, to be compacted away
+        """
+        finished_at = job.finished_at or datetime.now()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ?"
+                " WHERE id = ?",
+                (
+                    job.status.value,
+                    finished_at.isoformat(),
+                    job.error,
+                    job.id,
+                ),
+            )
+
+    def compact(self) -> int:
+        """
+        Delete the finished jobs and truncate the log
+
+        Returns
+        -------
+        deleted : int
+            number of deleted jobs
+        """
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM jobs WHERE status != ?",
+                (HmtJobStatus.queued.value,),
+            ).rowcount
+            if deleted:
+                self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return int(deleted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(
+                self._db.execute(
+                    "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+                ).fetchall()
+            )
+        size = 0
+        for path in (self.path, f"{self.path}-wal"):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return {
+            "pending": counts.pop(HmtJobStatus.queued.value, 0),
+            "finished": sum(counts.values()),
+            "size": size,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
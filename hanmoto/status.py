@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+from datetime import datetime
+from logging import getLogger
+from typing import Iterable, List, Optional
+
+from pydantic import BaseModel, Field
+
+from .exceptions import HmtPrinterStatusException
+
+logger = getLogger(__name__)
+
+DLE = b"\x10"
+EOT = b"\x04"
+GS = b"\x1d"
+
+# DLE EOT n for the printer, offline cause, error cause and paper sensor
+STATUS_REQUEST = b"".join(DLE + EOT + bytes([n]) for n in (1, 2, 3, 4))
+# GS a enabling automatic status back on online, error and paper changes
+ASB_ENABLE = GS + b"a" + bytes([0b1110])
+
+# fixed bits telling the replies apart from other data
+_STATUS_MASK = 0x93
+_STATUS_BITS = 0x12
+_ASB_BITS = 0x10
+
+
+def is_status_reply(byte: int) -> bool:
+    """
+    Whether the byte is a reply to DLE EOT
+    """
+    return byte & _STATUS_MASK == _STATUS_BITS
+
+
+def is_asb_header(byte: int) -> bool:
+    """
+    Whether the byte is the first of the 4 bytes of automatic status back
+    """
+    return byte & _STATUS_MASK == _ASB_BITS
+
+
+class HmtPrinterStatus(BaseModel):
+    """
+    Real-time status of a printer.
+    ...
+
+    Status is read from the replies to DLE EOT, or from automatic status
+    back (ASB) which printers send by themselves on changes once enabled
+    with GS a. The printer does not print while it is not ready, and
+    data sent to it stays in its receive buffer.
+
+    Attributes
+    ----------
+    online : bool
+        the printer is online
+    cover_open : bool
+        the cover is open
+    paper_out : bool
+        the roll paper is out
+    paper_near_end : bool
+        the roll paper is near its end. the printer still prints.
+    error : bool
+        autocutter, unrecoverable or auto-recoverable error occurred
+    checked_at : datetime
+        when the status was read
+    """
+
+    online: bool = True
+    cover_open: bool = False
+    paper_out: bool = False
+    paper_near_end: bool = False
+    error: bool = False
+    checked_at: datetime = Field(default_factory=datetime.now)
+
+    @property
+    def ready(self) -> bool:
+        return self.problem is None
+
+    @property
+    def problem(self) -> Optional[str]:
+        """
+        Why the printer does not print, None if it is ready
+        """
+        if self.cover_open:
+            return "cover is open"
+        if self.paper_out:
+            return "paper is out"
+        if self.error:
+            return "printer has an error"
+        if not self.online:
+            return "printer is offline"
+        return None
+
+    @classmethod
+    def from_replies(cls, replies: Iterable[int]) -> HmtPrinterStatus:
+        """
+        Status from the replies to STATUS_REQUEST, in order
+        """
+        printer, offline, error, paper = replies
+        return cls(
+            online=not printer & 0x08,
+            cover_open=bool(offline & 0x04),
+            paper_out=bool(offline & 0x20 or paper & 0x60),
+            paper_near_end=bool(paper & 0x0C),
+            error=bool(offline & 0x40 or error & 0x2C),
+        )
+
+    @classmethod
+    def from_asb(cls, asb: bytes) -> HmtPrinterStatus:
+        """
+        Status from the 4 bytes of automatic status back
+        """
+        return cls(
+            online=not asb[0] & 0x08,
+            cover_open=bool(asb[0] & 0x20),
+            paper_out=bool(asb[2] & 0x0C),
+            paper_near_end=bool(asb[2] & 0x03),
+            error=bool(asb[1] & 0x2C),
+        )
+
+    @property
+    def age(self) -> float:
+        """
+        Seconds since the status was read
+        """
+        return (datetime.now() - self.checked_at).total_seconds()
+
+    def check(self, printer: str) -> None:
+        """
+        Raise HmtPrinterStatusException if the printer is not ready
+        """
+        if self.problem is not None:
+            raise HmtPrinterStatusException(
+                f"printer {printer} is not ready: {self.problem}"
+            )
+
+    def to_replies(self) -> bytes:
+        """
+        Replies of a printer in this status to STATUS_REQUEST
+        """
+        return bytes(
+            [
+                _STATUS_BITS | (0 if self.online else 0x08),
+                _STATUS_BITS
+                | (0x04 if self.cover_open else 0)
+                | (0x20 if self.paper_out else 0)
+                | (0x40 if self.error else 0),
+                _STATUS_BITS | (0x04 if self.error else 0),
+                _STATUS_BITS
+                | (0x60 if self.paper_out else 0)
+                | (0x0C if self.paper_near_end else 0),
+            ]
+        )
+
+    def to_asb(self) -> bytes:
+        """
+        Automatic status back of a printer in this status
+        """
+        return bytes(
+            [
+                _ASB_BITS
+                | (0 if self.online else 0x08)
+                | (0x20 if self.cover_open else 0),
+                0x04 if self.error else 0,
+                (0x0C if self.paper_out else 0)
+                | (0x03 if self.paper_near_end else 0),
+                0,
+            ]
+        )
+
+
+class HmtStatusReader(object):
+    """
+    Parser of the status a printer sends back.
+    ...
+
+    The bytes read from a printer are the replies to DLE EOT, one byte
+    each, and automatic status back, 4 bytes sent by the printer on its
+    own. Both have fixed bits, so they are told apart in one stream.
+
+    Attributes
+    ----------
+    printer : str
+        name of the printer in logs
+    status : HmtPrinterStatus, optional
+        latest status, None until it is read
+
+    Parameters
+    ----------
+    printer : str
+        name of the printer in logs
+    """
+
+    def __init__(self, printer: str) -> None:
+        self.printer = printer
+        self.status: Optional[HmtPrinterStatus] = None
+        self._asb = bytearray()
+
+    def feed(self, data: bytes) -> List[int]:
+        """
+        Parse bytes read from the printer
+
+        Returns
+        -------
+        replies : List[int]
+            replies to DLE EOT in the bytes.
+            automatic status back updates the status.
+        """
+        replies = []
+        for byte in data:
+            if self._asb:
+                self._asb.append(byte)
+                if len(self._asb) == 4:
+                    self.update(HmtPrinterStatus.from_asb(bytes(self._asb)))
+                    self._asb.clear()
+            elif is_asb_header(byte):
+                self._asb.append(byte)
+            elif is_status_reply(byte):
+                replies.append(byte)
+        return replies
+
+    def update(self, status: HmtPrinterStatus) -> None:
+        previous, self.status = self.status, status
+        if previous is not None and previous.problem == status.problem:
+            return
+        if status.problem is not None:
+            logger.warning(
+                f"printer {self.printer} is not ready: {status.problem}"
+            )
+        elif previous is not None:
+            logger.info(f"printer {self.printer} is ready again")
+
+    def reset(self) -> None:
+        """
+        Forget the status, e.g. on a new connection
+        """
+        self.status = None
+        self._asb.clear()
+
+    def stale(self, interval: float) -> bool:
+        """
+        Whether the status should be read before printing
+        """
+        return (
+            self.status is None
+            or not self.status.ready
+            or self.status.age >= interval
+        )
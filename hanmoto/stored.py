@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from .config import HmtGraphicsMemory
+from .exceptions import HmtValueException
+from .printables import HmtImage, HmtStoredImage, Printable
+from .printables._commands import GS, _int_low_high
+
+if TYPE_CHECKING:
+    from .printables import HmtRaster
+
+FS = b"\x1c"
+
+# key codes are two printable characters, "H " to "~~"
+KEY_CODE_FIRST = 0x48
+KEY_CODE_RANGE = 0x7E - 0x20 + 1
+MAX_KEY_CODES = (0x7E - KEY_CODE_FIRST + 1) * KEY_CODE_RANGE
+MAX_NV_BIT_IMAGES = 255
+
+
+def _graphics_command(fn: bytes, data: bytes) -> bytes:
+    """
+    GS ( L command, or GS 8 L when the data is too long for it.
+    """
+    params = b"0" + fn + data
+    if len(params) <= 0xFFFF:
+        return GS + b"(L" + _int_low_high(len(params)) + params
+    return GS + b"8L" + _int_low_high(len(params), 4) + params
+
+
+def _nv_bit_image(raster: HmtRaster) -> bytes:
+    """
+    Image of FS q, whose size is in units of 8 dots, packed by columns.
+    """
+    import numpy as np
+
+    width_bytes = raster.width_bytes
+    height_bytes = (raster.height + 7) >> 3
+    bits = np.pad(
+        raster.bits,
+        (
+            (0, height_bytes * 8 - raster.height),
+            (0, width_bytes * 8 - raster.width),
+        ),
+    )
+    columns: bytes = np.packbits(bits.T, axis=1).tobytes()
+    return _int_low_high(width_bytes) + _int_low_high(height_bytes) + columns
+
+
+class HmtStoredGraphics(object):
+    """
+    Images stored in the memory of a printer and printed by key code.
+    ...
+
+    Images are registered under keys, and uploaded to the printer the
+    first time they are printed. Uploaded images are remembered per
+    connection: download graphics live in RAM and are uploaded again
+    on a new connection, as the printer may have been power-cycled,
+    while NV graphics are kept across power cycles and uploaded once.
+    NV memory wears with writes, so NV graphics are uploaded only when
+    they are not known to be stored by this process.
+
+    Attributes
+    ----------
+    memory : HmtGraphicsMemory
+        printer memory the images are stored in.
+        download uses GS ( L functions 83 and 85, nv uses functions 67
+        and 69, and nv_bit_image uses FS q and FS p for older printers.
+    paper_width : int, optional
+        printable width of the paper in dots
+    uploads : int
+        number of images uploaded to the printer
+
+    Parameters
+    ----------
+    memory : HmtGraphicsMemory, optional
+        printer memory the images are stored in
+    paper_width : int, optional
+        printable width of the paper in dots.
+        wider images are scaled down to it.
+    """
+
+    def __init__(
+        self,
+        memory: HmtGraphicsMemory = HmtGraphicsMemory.download,
+        paper_width: Optional[int] = None,
+    ) -> None:
+        self.paper_width = paper_width
+        self.uploads = 0
+        self._memory = memory
+        self._images: OrderedDict[str, HmtImage] = OrderedDict()
+        self._definitions: Dict[str, bytes] = {}
+        self._resident: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._images
+
+    @property
+    def memory(self) -> HmtGraphicsMemory:
+        return self._memory
+
+    @memory.setter
+    def memory(self, memory: HmtGraphicsMemory) -> None:
+        if memory is not self._memory:
+            self._memory = memory
+            self._definitions.clear()
+            self.forget()
+
+    def register(self, key: str, image: HmtImage) -> None:
+        """
+        Register an image under the key
+
+        An image registered again under the same key keeps its key code,
+        and is uploaded again the next time it is printed.
+
+        Parameters
+        ----------
+        key : str
+            key to print the image by with HmtStoredImage
+        image : HmtImage
+            image to store. its style is applied when it is uploaded.
+        """
+        limit = (
+            MAX_NV_BIT_IMAGES
+            if self.memory is HmtGraphicsMemory.nv_bit_image
+            else MAX_KEY_CODES
+        )
+        if key not in self._images and len(self._images) >= limit:
+            raise HmtValueException(
+                f"no more than {limit} images can be stored "
+                f"in {self.memory.value} memory"
+            )
+        with self._lock:
+            self._images[key] = image
+            self._definitions.pop(key, None)
+            self._resident.pop(key, None)
+
+    def key_code(self, key: str) -> bytes:
+        """
+        Code the image is stored under in the printer
+        """
+        if key not in self._images:
+            raise HmtValueException(f"image {key} is not stored")
+        index = list(self._images).index(key)
+        if self.memory is HmtGraphicsMemory.nv_bit_image:
+            return bytes([index + 1])
+        return bytes(
+            [
+                KEY_CODE_FIRST + index // KEY_CODE_RANGE,
+                0x20 + index % KEY_CODE_RANGE,
+            ]
+        )
+
+    @staticmethod
+    def keys_in(sequence: Iterable[Printable]) -> List[str]:
+        """
+        Keys of the stored images printed by the sequence, in order
+        """
+        keys = (
+            elem.key for elem in sequence if isinstance(elem, HmtStoredImage)
+        )
+        return list(dict.fromkeys(keys))
+
+    def missing(self, keys: Iterable[str], connection: int) -> List[str]:
+        """
+        Keys of the images to upload before printing them
+
+        Parameters
+        ----------
+        keys : Iterable[str]
+            keys of the images to print
+        connection : int
+            id of the connection the images are printed on
+
+        Returns
+        -------
+        keys : List[str]
+            keys of the images not stored in the printer.
+            all images for nv_bit_image, which are defined at once.
+        """
+        missing = []
+        for key in keys:
+            if key not in self._images:
+                raise HmtValueException(f"image {key} is not stored")
+            if not self._is_resident(key, connection):
+                missing.append(key)
+        if missing and self.memory is HmtGraphicsMemory.nv_bit_image:
+            return list(self._images)
+        return missing
+
+    def define(self, keys: Iterable[str]) -> bytes:
+        """
+        ESC/POS commands that upload the images to the printer
+        """
+        keys = list(keys)
+        if self.memory is HmtGraphicsMemory.nv_bit_image:
+            # FS q replaces all NV bit images at once
+            images = [self._definition(key) for key in self._images]
+            return FS + b"q" + bytes([len(images)]) + b"".join(images)
+        return b"".join(self._definition(key) for key in keys)
+
+    def loaded(self, keys: Iterable[str], connection: int) -> None:
+        """
+        Remember that the images were uploaded on the connection
+        """
+        with self._lock:
+            for key in keys:
+                self._resident[key] = connection
+                self.uploads += 1
+
+    def forget(self) -> None:
+        """
+        Upload every image again the next time it is printed
+        """
+        with self._lock:
+            self._resident.clear()
+
+    def print_command(self, image: HmtStoredImage) -> bytes:
+        """
+        ESC/POS command that prints the stored image
+        """
+        code = self.key_code(image.key)
+        style = image.properties
+        if self.memory is HmtGraphicsMemory.nv_bit_image:
+            mode = int(style.double_width) | int(style.double_height) << 1
+            return FS + b"p" + code + bytes([mode])
+        fn = b"E" if self.memory is HmtGraphicsMemory.nv else b"U"
+        scale = bytes(
+            [1 + int(style.double_width), 1 + int(style.double_height)]
+        )
+        return _graphics_command(fn, code + scale)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.value,
+            "images": len(self._images),
+            "resident": len(self._resident),
+            "uploads": self.uploads,
+        }
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        State sent to render workers, which only print stored images.
+        Images are left out, as they are uploaded by this process.
+        """
+        return {
+            "paper_width": self.paper_width,
+            "uploads": self.uploads,
+            "_memory": self._memory,
+            "_images": OrderedDict.fromkeys(self._images),
+            "_definitions": {},
+            "_resident": {},
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _is_resident(self, key: str, connection: int) -> bool:
+        loaded = self._resident.get(key)
+        if loaded is None:
+            return False
+        return self.memory is not HmtGraphicsMemory.download or (
+            loaded == connection
+        )
+
+    def _definition(self, key: str) -> bytes:
+        definition = self._definitions.get(key)
+        if definition is not None:
+            return definition
+
+        # numpy is imported when the first image is stored, not before
+        from .printables import HmtRaster
+
+        image = self._images[key]
+        style = image.properties
+        raster = HmtRaster.from_image(
+            image.image_src,
+            paper_width=self.paper_width,
+            center=style.center,
+            dither=style.dither,
+            threshold=style.threshold,
+        )
+        if self.memory is HmtGraphicsMemory.nv_bit_image:
+            definition = _nv_bit_image(raster)
+        else:
+            fn = b"C" if self.memory is HmtGraphicsMemory.nv else b"S"
+            definition = _graphics_command(
+                fn,
+                b"0"
+                + self.key_code(key)
+                + b"\x01"
+                + _int_low_high(raster.width)
+                + _int_low_high(raster.height)
+                + b"1"
+                + raster.to_raster_format(),
+            )
+        with self._lock:
+            self._definitions[key] = definition
+        return definition
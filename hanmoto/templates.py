@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+from string import Formatter
+from threading import Lock
+from typing import Any, Iterable, List, Mapping, Set, Union
+from weakref import WeakKeyDictionary
+
+from .compiler import HmtCompiler
+from .exceptions import HmtValueException
+from .printables import HmtImage, HmtRaw, HmtStoredImage, HmtText, Printable
+
+
+class HmtTemplateSection(object):
+    """
+    Part of a template repeated for each item of a list variable.
+    ...
+
+    Placeholders in the section are filled with the fields of the item,
+    and with the variables of the template for the fields it lacks.
+
+    Attributes
+    ----------
+    name : str
+        name of the list variable
+    contents : List[TemplateContent]
+        contents repeated for each item
+
+    Parameters
+    ----------
+    name : str
+        name of the list variable
+    contents : Iterable[TemplateContent]
+        contents repeated for each item
+    """
+
+    def __init__(self, name: str, contents: Iterable[TemplateContent]) -> None:
+        self.name = name
+        self.contents = list(contents)
+
+    def __repr__(self) -> str:
+        return (
+            f"<{self.__class__.__name__} name={self.name} "
+            f"contents={self.contents}>"
+        )
+
+
+TemplateContent = Union[Printable, HmtTemplateSection]
+
+
+class _CompiledSection(object):
+    def __init__(self, name: str, parts: List[_Part]) -> None:
+        self.name = name
+        self.parts = parts
+
+
+_Part = Union[Printable, _CompiledSection]
+
+
+def _fields(text: str) -> List[str]:
+    try:
+        return [field for _, field, _, _ in Formatter().parse(text) if field]
+    except ValueError as e:
+        raise HmtValueException(f"text {text!r} is not a valid template: {e}")
+
+
+class HmtTemplate(object):
+    """
+    Named sequence whose static parts are compiled once.
+    ...
+
+    Texts of a template may have placeholders in the str.format syntax,
+    e.g. "total: {total:>8}", which are filled with the variables given
+    to fill. Sections are repeated for each item of a list variable.
+    Images and texts without placeholders are compiled the first time
+    the template is filled for a printer, and are sent as precompiled
+    commands afterwards, so only the placeholders are rendered per job.
+
+    Attributes
+    ----------
+    name : str
+        name of the template
+    contents : List[TemplateContent]
+        printables and sections of the template
+    variables : Set[str]
+        names of the variables used outside of sections
+
+    Parameters
+    ----------
+    name : str
+        name of the template
+    contents : Iterable[TemplateContent]
+        printables and sections of the template
+    """
+
+    def __init__(self, name: str, contents: Iterable[TemplateContent]) -> None:
+        self.name = name
+        self.contents = list(contents)
+        self.variables: Set[str] = set()
+        self._collect_variables(self.contents)
+        self._compiled: WeakKeyDictionary[
+            HmtCompiler, List[_Part]
+        ] = WeakKeyDictionary()
+        self._lock = Lock()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} name={self.name}>"
+
+    def fill(
+        self, compiler: HmtCompiler, variables: Mapping[str, Any]
+    ) -> List[Printable]:
+        """
+        Sequence of the template filled with the variables
+
+        Parameters
+        ----------
+        compiler : HmtCompiler
+            compiler of the printer the sequence is printed with
+        variables : Mapping[str, Any]
+            values of the placeholders, and lists of Dict for sections
+
+        Returns
+        -------
+        sequence : List[Printable]
+            precompiled static parts and the filled texts
+        """
+        with self._lock:
+            parts = self._compiled.get(compiler)
+            if parts is None:
+                parts = self._compile(compiler, self.contents)
+                self._compiled[compiler] = parts
+        sequence: List[Printable] = []
+        self._fill(parts, variables, sequence)
+        return sequence
+
+    def _collect_variables(
+        self, contents: List[TemplateContent], top: bool = True
+    ) -> None:
+        for content in contents:
+            if isinstance(content, HmtTemplateSection):
+                if top:
+                    self.variables.add(content.name)
+                # placeholders of sections are mostly fields of the items
+                self._collect_variables(content.contents, top=False)
+            elif isinstance(content, HmtText):
+                fields = _fields(content.text)
+                if top:
+                    self.variables.update(
+                        field.split(".")[0].split("[")[0] for field in fields
+                    )
+
+    def _compile(
+        self, compiler: HmtCompiler, contents: List[TemplateContent]
+    ) -> List[_Part]:
+        parts: List[_Part] = []
+        static: List[Printable] = []
+
+        def flush() -> None:
+            if static:
+                parts.append(HmtRaw(compiler.compile_part(static)))
+                static.clear()
+
+        for content in contents:
+            if isinstance(content, HmtText) and not _fields(content.text):
+                # unescape {{ and }}
+                static.append(
+                    HmtText(content.text.format(), content.properties)
+                )
+            elif isinstance(content, (HmtImage, HmtRaw)):
+                static.append(content)
+            else:
+                flush()
+                if isinstance(content, HmtTemplateSection):
+                    parts.append(
+                        _CompiledSection(
+                            content.name,
+                            self._compile(compiler, content.contents),
+                        )
+                    )
+                else:
+                    # stored images are left to print_sequence,
+                    # which uploads them when they are not in the printer
+                    parts.append(content)
+        flush()
+        return parts
+
+    def _fill(
+        self,
+        parts: List[_Part],
+        variables: Mapping[str, Any],
+        sequence: List[Printable],
+    ) -> None:
+        for part in parts:
+            if isinstance(part, _CompiledSection):
+                for item in self._items(part.name, variables):
+                    self._fill(part.parts, {**variables, **item}, sequence)
+            elif isinstance(part, HmtText):
+                sequence.append(
+                    HmtText(
+                        self._format(part.text, variables), part.properties
+                    )
+                )
+            elif isinstance(part, HmtStoredImage):
+                sequence.append(HmtStoredImage(part.key, part.properties))
+            else:
+                sequence.append(part)
+
+    def _items(
+        self, name: str, variables: Mapping[str, Any]
+    ) -> List[Mapping[str, Any]]:
+        items = variables.get(name)
+        if items is None:
+            raise HmtValueException(
+                f"variable {name} of template {self.name} is not given"
+            )
+        if not isinstance(items, list) or not all(
+            isinstance(item, Mapping) for item in items
+        ):
+            raise HmtValueException(
+                f"variable {name} of template {self.name} "
+                "must be a list of objects"
+            )
+        return items
+
+    def _format(self, text: str, variables: Mapping[str, Any]) -> str:
+        try:
+            return text.format_map(variables)
+        except KeyError as e:
+            raise HmtValueException(
+                f"variable {e.args[0]} of template {self.name} is not given"
+            )
+        except (AttributeError, IndexError, TypeError, ValueError) as e:
+            raise HmtValueException(
+                f"text {text!r} of template {self.name} cannot be filled: {e}"
+            )
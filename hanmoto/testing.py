@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import argparse
+import re
+import socket
+import struct
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Callable, List, Optional, Set, Tuple, Type
+
+from .status import HmtPrinterStatus
+
+logger = getLogger(__name__)
+
+
+class FakePrinterServer(object):
+    """
+    Stand-in ESC/POS network printer for load testing.
+    ...
+
+    Listens on TCP like a printer on port 9100, and drains what it
+    receives no faster than bandwidth bytes per second through a small
+    receive buffer, so writers feel the back pressure of a real printer.
+    Latency, stalls and connection resets can be injected while clients
+    are writing. Everything received is recorded in arrival order.
+    Status requests (DLE EOT) are answered with the status, and automatic
+    status back is sent on changes once enabled with GS a. While the
+    status is not ready, received data is held like in the buffer of a
+    printer, and reading stops when recv_buffer bytes are held.
+
+    Attributes
+    ----------
+    received : bytearray
+        ESC/POS stream received from all connections
+    connections : int
+        number of connections accepted
+    status : HmtPrinterStatus
+        status the printer reports
+
+    Parameters
+    ----------
+    host : str, optional
+        address to listen on
+    port : int, optional
+        port to listen on. a free port is chosen if 0.
+    bandwidth : int, optional
+        bytes per second the printer drains. unlimited if None.
+    latency : float, optional
+        seconds to wait before every read
+    recv_buffer : int, optional
+        size of the socket receive buffer in bytes
+    chunk_size : int, optional
+        bytes read at a time
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        bandwidth: Optional[int] = None,
+        latency: float = 0.0,
+        recv_buffer: int = 4096,
+        chunk_size: int = 256,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.recv_buffer = recv_buffer
+        self.chunk_size = chunk_size
+        self.received = bytearray()
+        self.connections = 0
+        self.status = HmtPrinterStatus()
+        self._held = bytearray()
+        self._asb_clients: Set[socket.socket] = set()
+        self._sending = threading.Lock()
+        self._received = threading.Condition()
+        self._clients: List[socket.socket] = []
+        self._stalled_until = 0.0
+        self._reset_at: Optional[int] = None
+        self._server: Optional[socket.socket] = None
+        self._threads: List[threading.Thread] = []
+        self._closing = threading.Event()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.host, self.port
+
+    @property
+    def output(self) -> bytes:
+        with self._received:
+            return bytes(self.received)
+
+    def start(self) -> FakePrinterServer:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # accepted connections inherit the buffer size of the listener
+        server.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer
+        )
+        server.bind((self.host, self.port))
+        server.listen()
+        self.port = server.getsockname()[1]
+        self._server = server
+        self._closing.clear()
+        self._spawn(self._accept)
+        return self
+
+    def stop(self) -> None:
+        self._closing.set()
+        server, self._server = self._server, None
+        if server is not None:
+            self._wake(server)
+            server.close()
+        for client in list(self._clients):
+            self._wake(client)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def clear(self) -> None:
+        with self._received:
+            self.received.clear()
+
+    def set_status(self, **changes: bool) -> None:
+        """
+        Change the status, e.g. set_status(paper_out=True).
+        Held data is printed when the printer is ready again.
+        """
+        self.status = self.status.copy(update=changes)
+        if self.status.ready:
+            with self._received:
+                self.received += self._held
+                self._held.clear()
+                self._received.notify_all()
+        for client in list(self._asb_clients):
+            self._send(client, self.status.to_asb())
+
+    def wait_for(self, size: int, timeout: float = 5.0) -> bool:
+        """
+        Wait until size bytes are received in total.
+        """
+        with self._received:
+            return self._received.wait_for(
+                lambda: len(self.received) >= size, timeout
+            )
+
+    def stall(self, seconds: float) -> None:
+        """
+        Stop reading for seconds, like a printer out of paper.
+        """
+        self._stalled_until = time.monotonic() + seconds
+
+    def reset(self) -> None:
+        """
+        Reset every open connection, like a printer that is power-cycled.
+        """
+        for client in list(self._clients):
+            self._wake(client)
+
+    def reset_after(self, size: int) -> None:
+        """
+        Reset the connection once size bytes are received in total.
+        """
+        self._reset_at = size
+
+    def _spawn(self, target: Callable[..., None], *args: Any) -> None:
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _accept(self) -> None:
+        assert self._server is not None
+        server = self._server
+        while not self._closing.is_set():
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            self._clients.append(client)
+            self.connections += 1
+            self._spawn(self._serve, client)
+
+    def _serve(self, client: socket.socket) -> None:
+        tail = b""
+        try:
+            while not self._closing.is_set():
+                self._wait_stall()
+                self._wait_ready()
+                if self.latency:
+                    time.sleep(self.latency)
+                data = client.recv(self.chunk_size)
+                if not data:
+                    break
+                # a stall set while blocked in recv holds the data back
+                self._wait_stall()
+                stream = tail + data
+                self._answer(client, stream, len(tail))
+                tail = stream[-2:]
+                with self._received:
+                    if self.status.ready:
+                        self.received += data
+                    else:
+                        self._held += data
+                    self._received.notify_all()
+                    reset = (
+                        self._reset_at is not None
+                        and len(self.received) >= self._reset_at
+                    )
+                if reset:
+                    self._reset_at = None
+                    break
+                if self.bandwidth:
+                    time.sleep(len(data) / self.bandwidth)
+        except OSError as e:
+            logger.debug(f"fake printer connection error: {e}")
+        finally:
+            self._clients.remove(client)
+            self._asb_clients.discard(client)
+            self._abort(client)
+
+    def _answer(self, client: socket.socket, stream: bytes, seen: int) -> None:
+        """
+        Answer DLE EOT and GS a in the stream, except the ones that end
+        in the first seen bytes, which were answered with earlier data.
+        """
+        for match in re.finditer(
+            rb"\x10\x04([\x01-\x04])|\x1da(.)", stream, re.DOTALL
+        ):
+            if match.end() <= seen:
+                continue
+            request, asb = match.groups()
+            if request is not None:
+                n = request[0]
+                self._send(client, self.status.to_replies()[n - 1 : n])
+            elif asb != b"\x00":
+                self._asb_clients.add(client)
+            else:
+                self._asb_clients.discard(client)
+
+    def _send(self, client: socket.socket, data: bytes) -> None:
+        with self._sending:
+            try:
+                client.sendall(data)
+            except OSError as e:
+                logger.debug(f"fake printer cannot send status: {e}")
+
+    def _wait_ready(self) -> None:
+        """
+        Stop reading while the printer is not ready and its buffer is full
+        """
+        while (
+            not self.status.ready
+            and len(self._held) >= self.recv_buffer
+            and not self._closing.is_set()
+        ):
+            time.sleep(0.05)
+
+    def _wait_stall(self) -> None:
+        stall = self._stalled_until - time.monotonic()
+        while stall > 0 and not self._closing.is_set():
+            time.sleep(min(stall, 0.1))
+            stall = self._stalled_until - time.monotonic()
+
+    @staticmethod
+    def _wake(device: socket.socket) -> None:
+        """
+        Make the blocked accept or recv of the socket return.
+        """
+        try:
+            device.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _abort(client: socket.socket) -> None:
+        """
+        Close with RST instead of FIN, as a printer that lost power.
+        """
+        try:
+            client.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+        except OSError:
+            pass
+        client.close()
+
+    def __enter__(self) -> FakePrinterServer:
+        return self.start()
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m hanmoto.testing",
+        description="fake ESC/POS network printer for load testing",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument(
+        "--bandwidth", type=int, help="bytes per second the printer drains"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds before every read"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="file to save the received stream to"
+    )
+    args = parser.parse_args()
+
+    server = FakePrinterServer(
+        args.host, args.port, bandwidth=args.bandwidth, latency=args.latency
+    )
+    with server:
+        print(f"fake printer is listening on {args.host}:{server.port}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    print(
+        f"received {len(server.received)} bytes "
+        f"on {server.connections} connections"
+    )
+    if args.output is not None:
+        args.output.write_bytes(server.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Any, Deque, Dict, List, Optional, Type, Union
+
+from .config import HmtTraceConf, HmtTraceSinkType
+from .exceptions import HmtValueException
+
+_current_span: ContextVar[Optional[HmtSpan]] = ContextVar(
+    "hanmoto_span", default=None
+)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header: str) -> Optional[Dict[str, str]]:
+    """
+    Trace id and parent span id of a W3C traceparent header.
+    """
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return {"trace_id": parts[1], "parent_id": parts[2]}
+
+
+class HmtSpan(object):
+    """
+    Timed operation of a trace.
+    ...
+
+    A span is a context manager. While it is open, it is the current
+    span of the context and becomes the parent of spans opened in it.
+    It is passed to the sinks of the tracer when it is closed.
+
+    Attributes
+    ----------
+    name : str
+        name of the operation
+    trace_id : str
+        id shared by the spans of a trace, 32 hex digits
+    span_id : str
+        id of the span, 16 hex digits
+    parent_id : str, optional
+        span id of the parent span
+    start : float
+        unix time when the span was opened
+    duration : float
+        seconds the span was open
+    attributes : Dict[str, Any]
+        attributes of the operation
+    error : str, optional
+        exception raised in the span
+    """
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "duration",
+        "attributes",
+        "error",
+        "_started",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: HmtTracer,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Dict[str, Any],
+    ) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.start = 0.0
+        self.duration = 0.0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self._started = 0.0
+        self._token: Any = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def __enter__(self) -> HmtSpan:
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        if exc_value is not None:
+            self.error = f"{exc_value.__class__.__name__}: {exc_value}"
+        self.tracer.emit(self)
+
+
+class HmtNoopSpan(HmtSpan):
+    """
+    Span returned while tracing is disabled. It records nothing.
+    """
+
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        ...
+
+    def set(self, **attributes: Any) -> None:
+        ...
+
+    def __enter__(self) -> HmtSpan:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        ...
+
+
+NOOP_SPAN = HmtNoopSpan()
+
+
+class HmtSpanSink(ABC):
+    """
+    Base class of destinations of closed spans.
+    """
+
+    @abstractmethod
+    def emit(self, span: HmtSpan) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class HmtJsonlSink(HmtSpanSink):
+    """
+    Sink that writes a span per line as json.
+
+    Parameters
+    ----------
+    file : str, Path or IO[str]
+        path of the file to append to, or a text stream
+    """
+
+    def __init__(self, file: Union[str, Path, IO[str]]) -> None:
+        if isinstance(file, (str, Path)):
+            self.stream: IO[str] = open(file, "a", encoding="utf-8")
+            self._owned = True
+        else:
+            self.stream = file
+            self._owned = False
+        self._lock = threading.Lock()
+
+    def emit(self, span: HmtSpan) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def close(self) -> None:
+        if self._owned:
+            self.stream.close()
+
+
+class HmtRingBufferSink(HmtSpanSink):
+    """
+    Sink that keeps the latest spans in memory.
+
+    Parameters
+    ----------
+    size : int, optional
+        number of spans kept. the oldest spans are dropped first.
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        self.spans: Deque[HmtSpan] = deque(maxlen=size)
+
+    def emit(self, span: HmtSpan) -> None:
+        self.spans.append(span)
+
+    def traces(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Kept spans grouped by trace, oldest trace first.
+        """
+        traces: OrderedDict[str, List[Dict[str, Any]]] = OrderedDict()
+        for span in sorted(list(self.spans), key=lambda span: span.start):
+            if trace_id is not None and span.trace_id != trace_id:
+                continue
+            traces.setdefault(span.trace_id, []).append(span.to_dict())
+        return [
+            {"trace_id": key, "spans": spans} for key, spans in traces.items()
+        ]
+
+
+class HmtOpenTelemetrySink(HmtSpanSink):
+    """
+    Sink that exports spans through the OpenTelemetry API.
+
+    Spans keep their trace id. The span ids are given by OpenTelemetry,
+    so the hanmoto span and parent ids are kept as attributes.
+    Requires the opentelemetry-api package and a configured provider.
+    """
+
+    def __init__(self) -> None:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise HmtValueException(
+                "opentelemetry-api is needed to export spans to OpenTelemetry"
+            )
+        self._trace = trace
+        self._tracer = trace.get_tracer("hanmoto")
+
+    def emit(self, span: HmtSpan) -> None:
+        trace = self._trace
+        parent = trace.NonRecordingSpan(
+            trace.SpanContext(
+                trace_id=int(span.trace_id, 16),
+                span_id=int(span.parent_id or span.span_id, 16),
+                is_remote=True,
+            )
+        )
+        attributes = {
+            key: value
+            for key, value in span.attributes.items()
+            if isinstance(value, (str, bool, int, float))
+        }
+        attributes["hanmoto.span_id"] = span.span_id
+        if span.parent_id is not None:
+            attributes["hanmoto.parent_id"] = span.parent_id
+        otel_span = self._tracer.start_span(
+            span.name,
+            context=trace.set_span_in_context(parent),
+            start_time=int(span.start * 1e9),
+            attributes=attributes,
+        )
+        if span.error is not None:
+            otel_span.set_status(trace.Status(trace.StatusCode.ERROR))
+            otel_span.set_attribute("error.message", span.error)
+        otel_span.end(end_time=int((span.start + span.duration) * 1e9))
+
+
+class HmtTracer(object):
+    """
+    Tracer that opens spans and passes them to sinks.
+    ...
+
+    Tracing is off by default. While it is off, span returns a shared
+    span that does nothing, so the hooks cost a call and a flag check.
+
+    Attributes
+    ----------
+    enabled : bool
+        spans are recorded only while True
+    sinks : List[HmtSpanSink]
+        destinations of closed spans
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.sinks: List[HmtSpanSink] = []
+
+    def enable(self, *sinks: HmtSpanSink) -> None:
+        self.sinks = list(sinks)
+        self.enabled = bool(self.sinks)
+
+    def disable(self) -> None:
+        self.enabled = False
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+    def current(self) -> Optional[HmtSpan]:
+        return _current_span.get()
+
+    def span(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        **attributes: Any,
+    ) -> HmtSpan:
+        """
+        Open a span under the current span of the context
+
+        Parameters
+        ----------
+        name : str
+            name of the operation
+        trace_id : str, optional
+            trace to join when there is no current span,
+            e.g. carried by a request or a job. a new trace if None.
+        parent_id : str, optional
+            parent span id used with trace_id
+        attributes : Any
+            attributes of the operation
+
+        Returns
+        -------
+        span : HmtSpan
+            span to use as a context manager
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        current = _current_span.get()
+        if current is not None:
+            trace_id, parent_id = current.trace_id, current.span_id
+        elif trace_id is None:
+            trace_id, parent_id = new_trace_id(), None
+        return HmtSpan(self, name, trace_id, parent_id, attributes)
+
+    def emit(self, span: HmtSpan) -> None:
+        for sink in self.sinks:
+            sink.emit(span)
+
+    def ring_buffer(self) -> Optional[HmtRingBufferSink]:
+        for sink in self.sinks:
+            if isinstance(sink, HmtRingBufferSink):
+                return sink
+        return None
+
+
+tracer = HmtTracer()
+
+
+def configure(conf: HmtTraceConf) -> HmtTracer:
+    """
+    Set up the tracer with the sinks of the config
+    """
+    tracer.disable()
+    if not conf.enabled:
+        return tracer
+    sinks: List[HmtSpanSink] = []
+    for sink_type in conf.sinks:
+        if sink_type is HmtTraceSinkType.ring_buffer:
+            sinks.append(HmtRingBufferSink(conf.buffer_size))
+        elif sink_type is HmtTraceSinkType.jsonl:
+            sinks.append(HmtJsonlSink(conf.path))
+        elif sink_type is HmtTraceSinkType.opentelemetry:
+            sinks.append(HmtOpenTelemetrySink())
+    tracer.enable(*sinks)
+    return tracer
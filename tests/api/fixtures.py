@@ -2,12 +2,27 @@ from typing import Generator
 from unittest.mock import MagicMock
 
 import pytest
+from fastapi.testclient import TestClient
 from pytest_mock import MockFixture
 
+from hanmoto.aio import AsyncHanmoto
+from hanmoto.api import get_job_queue, load_app
+from tests.util import create_test_hmtconf
+
+
+@pytest.fixture(scope="module")
+def client() -> Generator[TestClient, None, None]:
+    app = load_app(create_test_hmtconf())
+    with TestClient(app) as client:
+        yield client
+
 
 @pytest.fixture
-def patch_printer(mocker: MockFixture) -> Generator[MagicMock, None, None]:
-    mocked_printer = mocker.patch("hanmoto.api.printer")
+def patch_printer(
+    client: TestClient, mocker: MockFixture
+) -> Generator[MagicMock, None, None]:
+    mocked_printer = mocker.patch.object(
+        get_job_queue(), "printer", spec=AsyncHanmoto
+    )
 
-    mocked_printer.__enter__.side_effect = None
     yield mocked_printer
@@ -0,0 +1,159 @@
+import json
+from typing import Any, Dict, List
+from unittest.mock import MagicMock
+
+from fastapi.testclient import TestClient
+from starlette.testclient import WebSocketTestSession
+
+from tests.api.fixtures import client, patch_printer
+
+TRANSITIONS = ["queued", "rendering", "sending", "done"]
+
+
+def parse_events(text: str) -> List[Dict[str, Any]]:
+    events = []
+    for message in text.split("\n\n"):
+        fields = dict(
+            line.split(": ", 1)
+            for line in message.splitlines()
+            if line and not line.startswith(":")
+        )
+        if fields:
+            event = json.loads(fields["data"])
+            assert fields["event"] == event["type"]
+            assert int(fields["id"]) == event["id"]
+            events.append(event)
+    return events
+
+
+def receive_until_finished(
+    websocket: WebSocketTestSession,
+) -> List[Dict[str, Any]]:
+    messages = []
+    while True:
+        message = websocket.receive_json()
+        messages.append(message)
+        if message["type"] == "event" and message["event"]["type"] in (
+            "done",
+            "failed",
+        ):
+            return messages
+
+
+def test_job_events(client: TestClient, patch_printer: MagicMock) -> None:
+    job_id = client.post(
+        "/print/text",
+        json={"content": "test_job_events"},
+        headers={"X-Client-Id": "register1"},
+    ).json()["job_id"]
+
+    # the stream of given jobs ends when they are finished
+    response = client.get("/jobs/events", params={"job_id": job_id})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert [event["type"] for event in events] == TRANSITIONS
+    assert {event["job_id"] for event in events} == {job_id}
+    assert {event["client"] for event in events} == {"register1"}
+    elapsed = [event["elapsed"] for event in events]
+    assert elapsed[0] == 0 and elapsed == sorted(elapsed)
+
+    # resumed after the last event the client has received
+    response = client.get(
+        "/jobs/events",
+        params={"job_id": job_id},
+        headers={"Last-Event-ID": str(events[1]["id"])},
+    )
+    assert parse_events(response.text) == events[2:]
+
+
+def test_job_events_failed(
+    client: TestClient, patch_printer: MagicMock
+) -> None:
+    patch_printer.print_sequence.side_effect = OSError("printer is gone")
+    job_id = client.post("/print/text", json={"content": "failed"}).json()[
+        "job_id"
+    ]
+
+    response = client.get("/jobs/events", params={"job_id": job_id})
+
+    *_, failed = parse_events(response.text)
+    assert failed["type"] == "failed"
+    assert failed["error"] == "OSError: printer is gone"
+
+
+def test_job_events_not_found(client: TestClient) -> None:
+    response = client.get("/jobs/events", params={"job_id": "unknown"})
+    assert response.status_code == 404
+
+    response = client.get("/jobs/events", params={"printer": "unknown"})
+    assert response.status_code == 404
+
+
+def test_job_socket(client: TestClient, patch_printer: MagicMock) -> None:
+    with client.websocket_connect(
+        "/jobs/ws", headers={"X-Client-Id": "register2"}
+    ) as websocket:
+        websocket.send_json(
+            {
+                "type": "print",
+                "ref": "order-42",
+                "contents": [{"type": "text", "content": "test_job_socket"}],
+                "priority": "high",
+            }
+        )
+        messages = receive_until_finished(websocket)
+
+    (submitted,) = [m for m in messages if m["type"] == "submitted"]
+    assert submitted["ref"] == "order-42"
+    assert submitted["status"] == "queued"
+    events = [m["event"] for m in messages if m["type"] == "event"]
+    assert [event["type"] for event in events] == TRANSITIONS
+    assert {event["job_id"] for event in events} == {submitted["job_id"]}
+    assert {event["client"] for event in events} == {"register2"}
+
+    job = client.get(f"/jobs/{submitted['job_id']}").json()
+    assert job["priority"] == "high"
+
+
+def test_job_socket_watch(
+    client: TestClient, patch_printer: MagicMock
+) -> None:
+    job_id = client.post("/print/text", json={"content": "watched"}).json()[
+        "job_id"
+    ]
+
+    with client.websocket_connect("/jobs/ws") as websocket:
+        websocket.send_json({"type": "watch", "job_ids": [job_id]})
+        messages = receive_until_finished(websocket)
+
+    assert messages[0] == {
+        "type": "watching",
+        "ref": None,
+        "job_ids": [job_id],
+    }
+    events = [m["event"] for m in messages if m["type"] == "event"]
+    assert [event["type"] for event in events] == TRANSITIONS
+
+
+def test_job_socket_errors(client: TestClient) -> None:
+    with client.websocket_connect("/jobs/ws") as websocket:
+        websocket.send_text("not json")
+        assert websocket.receive_json() == {
+            "type": "error",
+            "status": 422,
+            "detail": "message is not a json object",
+        }
+
+        websocket.send_json(
+            {"type": "print", "ref": 1, "contents": [{"type": "barcode"}]}
+        )
+        error = websocket.receive_json()
+        assert error["ref"] == 1
+        assert error["status"] == 422
+        assert error["detail"][0]["loc"] == ["body", "contents", 0]
+
+        websocket.send_json({"type": "watch", "job_ids": ["unknown"]})
+        error = websocket.receive_json()
+        assert error["status"] == 404
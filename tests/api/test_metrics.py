@@ -0,0 +1,33 @@
+from fastapi.testclient import TestClient
+
+from tests.api.fixtures import client
+from tests.util import wait_for_job
+
+
+def test_metrics(client: TestClient) -> None:
+    response = client.post(
+        "/print/sequence",
+        json={"contents": [{"type": "text", "content": "test_metrics"}]},
+    )
+    assert wait_for_job(client, response)["status"] == "done"
+    client.post("/print/sequence", json={"contents": [{"content": "x"}]})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for line in (
+        "# TYPE hanmoto_stage_seconds histogram",
+        'hanmoto_stage_seconds_count{printer="default",stage="parse"}',
+        'hanmoto_stage_seconds_count{printer="default",stage="decode"}',
+        'hanmoto_stage_seconds_count{printer="default",stage="queue"}',
+        'hanmoto_stage_seconds_count{printer="default",stage="send"}',
+        'hanmoto_bytes_sent_total{printer="default"}',
+        'hanmoto_jobs_total{printer="default",status="done"}',
+        'hanmoto_errors_total{printer="default",'
+        'exception="HmtWebAPISequenceException"}',
+        'hanmoto_jobs_queued{printer="default"} 0',
+        'hanmoto_jobs_in_flight{printer="default"} 0',
+        'hanmoto_printer_online{printer="default"} 1',
+    ):
+        assert line in body
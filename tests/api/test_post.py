@@ -1,10 +1,11 @@
 import base64
+import json
 from io import BytesIO
-from typing import Generator
 from unittest.mock import MagicMock
 
 import pytest
 from fastapi.testclient import TestClient
+from httpx import Response
 from PIL import Image
 from pytest_mock import MockerFixture
 
@@ -12,20 +13,20 @@ from hanmoto import (
     HmtImage,
     HmtImageImpl,
     HmtImageStyle,
+    HmtStoredImage,
     HmtText,
     HmtTextStyle,
+    api,
 )
-from hanmoto.api import load_app
+from hanmoto.aio import HmtAsyncDummy
 from hanmoto.exceptions import HmtWebAPISequenceException
-from tests.api.fixtures import patch_printer
-from tests.util import create_test_hmtconf, get_resource_path
+from tests.api.fixtures import client, patch_printer
+from tests.util import get_resource_path, wait_for_job
 
-conf = create_test_hmtconf()
-app = load_app(conf)
-client = TestClient(app)
 
-
-def test_simple_text(patch_printer: MagicMock, mocker: MockerFixture) -> None:
+def test_simple_text(
+    client: TestClient, patch_printer: MagicMock, mocker: MockerFixture
+) -> None:
     content = "This is a test.\nこんにちは！"
     response = client.post(
         "/print/text",
@@ -35,13 +36,14 @@ def test_simple_text(patch_printer: MagicMock, mocker: MockerFixture) -> None:
     )
 
     calls = [
-        mocker.call.__enter__(),
+        mocker.call.__aenter__(),
         mocker.call.print_sequence([HmtText(content)]),
-        mocker.call.__exit__(None, None, None),
+        mocker.call.__aexit__(None, None, None),
     ]
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert wait_for_job(client, response)["status"] == "done"
     patch_printer.assert_has_calls(calls)
-    assert response.status_code == 200
-    assert response.json() == {"status": "success"}
 
 
 @pytest.mark.parametrize(
@@ -65,6 +67,7 @@ def test_simple_text(patch_printer: MagicMock, mocker: MockerFixture) -> None:
     ),
 )
 def test_text_with_style(
+    client: TestClient,
     patch_printer: MagicMock,
     mocker: MockerFixture,
     style: HmtTextStyle,
@@ -79,17 +82,18 @@ def test_text_with_style(
     )
 
     calls = [
-        mocker.call.__enter__(),
+        mocker.call.__aenter__(),
         mocker.call.print_sequence([HmtText(content, properties=style)]),
-        mocker.call.__exit__(None, None, None),
+        mocker.call.__aexit__(None, None, None),
     ]
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert wait_for_job(client, response)["status"] == "done"
     patch_printer.assert_has_calls(calls)
-    assert response.status_code == 200
-    assert response.json() == {"status": "success"}
 
 
 def test_simple_image_base64(
-    patch_printer: MagicMock, mocker: MockerFixture
+    client: TestClient, patch_printer: MagicMock, mocker: MockerFixture
 ) -> None:
     img_path = get_resource_path("salt.png")
     base64_str = base64.b64encode(img_path.read_bytes()).decode("utf-8")
@@ -102,13 +106,14 @@ def test_simple_image_base64(
         },
     )
     calls = [
-        mocker.call.__enter__(),
+        mocker.call.__aenter__(),
         mocker.call.print_sequence([HmtImage(pil_image)]),
-        mocker.call.__exit__(None, None, None),
+        mocker.call.__aexit__(None, None, None),
     ]
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert wait_for_job(client, response)["status"] == "done"
     patch_printer.assert_has_calls(calls)
-    assert response.status_code == 200
-    assert response.json() == {"status": "success"}
 
 
 @pytest.mark.parametrize(
@@ -128,7 +133,10 @@ def test_simple_image_base64(
     ),
 )
 def test_image_base64_with_style(
-    patch_printer: MagicMock, mocker: MockerFixture, style: HmtImageStyle
+    client: TestClient,
+    patch_printer: MagicMock,
+    mocker: MockerFixture,
+    style: HmtImageStyle,
 ) -> None:
     img_path = get_resource_path("salt.png")
     base64_str = base64.b64encode(img_path.read_bytes()).decode("utf-8")
@@ -139,16 +147,19 @@ def test_image_base64_with_style(
         json={"base64": base64_str, "style": style.dict()},
     )
     calls = [
-        mocker.call.__enter__(),
+        mocker.call.__aenter__(),
         mocker.call.print_sequence([HmtImage(pil_image, properties=style)]),
-        mocker.call.__exit__(None, None, None),
+        mocker.call.__aexit__(None, None, None),
     ]
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert wait_for_job(client, response)["status"] == "done"
     patch_printer.assert_has_calls(calls)
-    assert response.status_code == 200
-    assert response.json() == {"status": "success"}
 
 
-def test_sequence(patch_printer: MagicMock, mocker: MockerFixture) -> None:
+def test_sequence(
+    client: TestClient, patch_printer: MagicMock, mocker: MockerFixture
+) -> None:
     img_path = get_resource_path("salt.png")
     base64_str = base64.b64encode(img_path.read_bytes()).decode("utf-8")
     pil_image = Image.open(BytesIO(base64.b64decode(base64_str)))
@@ -165,18 +176,42 @@ def test_sequence(patch_printer: MagicMock, mocker: MockerFixture) -> None:
         },
     )
     calls = [
-        mocker.call.__enter__(),
+        mocker.call.__aenter__(),
         mocker.call.print_sequence(
             [HmtImage(pil_image), HmtText(text_content)]
         ),
-        mocker.call.__exit__(None, None, None),
+        mocker.call.__aexit__(None, None, None),
+    ]
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+    assert wait_for_job(client, response)["status"] == "done"
+    patch_printer.assert_has_calls(calls)
+
+
+def test_stored_image(
+    client: TestClient, patch_printer: MagicMock, mocker: MockerFixture
+) -> None:
+    response = client.post(
+        "/print/sequence",
+        json={
+            "contents": [
+                {
+                    "type": "stored_image",
+                    "key": "logo",
+                    "style": {"double_width": True},
+                },
+            ]
+        },
+    )
+    calls = [
+        mocker.call.print_sequence([HmtStoredImage("logo").double_width()]),
     ]
+    assert response.status_code == 202
+    assert wait_for_job(client, response)["status"] == "done"
     patch_printer.assert_has_calls(calls)
-    assert response.status_code == 200
-    assert response.json() == {"status": "success"}
 
 
-def test_sequence_invalidate() -> None:
+def test_sequence_invalidate(client: TestClient) -> None:
     img_path = get_resource_path("salt.png")
     base64_str = base64.b64encode(img_path.read_bytes()).decode("utf-8")
 
@@ -194,3 +229,254 @@ def test_sequence_invalidate() -> None:
 
     assert response.status_code == 422
     assert "has no 'type' field." in response.json()["detail"]
+
+
+def test_failed_job(
+    client: TestClient, patch_printer: MagicMock, mocker: MockerFixture
+) -> None:
+    patch_printer.print_sequence.side_effect = OSError("printer is offline")
+    response = client.post("/print/text", json={"content": "failure"})
+
+    job = wait_for_job(client, response)
+    assert job["status"] == "failed"
+    assert job["error"] == "OSError: printer is offline"
+    patch_printer.__aexit__.assert_called_once()
+
+
+def test_unknown_job(client: TestClient) -> None:
+    response = client.get("/jobs/unknown")
+
+    assert response.status_code == 404
+
+
+def printed_output(client: TestClient, response: Response) -> bytes:
+    assert response.status_code == 202, response.text
+    assert wait_for_job(client, response)["status"] == "done"
+    transport = api.get_job_queue().printer.transport
+    assert isinstance(transport, HmtAsyncDummy)
+    output = transport.output
+    transport.printer.clear()
+    return output
+
+
+def test_image_raw_body(client: TestClient) -> None:
+    image_src = get_resource_path("salt.png")
+    expected = api.get_job_queue().printer.compile(
+        [HmtImage(image_src, properties=HmtImageStyle(center=True))]
+    )
+
+    response = client.post(
+        "/print/image",
+        params={"style": '{"center": true}'},
+        content=image_src.read_bytes(),
+        headers={"content-type": "image/png"},
+    )
+
+    assert expected in printed_output(client, response)
+
+
+def test_image_multipart(client: TestClient) -> None:
+    image_src = get_resource_path("salt.png")
+    expected = api.get_job_queue().printer.compile([HmtImage(image_src)])
+
+    response = client.post(
+        "/print/image",
+        files={"image": ("salt.png", image_src.read_bytes(), "image/png")},
+    )
+
+    assert expected in printed_output(client, response)
+
+
+def test_image_downscaled(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        api.get_job_queue().printer.compiler, "paper_width", 384
+    )
+    data = BytesIO()
+    Image.new("RGB", (2000, 1000), (0, 0, 0)).save(data, format="JPEG")
+    expected = api.get_job_queue().printer.compile(
+        [HmtImage(Image.new("L", (384, 192), 0))]
+    )
+
+    response = client.post(
+        "/print/image",
+        content=data.getvalue(),
+        headers={"content-type": "image/jpeg"},
+    )
+
+    assert expected in printed_output(client, response)
+
+
+def test_sequence_multipart(client: TestClient) -> None:
+    image_src = get_resource_path("salt.png")
+    expected = api.get_job_queue().printer.compile(
+        [HmtText("receipt"), HmtImage(image_src)]
+    )
+    sequence = {
+        "contents": [
+            {"type": "text", "content": "receipt"},
+            {"type": "image", "upload": "logo"},
+        ]
+    }
+
+    response = client.post(
+        "/print/sequence",
+        data={"sequence": json.dumps(sequence)},
+        files={"logo": ("salt.png", image_src.read_bytes(), "image/png")},
+    )
+
+    assert expected in printed_output(client, response)
+
+
+def test_upload_errors(client: TestClient) -> None:
+    response = client.post(
+        "/print/sequence",
+        data={
+            "sequence": json.dumps(
+                {"contents": [{"type": "image", "upload": "logo"}]}
+            )
+        },
+        files={"other": ("salt.png", b"", "image/png")},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == "file 'logo' is not uploaded"
+
+    response = client.post(
+        "/print/image",
+        content=b"not an image",
+        headers={"content-type": "image/png"},
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        "/print/image",
+        content=b"text",
+        headers={"content-type": "text/plain"},
+    )
+    assert response.status_code == 415
+
+
+def test_batch(
+    client: TestClient, patch_printer: MagicMock, mocker: MockerFixture
+) -> None:
+    response = client.post(
+        "/print/batch",
+        json={
+            "items": [
+                {"contents": [{"type": "text", "content": "first"}]},
+                {"contents": [{"type": "image"}]},
+                {
+                    "contents": [{"type": "text", "content": "second"}],
+                    "cut": False,
+                },
+            ]
+        },
+    )
+
+    assert response.status_code == 202
+    body = response.json()
+    first, invalid, second = body["items"]
+    assert invalid == {"status": "failed", "error": "Specify image source"}
+    assert first["status"] == second["status"] == "queued"
+    for item in (first, second):
+        job = client.get(f"/jobs/{item['job_id']}").json()
+        assert job["batch_id"] == body["batch_id"]
+    assert wait_for_job(client, second["job_id"])["status"] == "done"
+    patch_printer.assert_has_calls(
+        [
+            mocker.call.__aenter__(),
+            mocker.call.print_sequence([HmtText("first")], mocker.ANY),
+            mocker.call.cut(),
+            mocker.call.print_sequence([HmtText("second")], mocker.ANY),
+            mocker.call.__aexit__(None, None, None),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "data", ["!!notb64", base64.b64encode(b"not an image").decode()]
+)
+def test_batch_bad_image(
+    client: TestClient, patch_printer: MagicMock, data: str
+) -> None:
+    response = client.post(
+        "/print/batch",
+        json={
+            "items": [
+                {"contents": [{"type": "image", "base64": data}]},
+                {"contents": [{"type": "text", "content": "valid"}]},
+            ]
+        },
+    )
+
+    assert response.status_code == 202
+    invalid, valid = response.json()["items"]
+    assert invalid["status"] == "failed"
+    assert invalid["error"].startswith("image cannot be decoded")
+    assert valid["status"] == "queued"
+    assert wait_for_job(client, valid["job_id"])["status"] == "done"
+
+
+def test_sequence_unknown_type(client: TestClient) -> None:
+    response = client.post(
+        "/print/sequence",
+        json={
+            "contents": [
+                {"type": "text", "content": "first"},
+                {"type": "barcode", "content": "0123"},
+            ]
+        },
+    )
+
+    assert response.status_code == 422
+    (error,) = response.json()["detail"]
+    assert error["loc"] == ["body", "contents", 1]
+    assert error["type"] == (
+        "value_error.discriminated_union.invalid_discriminator"
+    )
+
+
+def test_sequence_invalid_json(client: TestClient) -> None:
+    response = client.post(
+        "/print/sequence",
+        content=b'{"contents": [',
+        headers={"content-type": "application/json"},
+    )
+
+    assert response.status_code == 422
+    assert response.json()["detail"] == "body is not valid json"
+
+
+def test_priority(client: TestClient, patch_printer: MagicMock) -> None:
+    response = client.post(
+        "/print/text",
+        json={"content": "urgent"},
+        headers={"X-Priority": "high", "X-Client-Id": "register1"},
+    )
+    job = wait_for_job(client, response)
+    assert job["priority"] == "high"
+    assert job["client"] == "register1"
+
+    # the priority of the body wins over the header
+    response = client.post(
+        "/print/sequence",
+        json={
+            "contents": [{"type": "text", "content": "report"}],
+            "priority": "low",
+        },
+        headers={"X-Priority": "high"},
+    )
+    job = wait_for_job(client, response)
+    assert job["priority"] == "low"
+    assert job["client"] == "testclient"
+
+    response = client.post(
+        "/print/text",
+        json={"content": "urgent"},
+        headers={"X-Priority": "urgent"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == (
+        "x-priority must be one of high, normal, low"
+    )
@@ -0,0 +1,110 @@
+import time
+from typing import Generator
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+
+from hanmoto import HmtPrinterConf, HmtPrinterType, HmtText, api
+from hanmoto.aio import AsyncHanmoto
+from hanmoto.api import load_app
+from hanmoto.config import HmtConf, HmtPoolConf, HmtPoolStrategy
+from tests.util import wait_for_job
+
+
+@pytest.fixture(scope="module")
+def client() -> Generator[TestClient, None, None]:
+    conf = HmtConf(
+        printers=[
+            HmtPrinterConf(name=name, printer_type=HmtPrinterType.dummy)
+            for name in ("kitchen1", "kitchen2")
+        ],
+        pools=[
+            HmtPoolConf(
+                name="kitchen",
+                printers=["kitchen1", "kitchen2"],
+                strategy=HmtPoolStrategy.round_robin,
+            )
+        ],
+    )
+    with TestClient(load_app(conf)) as client:
+        yield client
+
+
+def test_print_on_named_printer(
+    client: TestClient, mocker: MockerFixture
+) -> None:
+    patched_printer: MagicMock = mocker.patch.object(
+        api.registry.queues["kitchen2"], "printer", spec=AsyncHanmoto
+    )
+    response = client.post(
+        "/printers/kitchen2/print/text", json={"content": "order 1"}
+    )
+
+    job = wait_for_job(client, response)
+    assert job["status"] == "done"
+    assert job["printer"] == "kitchen2"
+    patched_printer.print_sequence.assert_called_once_with(
+        [HmtText("order 1")]
+    )
+
+
+def test_print_on_pool(client: TestClient) -> None:
+    printers = set()
+    for i in range(2):
+        response = client.post(
+            "/printers/kitchen/print/text", json={"content": f"order {i}"}
+        )
+        printers.add(wait_for_job(client, response)["printer"])
+
+    assert printers == {"kitchen1", "kitchen2"}
+
+
+def test_unknown_printer(client: TestClient) -> None:
+    response = client.post(
+        "/printers/unknown/print/text", json={"content": "order"}
+    )
+
+    assert response.status_code == 404
+
+
+def test_get_printers(client: TestClient) -> None:
+    response = client.get("/printers")
+
+    assert response.status_code == 200
+    assert response.json()["default"] == "kitchen1"
+    assert response.json()["pools"] == {
+        "kitchen": {
+            "strategy": "round_robin",
+            "printers": ["kitchen1", "kitchen2"],
+        }
+    }
+
+
+def test_backlog(client: TestClient, mocker: MockerFixture) -> None:
+    queue = api.registry.queues["kitchen1"]
+    mocker.patch.object(queue, "max_backlog", 0)
+
+    response = client.post(
+        "/printers/kitchen1/print/text", json={"content": "order"}
+    )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+    mocker.patch.object(queue, "_offline_until", time.monotonic() + 30)
+    response = client.post(
+        "/printers/kitchen1/print/text", json={"content": "order"}
+    )
+
+    assert response.status_code == 503
+    assert 29 <= int(response.headers["Retry-After"]) <= 30
+
+
+def test_get_printer_status(client: TestClient) -> None:
+    response = client.get("/printers/kitchen1/status")
+
+    assert response.status_code == 200
+    assert response.json() == {"online": True, "load": 0, "status": None}
+    assert client.get("/printers/unknown/status").status_code == 404
@@ -0,0 +1,82 @@
+from fastapi.testclient import TestClient
+
+from hanmoto import HmtText, api
+from hanmoto.aio import HmtAsyncDummy
+from tests.api.fixtures import client
+from tests.util import wait_for_job
+
+TEMPLATE = {
+    "contents": [
+        {"type": "text", "content": "Hanmoto store\n"},
+        {
+            "type": "section",
+            "name": "items",
+            "contents": [
+                {"type": "text", "content": "{name:<10}{price:>6}\n"}
+            ],
+        },
+        {"type": "text", "content": "total {total:>10}\n"},
+    ]
+}
+
+
+def test_print_template(client: TestClient) -> None:
+    response = client.put("/templates/receipt", json=TEMPLATE)
+    assert response.status_code == 200
+    assert response.json() == {
+        "name": "receipt",
+        "variables": ["items", "total"],
+    }
+    assert client.get("/templates").json() == {
+        "templates": {"receipt": {"variables": ["items", "total"]}}
+    }
+
+    response = client.post(
+        "/print/template/receipt",
+        json={
+            "variables": {
+                "items": [{"name": "apple", "price": 120}],
+                "total": 120,
+            }
+        },
+    )
+
+    assert response.status_code == 202
+    assert wait_for_job(client, response)["status"] == "done"
+    transport = api.get_job_queue().printer.transport
+    assert isinstance(transport, HmtAsyncDummy)
+    compiler = api.get_job_queue().printer.compiler
+    assert compiler.compile_part([HmtText("Hanmoto store\n")]) in (
+        transport.output
+    )
+    assert b"apple        120\n" in transport.output
+    assert b"total        120\n" in transport.output
+    transport.printer.clear()
+
+
+def test_template_errors(client: TestClient) -> None:
+    response = client.post("/print/template/unknown", json={})
+    assert response.status_code == 404
+
+    client.put("/templates/receipt", json=TEMPLATE)
+    response = client.post(
+        "/print/template/receipt", json={"variables": {"items": []}}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == (
+        "variable total of template receipt is not given"
+    )
+
+    response = client.put(
+        "/templates/broken",
+        json={"contents": [{"type": "text", "content": "{total"}]},
+    )
+    assert response.status_code == 422
+
+    response = client.put(
+        "/templates/broken",
+        json={"contents": [{"type": "image", "base64": "!!notb64"}]},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("image cannot be decoded")
+    assert "broken" not in client.get("/templates").json()["templates"]
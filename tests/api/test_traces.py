@@ -0,0 +1,49 @@
+from typing import Generator
+
+import pytest
+from fastapi.testclient import TestClient
+
+from hanmoto.tracing import HmtRingBufferSink, tracer
+from tests.api.fixtures import client
+from tests.util import wait_for_job
+
+
+@pytest.fixture
+def tracing() -> Generator[None, None, None]:
+    tracer.enable(HmtRingBufferSink())
+    yield
+    tracer.disable()
+
+
+def test_traces_disabled(client: TestClient) -> None:
+    response = client.get("/debug/traces")
+    assert response.status_code == 404
+
+
+def test_traces(client: TestClient, tracing: None) -> None:
+    response = client.post(
+        "/print/sequence",
+        json={"contents": [{"type": "text", "content": "test_traces"}]},
+        headers={
+            "traceparent": (
+                "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+            )
+        },
+    )
+    trace_id = response.headers["x-trace-id"]
+    assert trace_id == "0af7651916cd43dd8448eb211c80319c"
+    assert wait_for_job(client, response)["status"] == "done"
+
+    response = client.get("/debug/traces", params={"trace_id": trace_id})
+    assert response.status_code == 200
+    traces = response.json()["traces"]
+    assert len(traces) == 1
+    spans = traces[0]["spans"]
+    names = [span["name"] for span in spans]
+    for name in ("request", "validate", "to_hmt", "job", "compile", "send"):
+        assert name in names
+    ids = {span["span_id"]: span for span in spans}
+    job = spans[names.index("job")]
+    assert ids[job["parent_id"]]["name"] == "request"
+    compile_span = spans[names.index("compile")]
+    assert compile_span["parent_id"] == job["span_id"]
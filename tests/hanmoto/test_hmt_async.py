@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from escpos.printer import Dummy
+
+from hanmoto import AsyncHanmoto, HmtText
+from hanmoto.aio import HmtAsyncDummy
+from hanmoto.exceptions import HmtValueException
+from hanmoto.localizer import HmtLocalizerEnum
+from tests.util import create_test_hmtconf
+
+
+def expected_cut() -> bytes:
+    printer = Dummy()
+    printer.cut()
+    return printer.output
+
+
+def test_print_sequence_dummy() -> None:
+    hmt = AsyncHanmoto.from_conf(create_test_hmtconf())
+    sequence = [HmtText("test_print_sequence_dummy")]
+
+    async def print_sequence() -> None:
+        async with hmt:
+            await hmt.print_sequence(sequence)
+
+    asyncio.run(print_sequence())
+
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    assert hmt.transport.output == hmt.compile(sequence) + expected_cut()
+
+
+class BrokenDummy(HmtAsyncDummy):
+    async def write(self, data: bytes) -> None:
+        raise ConnectionResetError("connection reset by printer")
+
+
+def test_no_cut_after_connection_error() -> None:
+    transport = HmtAsyncDummy()
+    hmt = AsyncHanmoto(transport, HmtLocalizerEnum.en)
+
+    async def print_sequence() -> None:
+        async with hmt:
+            await hmt.print_sequence([HmtText("partial")])
+            raise ConnectionResetError("connection reset by printer")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(print_sequence())
+
+    # the receipt is printed again in full when the job is retried
+    assert not transport.output.endswith(expected_cut())
+
+
+def test_failed_cut_keeps_error() -> None:
+    hmt = AsyncHanmoto(BrokenDummy(), HmtLocalizerEnum.en)
+
+    async def print_sequence() -> None:
+        async with hmt:
+            raise HmtValueException("image unknown is not stored")
+
+    with pytest.raises(HmtValueException):
+        asyncio.run(print_sequence())
+
+
+def test_print_sequence_network() -> None:
+    sequence = [HmtText("test_print_sequence_network")]
+    received = bytearray()
+
+    async def print_sequence() -> AsyncHanmoto:
+        closed = asyncio.Event()
+
+        async def handle(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            received.extend(await reader.read())
+            writer.close()
+            closed.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        hmt = AsyncHanmoto.from_network("en", "127.0.0.1", port)
+        async with hmt:
+            await hmt.print_sequence(sequence)
+        await hmt.close()
+        await asyncio.wait_for(closed.wait(), 5)
+        server.close()
+        await server.wait_closed()
+        return hmt
+
+    hmt = asyncio.run(print_sequence())
+
+    assert bytes(received) == hmt.compile(sequence) + expected_cut()
@@ -0,0 +1,32 @@
+from escpos.printer import Dummy
+
+from hanmoto import Hanmoto, HmtImage, HmtText
+from tests.hanmoto.fixtures import dummy_hmt
+from tests.util import get_resource_path
+
+
+def test_compile(dummy_hmt: Hanmoto) -> None:
+    image_src = get_resource_path("salt.png")
+    text_content = "test_compile"
+    expected = Dummy()
+    expected.image(
+        image_src,
+        **HmtImage(image_src).properties.dict(
+            exclude={"dither", "threshold", "optimize"}
+        ),
+    )
+    expected.set(**HmtText(text_content).properties.dict())
+    expected.text(text_content)
+
+    program = dummy_hmt.compile([HmtImage(image_src), HmtText(text_content)])
+
+    assert program == expected.output
+    assert dummy_hmt.printer._output_list == []
+
+
+def test_print_sequence_in_single_write(dummy_hmt: Hanmoto) -> None:
+    sequence = [HmtText(f"line {i}\n") for i in range(10)]
+
+    with dummy_hmt:
+        dummy_hmt.print_sequence(sequence)
+        assert dummy_hmt.printer._output_list == [dummy_hmt.compile(sequence)]
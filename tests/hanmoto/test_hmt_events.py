@@ -0,0 +1,97 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+
+from hanmoto.events import (
+    HmtJobEvent,
+    HmtJobEvents,
+    HmtJobEventType,
+    HmtJobSubscription,
+)
+from hanmoto.jobs import HmtJob
+
+
+async def drain(subscription: HmtJobSubscription) -> List[HmtJobEvent]:
+    events: List[HmtJobEvent] = []
+    while True:
+        try:
+            event: Optional[HmtJobEvent] = await subscription.get(0.01)
+        except asyncio.TimeoutError:
+            return events
+        assert event is not None
+        events.append(event)
+
+
+def test_filters() -> None:
+    jobs = [HmtJob(printer="kitchen", client=f"register{i}") for i in range(3)]
+
+    async def publish() -> None:
+        broker = HmtJobEvents()
+        everything = broker.subscribe()
+        register1 = broker.subscribe(client="register1")
+        job0 = broker.subscribe(job_ids=[jobs[0].id])
+        other = broker.subscribe(printer="bar")
+        for job in jobs:
+            broker.publish(job, HmtJobEventType.queued)
+        assert broker.subscribers == 4
+
+        assert [e.job_id for e in await drain(everything)] == [
+            job.id for job in jobs
+        ]
+        assert [e.job_id for e in await drain(register1)] == [jobs[1].id]
+        assert [e.job_id for e in await drain(job0)] == [jobs[0].id]
+        assert await drain(other) == []
+
+        for subscription in (everything, register1, job0, other):
+            subscription.close()
+        assert broker.subscribers == 0
+        assert await everything.get() is None
+
+    asyncio.run(publish())
+
+
+@pytest.mark.parametrize(
+    "history, expected",
+    [
+        (100, list(range(1, 51))),
+        (20, list(range(1, 9)) + list(range(31, 51))),
+    ],
+)
+def test_catch_up(history: int, expected: List[int]) -> None:
+    job = HmtJob(printer="kitchen")
+
+    async def publish() -> List[int]:
+        broker = HmtJobEvents(history=history, max_pending=8)
+        subscription = broker.subscribe()
+        # publishing does not wait for the subscriber falling behind
+        for _ in range(50):
+            broker.publish(job, HmtJobEventType.sending)
+        return [event.id for event in await drain(subscription)]
+
+    # caught up from the history, skipping events that have left it
+    assert asyncio.run(publish()) == expected
+
+
+def test_unfinished() -> None:
+    job = HmtJob(printer="kitchen")
+
+    async def publish() -> List[HmtJobEventType]:
+        broker = HmtJobEvents()
+        broker.publish(job, HmtJobEventType.queued)
+        subscription = broker.subscribe(job_ids=[job.id])
+        subscription.unfinished = {job.id}
+        broker.publish(job, HmtJobEventType.done)
+        broker.publish(HmtJob(printer="kitchen"), HmtJobEventType.queued)
+        types = []
+        while True:
+            event = await subscription.get(1)
+            if event is None:
+                return types
+            types.append(event.type)
+
+    # events of the job so far, then until the job is finished
+    assert asyncio.run(publish()) == [
+        HmtJobEventType.queued,
+        HmtJobEventType.done,
+    ]
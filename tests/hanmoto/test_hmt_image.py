@@ -1,10 +1,13 @@
-from pathlib import Path
+from io import BytesIO
 from unittest.mock import MagicMock
 
 import pytest
+from escpos.printer import Dummy
+from PIL import Image
 from pytest_mock import MockerFixture, MockFixture
 
-from hanmoto import Hanmoto, HmtImage
+from hanmoto import Hanmoto, HmtImage, HmtImageStyle, HmtRaster
+from hanmoto.cache import HmtImageCache
 from tests.hanmoto.fixtures import patched_escpos_printer
 from tests.util import (
     create_test_hmtconf,
@@ -18,18 +21,85 @@ def patched_hmt(mocker: MockFixture) -> Hanmoto:
     conf = create_test_hmtconf()
     htm = Hanmoto.from_conf(conf)
 
-    htm.printer = mocker.patch("escpos.printer.Escpos")
+    htm.printer = mocker.MagicMock()
     return htm
 
 
 def test_print_style(patched_hmt: Hanmoto, mocker: MockerFixture) -> None:
-    image_src = Path("salt.png").absolute()
-    hmt_image = HmtImage(get_resource_path(image_src))
+    image_src = get_resource_path("salt.png")
+    hmt_image = HmtImage(image_src)
+    expected = Dummy()
+    expected.image(
+        image_src,
+        **hmt_image.properties.dict(
+            exclude={"dither", "threshold", "optimize"}
+        )
+    )
     with patched_hmt:
         patched_hmt.print_sequence([hmt_image])
 
     calls = [
-        mocker.call.image(image_src, **hmt_image.properties.dict()),
+        mocker.call._raw(expected.output),
         mocker.call.cut(),
     ]
     patched_hmt.printer.assert_has_calls(calls)
+
+
+def test_image_cache(mocker: MockerFixture) -> None:
+    hmt = Hanmoto.from_conf(create_test_hmtconf())
+    image_src = get_resource_path("salt.png")
+    render = mocker.spy(HmtRaster, "from_image")
+
+    first = hmt.compile([HmtImage(image_src)])
+    second = hmt.compile([HmtImage.from_bytes(image_src.read_bytes())])
+
+    assert first == second
+    assert render.call_count == 1
+    assert hmt.image_cache.hits == 1
+    assert hmt.image_cache.misses == 1
+
+    hmt.compile([HmtImage(image_src, properties=HmtImageStyle(center=True))])
+    assert render.call_count == 2
+    assert len(hmt.image_cache) == 2
+
+
+def test_image_cache_eviction() -> None:
+    cache = HmtImageCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.size == 10
+
+    cache.put("d", b"12345678901")
+    assert cache.get("d") is None
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 2,
+        "entries": 2,
+        "size": 10,
+        "max_bytes": 10,
+    }
+
+
+def test_from_file() -> None:
+    image = Image.new("RGB", (1600, 800), (255, 255, 255))
+    data = BytesIO()
+    image.save(data, format="JPEG")
+    encoded = data.getvalue()
+
+    hmt_image = HmtImage.from_file(BytesIO(encoded), paper_width=384)
+
+    assert isinstance(hmt_image.image_src, Image.Image)
+    assert hmt_image.image_src.mode == "L"
+    assert hmt_image.image_src.size == (384, 192)
+    assert hmt_image.digest == HmtImage.from_bytes(encoded).digest
+
+    png = get_resource_path("salt.png").read_bytes()
+    with open(get_resource_path("salt.png"), "rb") as file:
+        assert HmtImage.from_file(file).digest == (
+            HmtImage.from_bytes(png).digest
+        )
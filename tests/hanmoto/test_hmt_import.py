@@ -0,0 +1,53 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+
+import hanmoto
+
+ROOT = Path(__file__).parents[2]
+
+
+def loaded_packages(code: str) -> List[str]:
+    script = (
+        f"{code}\nimport sys\n"
+        "print(' '.join({name.split('.')[0] for name in sys.modules}))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        text=True,
+    )
+    return result.stdout.split()
+
+
+@pytest.mark.parametrize(
+    "code, unloaded",
+    [
+        (
+            "from hanmoto import HmtText, HmtTextStyle",
+            ["escpos", "PIL", "numpy", "fastapi"],
+        ),
+        ("from hanmoto import HmtImage", ["escpos", "numpy", "fastapi"]),
+        (
+            "from hanmoto import HmtCompiler, HmtText\n"
+            "from hanmoto.localizer import HmtLocalizerEnum\n"
+            "HmtCompiler(HmtLocalizerEnum.en).compile([HmtText('hello')])",
+            ["numpy", "fastapi", "uvicorn"],
+        ),
+        ("import hanmoto.cli", ["escpos", "PIL", "fastapi", "uvicorn"]),
+    ],
+)
+def test_lazy_imports(code: str, unloaded: List[str]) -> None:
+    assert set(unloaded).isdisjoint(loaded_packages(code))
+
+
+def test_exports() -> None:
+    assert "HmtImage" in dir(hanmoto)
+    assert hanmoto.HmtImage is hanmoto.printables.HmtImage
+    with pytest.raises(AttributeError):
+        getattr(hanmoto, "HmtUnknown")
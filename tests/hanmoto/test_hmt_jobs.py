@@ -0,0 +1,93 @@
+import asyncio
+from typing import List, Union
+
+from escpos.printer import Dummy
+
+from hanmoto import AsyncHanmoto, Hanmoto, HmtStoredImage, HmtText
+from hanmoto.aio import HmtAsyncDummy
+from hanmoto.jobs import HmtJob, HmtJobQueue, HmtJobStatus
+from hanmoto.localizer import HmtLocalizerEnum
+
+SEQUENCES = [[HmtText(f"ticket {i}\n")] for i in range(3)]
+
+
+def print_batch(
+    hmt: Union[Hanmoto, AsyncHanmoto], cuts: List[bool]
+) -> List[HmtJob]:
+    async def submit() -> List[HmtJob]:
+        queue = HmtJobQueue(hmt)
+        await queue.start()
+        jobs = await queue.submit_batch(list(zip(SEQUENCES, cuts)))
+        await queue.join()
+        await queue.stop()
+        return jobs
+
+    return asyncio.run(submit())
+
+
+def expected_output(
+    hmt: Union[Hanmoto, AsyncHanmoto], cuts: List[bool]
+) -> bytes:
+    expected = Dummy()
+    for sequence, cut in zip(SEQUENCES, cuts):
+        expected._raw(hmt.compile(sequence))
+        if cut:
+            expected.cut()
+    return expected.output
+
+
+def test_batch() -> None:
+    hmt = AsyncHanmoto.from_dummy(HmtLocalizerEnum.en)
+
+    jobs = print_batch(hmt, [False, True, False])
+
+    assert [job.status for job in jobs] == [HmtJobStatus.done] * 3
+    assert len({job.batch_id for job in jobs}) == 1
+    assert jobs[0].batch_id is not None
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    # the session ends with a cut
+    assert hmt.transport.output == expected_output(hmt, [False, True, True])
+
+
+def test_batch_sync_printer() -> None:
+    hmt = Hanmoto.from_dummy(HmtLocalizerEnum.en)
+
+    jobs = print_batch(hmt, [True, True, True])
+
+    assert [job.status for job in jobs] == [HmtJobStatus.done] * 3
+    assert hmt.printer.output == expected_output(hmt, [True, True, True])
+    # the batch is committed in one session
+    assert len(hmt.printer._output_list) == 1
+
+
+def test_batch_item_failure() -> None:
+    hmt = AsyncHanmoto.from_dummy(HmtLocalizerEnum.en)
+
+    async def submit() -> List[HmtJob]:
+        queue = HmtJobQueue(hmt)
+        await queue.start()
+        jobs = await queue.submit_batch(
+            [
+                (SEQUENCES[0], True),
+                ([HmtStoredImage("unknown")], True),
+                (SEQUENCES[2], True),
+            ]
+        )
+        await queue.join()
+        await queue.stop()
+        return jobs
+
+    jobs = asyncio.run(submit())
+
+    assert [job.status for job in jobs] == [
+        HmtJobStatus.done,
+        HmtJobStatus.failed,
+        HmtJobStatus.done,
+    ]
+    assert jobs[1].error == "HmtValueException: image unknown is not stored"
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    expected = Dummy()
+    for sequence in (SEQUENCES[0], SEQUENCES[2]):
+        expected._raw(hmt.compile(sequence))
+        expected.cut()
+    assert hmt.transport.output == expected.output
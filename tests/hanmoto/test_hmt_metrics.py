@@ -0,0 +1,58 @@
+from hanmoto import Hanmoto, HmtImage, HmtText
+from hanmoto.metrics import BYTES_SENT, STAGE_SECONDS, HmtMetrics
+from tests.util import create_test_hmtconf, get_resource_path
+
+
+def test_exposition() -> None:
+    metrics = HmtMetrics()
+    counter = metrics.counter("test_total", "Test counter.", ("printer",))
+    histogram = metrics.histogram(
+        "test_seconds", "Test histogram.", ("stage",), buckets=(0.1, 1.0)
+    )
+    counter.inc(printer='kitchen "1"')
+    counter.inc(2, printer='kitchen "1"')
+    histogram.observe(0.05, stage="send")
+    histogram.observe(0.5, stage="send")
+    histogram.observe(5, stage="send")
+
+    assert metrics.expose() == (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{printer="kitchen \\"1\\""} 3\n'
+        "# HELP test_seconds Test histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{stage="send",le="0.1"} 1\n'
+        'test_seconds_bucket{stage="send",le="1"} 2\n'
+        'test_seconds_bucket{stage="send",le="+Inf"} 3\n'
+        'test_seconds_sum{stage="send"} 5.55\n'
+        'test_seconds_count{stage="send"} 3\n'
+    )
+
+
+def test_disabled() -> None:
+    metrics = HmtMetrics(enabled=False)
+    counter = metrics.counter("test_total", "Test counter.")
+    gauge = metrics.gauge(
+        "test_gauge", "Test gauge.", collect=lambda: [({}, 2.0)]
+    )
+    counter.inc()
+
+    assert counter.get() == 0
+    assert gauge.expose().endswith("test_gauge 2\n")
+
+
+def test_print_stages() -> None:
+    conf = create_test_hmtconf()
+    conf.printer_conf.name = "test_print_stages"
+    hmt = Hanmoto.from_conf(conf)
+    image = HmtImage(get_resource_path("salt.png"))
+
+    with hmt:
+        hmt.print_sequence([HmtText("test_print_stages"), image])
+
+    labels = {"printer": "test_print_stages"}
+    for stage in ("compile", "rasterize", "send", "cut"):
+        assert STAGE_SECONDS.count(**labels, stage=stage) == 1
+    assert BYTES_SENT.get(**labels) == len(
+        hmt.compile([HmtText("test_print_stages"), image])
+    )
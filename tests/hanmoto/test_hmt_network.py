@@ -0,0 +1,60 @@
+import socket
+import time
+from typing import Generator
+
+import pytest
+
+from hanmoto.connection import HmtNetwork
+
+
+@pytest.fixture
+def server() -> Generator[socket.socket, None, None]:
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    server.settimeout(5)
+    yield server
+    server.close()
+
+
+def test_lazy_connect(server: socket.socket) -> None:
+    printer = HmtNetwork("127.0.0.1", server.getsockname()[1])
+    assert printer.device is None
+    assert printer.connection_age is None
+
+    printer._raw(b"test_lazy_connect")
+    connection, _ = server.accept()
+
+    assert connection.recv(64) == b"test_lazy_connect"
+    assert printer.reconnects == 0
+    assert printer.connection_age is not None
+    connection.close()
+    printer.close()
+
+
+def test_reconnect_dead_connection(server: socket.socket) -> None:
+    printer = HmtNetwork("127.0.0.1", server.getsockname()[1])
+    printer._raw(b"first")
+    connection, _ = server.accept()
+    assert connection.recv(64) == b"first"
+    connection.close()
+    time.sleep(0.1)
+
+    assert not printer.is_alive()
+    printer._raw(b"second")
+    connection, _ = server.accept()
+
+    assert connection.recv(64) == b"second"
+    assert printer.reconnects == 1
+    connection.close()
+    printer.close()
+
+
+def test_connect_retries_exhausted(server: socket.socket) -> None:
+    port = server.getsockname()[1]
+    server.close()
+    printer = HmtNetwork("127.0.0.1", port, max_retries=2, retry_backoff=0.01)
+
+    with pytest.raises(ConnectionRefusedError):
+        printer._raw(b"test_connect_retries_exhausted")
+    assert printer.device is None
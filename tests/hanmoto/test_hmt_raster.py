@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+from escpos.printer import Dummy
+from PIL import Image
+
+from hanmoto import Hanmoto, HmtDither, HmtImage, HmtImageImpl, HmtRaster
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.metrics import IMAGE_BYTES
+from tests.util import create_test_hmtconf, get_resource_path
+
+
+@pytest.mark.parametrize("impl", list(HmtImageImpl))
+@pytest.mark.parametrize("high_density", [True, False])
+def test_same_as_escpos(impl: HmtImageImpl, high_density: bool) -> None:
+    image_src = get_resource_path("salt.png")
+    expected = Dummy()
+    expected.image(
+        image_src,
+        high_density_vertical=high_density,
+        high_density_horizontal=not high_density,
+        impl=impl.value,
+    )
+
+    raster = HmtRaster.from_image(image_src)
+    actual = raster.to_escpos(
+        impl.value,
+        high_density_vertical=high_density,
+        high_density_horizontal=not high_density,
+    )
+    assert actual == expected.output
+
+
+def test_resize_to_paper_width() -> None:
+    image = Image.new("RGB", (1200, 600), (0, 0, 0))
+    raster = HmtRaster.from_image(image, paper_width=576)
+    assert (raster.width, raster.height) == (576, 288)
+    assert raster.bits.all()
+
+    small = HmtRaster.from_image(
+        get_resource_path("salt.png"), paper_width=384, center=True
+    )
+    assert (small.width, small.height) == (384, 160)
+    assert not small.bits[:, :112].any()
+    assert not small.bits[:, 272:].any()
+
+
+def test_dither() -> None:
+    gradient = np.tile(np.arange(256, dtype=np.uint8), (16, 1))
+    image = Image.fromarray(gradient, mode="L")
+
+    none = HmtRaster.from_image(image, dither=HmtDither.none, threshold=100)
+    assert none.bits[:, :100].all()
+    assert not none.bits[:, 100:].any()
+
+    ordered = HmtRaster.from_image(image, dither=HmtDither.ordered)
+    coverage = ordered.bits.mean(axis=0)
+    assert coverage[0] == 1.0
+    assert coverage[-1] == 0.0
+    assert 0.4 < ordered.bits[:, 96:160].mean() < 0.6
+
+
+def test_fragments() -> None:
+    raster = HmtRaster(np.ones((100, 16), dtype=bool))
+    program = raster.to_escpos("bitImageRaster", fragment_height=40)
+    assert program.count(b"\x1dv0") == 3
+    assert len(program) == 3 * 8 + 100 * 2
+
+    wide = HmtRaster(np.ones((100, 8000), dtype=bool))
+    graphics = wide.to_escpos("graphics", fragment_height=100)
+    assert graphics.count(b"\x1d(L") == 2 * 2
+
+
+def test_compile_with_paper_width() -> None:
+    conf = create_test_hmtconf()
+    conf.printer_conf.paper_width = 384
+    hmt = Hanmoto.from_conf(conf)
+    image = Image.new("L", (768, 100), 0)
+
+    program = hmt.compile([HmtImage(image).threshold(128)])
+    assert program == HmtRaster(np.ones((50, 384), dtype=bool)).to_escpos()
+
+
+def render_raster_program(program: bytes, width: int) -> np.ndarray:
+    """
+    Dots printed by GS L, GS v 0 and ESC J commands in high density.
+    """
+    rows = []
+    margin = 0
+    pos = 0
+    while pos < len(program):
+        if program[pos : pos + 2] == b"\x1dL":
+            margin = int.from_bytes(program[pos + 2 : pos + 4], "little")
+            pos += 4
+        elif program[pos : pos + 2] == b"\x1bJ":
+            rows += [np.zeros(width, dtype=bool)] * program[pos + 2]
+            pos += 3
+        elif program[pos : pos + 3] == b"\x1dv0":
+            width_bytes = int.from_bytes(program[pos + 4 : pos + 6], "little")
+            height = int.from_bytes(program[pos + 6 : pos + 8], "little")
+            data = np.frombuffer(
+                program[pos + 8 : pos + 8 + width_bytes * height], np.uint8
+            )
+            bits = np.unpackbits(data.reshape(height, width_bytes), axis=1)
+            for row in bits.astype(bool):
+                line = np.zeros(width, dtype=bool)
+                printed = row[: width - margin]
+                line[margin : margin + len(printed)] = printed
+                rows.append(line)
+            pos += 8 + width_bytes * height
+        else:
+            raise AssertionError(f"unexpected command at {pos}")
+    return np.array(rows)
+
+
+def test_optimize() -> None:
+    bits = np.zeros((300, 384), dtype=bool)
+    bits[10:40, 100:180] = True
+    bits[41, 100:180] = True
+    bits[200:210, 150:300] = True
+    raster = HmtRaster(bits)
+
+    program = raster.to_escpos(
+        high_density_vertical=True, high_density_horizontal=True, optimize=True
+    )
+    assert np.array_equal(render_raster_program(program, 384), bits)
+    assert program.startswith(b"\x1dL\x64\x00")
+    assert program.endswith(b"\x1dL\x00\x00")
+    assert program.count(b"\x1dv0") == 2
+    assert len(program) < raster.escpos_size() // 10
+
+    blank = HmtRaster(np.zeros((100, 384), dtype=bool))
+    assert blank.to_escpos(optimize=True) == b"\x1bJ\xc8"
+
+
+def test_optimize_column() -> None:
+    bits = np.zeros((32, 64), dtype=bool)
+    bits[0:8, 8:16] = True
+    bits[24:32, 8:16] = True
+    program = HmtRaster(bits).to_escpos(
+        "bitImageColumn", high_density_horizontal=True, optimize=True
+    )
+    # the two blank bands in the middle are bare line feeds
+    assert program.count(b"\x1b*\x01") == 2
+    assert b"\x01\x08\x00" + b"\xff" * 8 + b"\n\n\n\x1b*" in program
+
+
+@pytest.mark.parametrize("impl", list(HmtImageImpl))
+@pytest.mark.parametrize("high_density", [True, False])
+def test_escpos_size(impl: HmtImageImpl, high_density: bool) -> None:
+    raster = HmtRaster.from_image(get_resource_path("salt.png"))
+    tall = HmtRaster(np.ones((2000, 300), dtype=bool))
+    for image in (raster, tall):
+        program = image.to_escpos(impl.value, high_density, high_density)
+        assert image.escpos_size(impl.value, high_density) == len(program)
+
+
+def test_compile_optimized() -> None:
+    hmt = Hanmoto.from_dummy(HmtLocalizerEnum.en, paper_width=384)
+    hmt.name = "test_compile_optimized"
+    image = Image.new("L", (384, 200), 255)
+    image.paste(0, (100, 50, 200, 100))
+
+    program = hmt.compile([HmtImage(image).optimize()])
+    raw = IMAGE_BYTES.get(printer=hmt.name, encoding="raw")
+    sent = IMAGE_BYTES.get(printer=hmt.name, encoding="sent")
+    assert raw == HmtRaster.from_image(image).escpos_size()
+    assert sent == len(program)
+    assert sent < raw // 5
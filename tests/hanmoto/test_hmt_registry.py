@@ -0,0 +1,54 @@
+from queue import Queue
+
+import pytest
+
+from hanmoto import HmtPrinterConf, HmtPrinterType
+from hanmoto.config import HmtConf, HmtPoolConf, HmtPoolStrategy
+from hanmoto.exceptions import HmtValueException
+from hanmoto.registry import HmtPrinterRegistry
+
+
+def create_registry(strategy: HmtPoolStrategy) -> HmtPrinterRegistry:
+    conf = HmtConf(
+        printers=[
+            HmtPrinterConf(name=name, printer_type=HmtPrinterType.dummy)
+            for name in ("a", "b", "c")
+        ],
+        pools=[
+            HmtPoolConf(
+                name="pool", printers=["a", "b", "c"], strategy=strategy
+            )
+        ],
+    )
+    return HmtPrinterRegistry.from_conf(conf)
+
+
+def test_route_by_name() -> None:
+    registry = create_registry(HmtPoolStrategy.round_robin)
+
+    assert registry.route().name == "a"
+    assert registry.route("b").name == "b"
+    with pytest.raises(HmtValueException):
+        registry.route("unknown")
+
+
+def test_round_robin_skips_offline_printer() -> None:
+    registry = create_registry(HmtPoolStrategy.round_robin)
+    registry.queues["b"]._offline_until = float("inf")
+
+    names = [registry.route("pool").name for _ in range(4)]
+
+    assert names == ["a", "c", "c", "a"]
+
+
+def test_least_busy() -> None:
+    registry = create_registry(HmtPoolStrategy.least_busy)
+    for name, load in (("a", 2), ("b", 0), ("c", 1)):
+        pending: Queue = Queue()
+        for _ in range(load):
+            pending.put_nowait(None)
+        registry.queues[name]._queue = pending  # type: ignore
+
+    assert registry.route("pool").name == "b"
+    registry.queues["b"]._offline_until = float("inf")
+    assert registry.route("pool").name == "c"
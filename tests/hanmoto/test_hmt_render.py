@@ -0,0 +1,90 @@
+import asyncio
+import pickle
+from typing import List
+
+from escpos.printer import Dummy
+from PIL import Image
+
+from hanmoto import (
+    AsyncHanmoto,
+    Hanmoto,
+    HmtImage,
+    HmtPrinterConf,
+    HmtPrinterType,
+    HmtStoredImage,
+    HmtText,
+)
+from hanmoto.aio import HmtAsyncDummy
+from hanmoto.config import HmtConf, HmtRenderConf
+from hanmoto.jobs import HmtJob, HmtJobQueue, HmtJobStatus
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.registry import HmtPrinterRegistry
+from hanmoto.render import HmtRenderPool
+from tests.util import get_resource_path
+
+
+def test_pickle_compiler() -> None:
+    hmt = Hanmoto.from_dummy(HmtLocalizerEnum.jp, paper_width=384)
+    hmt.store_image("logo", HmtImage(Image.new("L", (8, 8), 0)))
+    sequence = [
+        HmtStoredImage("logo"),
+        HmtText("こんにちは"),
+        HmtImage(get_resource_path("salt.png")),
+    ]
+
+    compiler = pickle.loads(pickle.dumps(hmt.compiler))
+
+    assert compiler.image_cache is None
+    assert compiler.compile(sequence) == hmt.compile(sequence)
+
+
+def test_render_ahead() -> None:
+    hmt = AsyncHanmoto.from_dummy(HmtLocalizerEnum.en, paper_width=384)
+    sequences = [
+        [HmtText(f"job {i}"), HmtImage(get_resource_path("salt.png"))]
+        for i in range(6)
+    ]
+    expected = Dummy()
+    for sequence in sequences:
+        expected._raw(hmt.compile(sequence))
+        expected.cut()
+
+    async def print_jobs() -> List[HmtJob]:
+        pool = HmtRenderPool(workers=2)
+        queue = HmtJobQueue(hmt, render_pool=pool)
+        await queue.start()
+        jobs = [await queue.submit(sequence) for sequence in sequences]
+        # the jobs at the head of the queue are compiled right away
+        assert len(queue._renders) == 2
+        await queue.join()
+        await queue.stop()
+        pool.shutdown()
+        return jobs
+
+    jobs = asyncio.run(print_jobs())
+
+    assert [job.status for job in jobs] == [HmtJobStatus.done] * 6
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    assert hmt.transport.output == expected.output
+
+
+def test_render_error() -> None:
+    conf = HmtConf(
+        printers=[HmtPrinterConf(printer_type=HmtPrinterType.dummy)],
+        render_conf=HmtRenderConf(workers=1),
+    )
+    registry = HmtPrinterRegistry.from_conf(conf)
+
+    async def print_job() -> HmtJob:
+        await registry.start()
+        queue = registry.route()
+        job = await queue.submit([HmtStoredImage("unknown")])
+        await queue.join()
+        await registry.stop()
+        return job
+
+    job = asyncio.run(print_job())
+
+    assert registry.render_pool is not None
+    assert job.status is HmtJobStatus.failed
+    assert job.error == "HmtValueException: image unknown is not stored"
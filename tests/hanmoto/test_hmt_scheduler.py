@@ -0,0 +1,89 @@
+import asyncio
+from typing import Generator, List, Optional
+
+import pytest
+
+from hanmoto.jobs import HmtJob
+from hanmoto.scheduler import HmtJobScheduler, HmtPriority
+
+
+@pytest.fixture(autouse=True)
+def loop() -> Generator[asyncio.AbstractEventLoop, None, None]:
+    # asyncio.Queue takes the current event loop when created
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def job(
+    name: str,
+    priority: HmtPriority = HmtPriority.normal,
+    client: str = "",
+    batch_id: Optional[str] = None,
+) -> HmtJob:
+    return HmtJob(id=name, priority=priority, client=client, batch_id=batch_id)
+
+
+def take(scheduler: HmtJobScheduler) -> List[str]:
+    taken = []
+    while not scheduler.empty():
+        taken.append(scheduler.get_nowait().id)
+    return taken
+
+
+def test_priority() -> None:
+    scheduler = HmtJobScheduler()
+    scheduler.put_nowait(job("low", HmtPriority.low))
+    scheduler.put_nowait(job("normal"))
+    scheduler.put_nowait(job("high", HmtPriority.high))
+
+    assert scheduler.qsize() == 3
+    assert [job.id for job in scheduler.upcoming(2)] == ["high", "normal"]
+    assert take(scheduler) == ["high", "normal", "low"]
+
+
+def test_fair_share() -> None:
+    scheduler = HmtJobScheduler(fair_share=2)
+    scheduler.put_nowait(job("low", HmtPriority.low))
+    for i in range(4):
+        scheduler.put_nowait(job(f"high{i}", HmtPriority.high))
+
+    # the low priority job is not starved by the high priority ones
+    assert take(scheduler) == ["high0", "high1", "low", "high2", "high3"]
+
+
+def test_clients() -> None:
+    scheduler = HmtJobScheduler(client_weights={"pos": 2})
+    for i in range(4):
+        scheduler.put_nowait(job(f"bulk{i}", client="bulk"))
+    for i in range(4):
+        scheduler.put_nowait(job(f"pos{i}", client="pos"))
+    scheduler.put_nowait(job("kiosk0", client="kiosk"))
+
+    assert take(scheduler) == [
+        "bulk0",
+        "pos0",
+        "kiosk0",
+        "pos1",
+        "bulk1",
+        "pos2",
+        "pos3",
+        "bulk2",
+        "bulk3",
+    ]
+
+
+def test_batch() -> None:
+    scheduler = HmtJobScheduler()
+    scheduler.put_nowait(job("batch0", client="a", batch_id="batch"))
+    scheduler.put_nowait(job("batch1", client="a", batch_id="batch"))
+    scheduler.put_nowait(job("batch2", client="a", batch_id="batch"))
+    scheduler.put_nowait(job("other", client="b"))
+
+    assert scheduler.get_nowait().id == "batch0"
+    assert scheduler.remaining() == 2
+    # a high priority job waits for the rest of the batch
+    scheduler.put_nowait(job("high", HmtPriority.high))
+    assert take(scheduler) == ["batch1", "batch2", "high", "other"]
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+from escpos.printer import Dummy
+from PIL import Image
+
+from hanmoto import Hanmoto, HmtImage, HmtStoredImage, HmtText
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.testing import FakePrinterServer
+from tests.hanmoto.fixtures import dummy_hmt
+
+
+def test_session(dummy_hmt: Hanmoto) -> None:
+    first, second = [HmtText("first\n")], [HmtText("second\n")]
+    expected = Dummy()
+    expected._raw(dummy_hmt.compile(first))
+    expected.cut()
+    expected._raw(dummy_hmt.compile(second))
+    expected.cut()
+
+    with dummy_hmt.session() as session:
+        session.print_sequence(first)
+        session.cut()
+        session.print_sequence(second)
+        # nothing is sent until the session is committed
+        assert dummy_hmt.printer.output == b""
+
+    assert dummy_hmt.printer.output == expected.output
+    assert len(session) == 0
+
+
+def test_session_discarded(dummy_hmt: Hanmoto) -> None:
+    with pytest.raises(RuntimeError):
+        with dummy_hmt.session() as session:
+            session.print_sequence([HmtText("canceled\n")])
+            raise RuntimeError()
+
+    assert dummy_hmt.printer.output == b""
+
+
+def test_session_uploads_stored_images(dummy_hmt: Hanmoto) -> None:
+    dummy_hmt.store_image("logo", HmtImage(Image.new("L", (8, 8), 0)))
+    sequence = [HmtStoredImage("logo")]
+
+    session = dummy_hmt.session()
+    session.print_sequence(sequence)
+    session.print_sequence(sequence)
+    session.commit(cut=False)
+
+    program = dummy_hmt.compile(sequence)
+    assert dummy_hmt.printer.output == (
+        dummy_hmt.graphics.define(["logo"]) + program + program
+    )
+
+
+def test_concurrent_sessions() -> None:
+    with FakePrinterServer() as server:
+        hmt = Hanmoto.from_network(
+            HmtLocalizerEnum.en, host=server.host, port=server.port
+        )
+        receipts = [
+            [HmtText(f"receipt {i} line {j}\n") for j in range(20)]
+            for i in range(8)
+        ]
+        programs = [
+            b"".join(hmt.compile([text]) for text in receipt)
+            + hmt.cut_command()
+            for receipt in receipts
+        ]
+
+        def print_receipt(receipt: List[HmtText]) -> None:
+            with hmt.session() as session:
+                for text in receipt:
+                    session.print_sequence([text])
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(print_receipt, receipts))
+        assert server.wait_for(sum(len(program) for program in programs))
+        hmt.printer.close()
+
+    # every receipt is sent in one piece
+    for program in programs:
+        assert program in server.output
@@ -0,0 +1,166 @@
+import asyncio
+from pathlib import Path
+from typing import List, Union
+
+from escpos.printer import Dummy
+
+from hanmoto import AsyncHanmoto, Hanmoto, HmtText
+from hanmoto.aio import HmtAsyncDummy
+from hanmoto.jobs import HmtJob, HmtJobQueue, HmtJobStatus
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.spool import HmtSpool
+
+SEQUENCES = [[HmtText(f"ticket {i}\n")] for i in range(3)]
+
+
+class FlakyDummy(HmtAsyncDummy):
+    def __init__(self, failures: int) -> None:
+        super().__init__()
+        self.failures = failures
+
+    async def write(self, data: bytes) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError("connection reset by printer")
+        await super().write(data)
+
+
+class FlakyPrinter(Dummy):
+    def __init__(self, failures: int) -> None:
+        super().__init__()
+        self.failures = failures
+
+    def _raw(self, msg: bytes) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError("connection reset by printer")
+        super()._raw(msg)
+
+
+def expected_output(hmt: Union[Hanmoto, AsyncHanmoto]) -> bytes:
+    expected = Dummy()
+    for sequence in SEQUENCES:
+        expected._raw(hmt.compile(sequence))
+        expected.cut()
+    return expected.output
+
+
+def test_restore(tmp_path: Path) -> None:
+    path = str(tmp_path / "spool.db")
+    hmt = AsyncHanmoto.from_dummy(HmtLocalizerEnum.en)
+
+    async def submit() -> List[HmtJob]:
+        spool = HmtSpool(path)
+        queue = HmtJobQueue(hmt, spool=spool)
+        await queue.start()
+        # queued together, and stopped before the worker takes a job
+        jobs = await queue.submit_batch(
+            [(sequence, True) for sequence in SEQUENCES]
+        )
+        await queue.stop()
+        spool.close()
+        return jobs
+
+    async def restart() -> List[HmtJob]:
+        spool = HmtSpool(path)
+        queue = HmtJobQueue(hmt, spool=spool)
+        await queue.start()
+        await queue.join()
+        await queue.stop()
+        assert spool.stats()["pending"] == 0
+        assert spool.stats()["finished"] == 0
+        spool.close()
+        return list(queue.jobs.values())
+
+    submitted = asyncio.run(submit())
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    assert hmt.transport.output == b""
+
+    restored = asyncio.run(restart())
+
+    assert [job.id for job in restored] == [job.id for job in submitted]
+    assert [job.status for job in restored] == [HmtJobStatus.done] * 3
+    assert hmt.transport.output == expected_output(hmt)
+
+
+def test_retry(tmp_path: Path) -> None:
+    hmt = AsyncHanmoto(FlakyDummy(failures=2), HmtLocalizerEnum.en)
+    spool = HmtSpool(str(tmp_path / "spool.db"), retry_delay=0.0)
+
+    async def print_jobs() -> List[HmtJob]:
+        queue = HmtJobQueue(hmt, spool=spool)
+        await queue.start()
+        jobs = [await queue.submit(sequence) for sequence in SEQUENCES]
+        await queue.join()
+        await queue.stop()
+        return jobs
+
+    jobs = asyncio.run(print_jobs())
+
+    assert [job.status for job in jobs] == [HmtJobStatus.done] * 3
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    assert hmt.transport.output == expected_output(hmt)
+
+
+def test_retry_batch_sync_printer(tmp_path: Path) -> None:
+    hmt = Hanmoto(FlakyPrinter(failures=2), HmtLocalizerEnum.en)
+    spool = HmtSpool(str(tmp_path / "spool.db"), retry_delay=0.0)
+
+    async def print_batch() -> List[HmtJob]:
+        queue = HmtJobQueue(hmt, spool=spool)
+        await queue.start()
+        jobs = await queue.submit_batch(
+            [(sequence, True) for sequence in SEQUENCES]
+        )
+        await queue.join()
+        await queue.stop()
+        return jobs
+
+    jobs = asyncio.run(print_batch())
+
+    assert [job.status for job in jobs] == [HmtJobStatus.done] * 3
+    assert hmt.printer.output == expected_output(hmt)
+    assert spool.stats()["pending"] == 0
+
+
+def test_retry_exhausted(tmp_path: Path) -> None:
+    hmt = AsyncHanmoto(FlakyDummy(failures=10), HmtLocalizerEnum.en)
+    spool = HmtSpool(
+        str(tmp_path / "spool.db"), max_attempts=2, retry_delay=0.0
+    )
+
+    async def print_job() -> HmtJob:
+        queue = HmtJobQueue(hmt, spool=spool)
+        await queue.start()
+        job = await queue.submit(SEQUENCES[0])
+        await queue.join()
+        await queue.stop()
+        return job
+
+    job = asyncio.run(print_job())
+
+    assert job.status is HmtJobStatus.failed
+    assert job.error == "ConnectionResetError: connection reset by printer"
+    assert spool.stats()["pending"] == 0
+
+
+def test_compact(tmp_path: Path) -> None:
+    spool = HmtSpool(str(tmp_path / "spool.db"))
+    jobs = [
+        HmtJob(printer="default", printables=sequence)
+        for sequence in SEQUENCES
+    ]
+    for job in jobs:
+        spool.put(job, b"program")
+    jobs[0].status = HmtJobStatus.done
+    spool.finish(jobs[0])
+
+    assert spool.stats()["pending"] == 2
+    assert spool.stats()["finished"] == 1
+    assert [job.id for job, _ in spool.pending("default")] == [
+        job.id for job in jobs[1:]
+    ]
+
+    assert spool.compact() == 1
+    assert spool.stats()["finished"] == 0
+    assert spool.pending("other") == []
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from typing import Generator
+
+import pytest
+
+from hanmoto import AsyncHanmoto, HmtText
+from hanmoto.aio import HmtAsyncNetwork
+from hanmoto.connection import HmtNetwork
+from hanmoto.exceptions import HmtPrinterStatusException
+from hanmoto.jobs import HmtJob, HmtJobQueue, HmtJobStatus
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.status import (
+    ASB_ENABLE,
+    STATUS_REQUEST,
+    HmtPrinterStatus,
+    HmtStatusReader,
+)
+from hanmoto.testing import FakePrinterServer
+
+
+@pytest.fixture
+def fake_printer() -> Generator[FakePrinterServer, None, None]:
+    with FakePrinterServer() as server:
+        yield server
+
+
+@pytest.mark.parametrize(
+    "problem",
+    [None, "cover_open", "paper_out", "error", "online"],
+)
+def test_status_bytes(problem: str) -> None:
+    status = HmtPrinterStatus(paper_near_end=True)
+    if problem is not None:
+        status = status.copy(update={problem: problem != "online"})
+
+    for parsed in (
+        HmtPrinterStatus.from_replies(status.to_replies()),
+        HmtPrinterStatus.from_asb(status.to_asb()),
+    ):
+        assert parsed.dict(exclude={"checked_at"}) == status.dict(
+            exclude={"checked_at"}
+        )
+        assert parsed.ready is (problem is None)
+
+
+def test_status_reader() -> None:
+    reader = HmtStatusReader("test")
+    paper_out = HmtPrinterStatus(paper_out=True)
+    ready = HmtPrinterStatus().to_replies()
+
+    replies = reader.feed(ready[:2] + paper_out.to_asb()[:3])
+    assert replies == list(ready[:2])
+    assert reader.status is None
+
+    replies = reader.feed(paper_out.to_asb()[3:] + ready[2:])
+    assert replies == list(ready[2:])
+    assert reader.status is not None
+    assert reader.status.problem == "paper is out"
+    assert reader.stale(60)
+
+
+def test_async_status(fake_printer: FakePrinterServer) -> None:
+    transport = HmtAsyncNetwork(
+        fake_printer.host, fake_printer.port, status_check=True
+    )
+
+    async def write() -> HmtPrinterStatus:
+        await transport.write(b"test_async_status")
+        status = await transport.status()
+        assert status is not None
+        await transport.close()
+        return status
+
+    status = asyncio.run(write())
+
+    assert status.ready
+    assert fake_printer.wait_for(len(ASB_ENABLE + STATUS_REQUEST) + 17)
+    assert fake_printer.output.startswith(
+        ASB_ENABLE + STATUS_REQUEST + b"test_async_status"
+    )
+
+
+def test_async_fail_fast(fake_printer: FakePrinterServer) -> None:
+    fake_printer.set_status(paper_out=True)
+    transport = HmtAsyncNetwork(
+        fake_printer.host, fake_printer.port, status_check=True
+    )
+
+    async def write() -> None:
+        try:
+            await transport.write(b"test_async_fail_fast")
+        finally:
+            await transport.close()
+
+    with pytest.raises(HmtPrinterStatusException, match="paper is out"):
+        asyncio.run(write())
+
+
+def test_async_stops_sending(fake_printer: FakePrinterServer) -> None:
+    transport = HmtAsyncNetwork(
+        fake_printer.host,
+        fake_printer.port,
+        timeout=30,
+        status_check=True,
+        status_timeout=0.2,
+        chunk_size=1024,
+    )
+
+    async def write() -> None:
+        await transport.write(b"first")
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.2, lambda: fake_printer.set_status(cover_open=True))
+        try:
+            await transport.write(b"x" * 64 * 1024 * 1024)
+        finally:
+            await transport.close()
+
+    start = time.monotonic()
+    with pytest.raises(HmtPrinterStatusException, match="cover is open"):
+        asyncio.run(write())
+
+    # instead of stalling until the timeout
+    assert time.monotonic() - start < 5
+    assert len(fake_printer.output) < 16 * 1024 * 1024
+
+
+def test_sync_fail_fast(fake_printer: FakePrinterServer) -> None:
+    printer = HmtNetwork(
+        fake_printer.host, fake_printer.port, status_check=True
+    )
+    printer._raw(b"first")
+    status = printer.status()
+    assert status is not None and status.ready
+
+    fake_printer.set_status(cover_open=True)
+    time.sleep(0.1)
+    start = time.monotonic()
+    with pytest.raises(HmtPrinterStatusException, match="cover is open"):
+        printer._raw(b"second")
+
+    assert time.monotonic() - start < 1
+    assert printer.device is None
+
+
+def test_job_fails_fast(fake_printer: FakePrinterServer) -> None:
+    fake_printer.set_status(paper_out=True)
+    hmt = AsyncHanmoto.from_network(
+        "en",
+        fake_printer.host,
+        fake_printer.port,
+        status_check=True,
+    )
+
+    async def print_job() -> HmtJob:
+        queue = HmtJobQueue(hmt)
+        await queue.start()
+        job = await queue.submit([HmtText("test_job_fails_fast")])
+        await queue.join()
+        assert not queue.online
+        await queue.stop()
+        return job
+
+    job = asyncio.run(print_job())
+
+    assert job.status is HmtJobStatus.failed
+    assert job.error is not None and "paper is out" in job.error
+    assert b"test_job_fails_fast" not in fake_printer.output
+
+
+def test_status_without_check() -> None:
+    hmt = AsyncHanmoto.from_dummy(HmtLocalizerEnum.en)
+
+    assert asyncio.run(hmt.status()) is None
+    assert hmt.printer_status is None
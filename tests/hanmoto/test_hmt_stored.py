@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from hanmoto import (
+    AsyncHanmoto,
+    Hanmoto,
+    HmtGraphicsMemory,
+    HmtImage,
+    HmtStoredImage,
+    HmtText,
+)
+from hanmoto.aio import HmtAsyncDummy
+from hanmoto.exceptions import HmtValueException
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.stored import HmtStoredGraphics
+from hanmoto.testing import FakePrinterServer
+from tests.hanmoto.fixtures import dummy_hmt
+
+LOGO = Image.new("L", (16, 2), 0)
+LOGO_DATA = b"\xff\xff\xff\xff"
+
+
+def test_download_graphics() -> None:
+    graphics = HmtStoredGraphics()
+    graphics.register("logo", HmtImage(LOGO))
+
+    assert graphics.define(["logo"]) == (
+        b"\x1d(L\x0f\x000S0H \x01\x10\x00\x02\x001" + LOGO_DATA
+    )
+    assert graphics.print_command(HmtStoredImage("logo")) == (
+        b"\x1d(L\x06\x000UH \x01\x01"
+    )
+    assert graphics.print_command(HmtStoredImage("logo").double_width()) == (
+        b"\x1d(L\x06\x000UH \x02\x01"
+    )
+
+
+def test_nv_graphics() -> None:
+    graphics = HmtStoredGraphics(HmtGraphicsMemory.nv)
+    graphics.register("logo", HmtImage(LOGO))
+    graphics.register("stamp", HmtImage(LOGO))
+
+    assert graphics.define(["stamp"]).startswith(b"\x1d(L\x0f\x000C0H!")
+    assert graphics.print_command(HmtStoredImage("stamp")) == (
+        b"\x1d(L\x06\x000EH!\x01\x01"
+    )
+
+    graphics.loaded(["logo"], connection=0)
+    assert graphics.missing(["logo", "stamp"], connection=1) == ["stamp"]
+
+
+def test_nv_bit_image() -> None:
+    graphics = HmtStoredGraphics(HmtGraphicsMemory.nv_bit_image)
+    graphics.register("logo", HmtImage(LOGO))
+    graphics.register("stamp", HmtImage(Image.new("L", (8, 8), 255)))
+
+    # all images are defined at once, with columns of 8 dots per byte
+    logo = b"\x02\x00\x01\x00" + b"\xc0" * 16
+    stamp = b"\x01\x00\x01\x00" + b"\x00" * 8
+    assert graphics.missing(["stamp"], connection=0) == ["logo", "stamp"]
+    assert graphics.define(["stamp"]) == b"\x1cq\x02" + logo + stamp
+    assert graphics.print_command(
+        HmtStoredImage("stamp").double_width().double_height()
+    ) == (b"\x1cp\x02\x03")
+
+
+def test_unknown_key(dummy_hmt: Hanmoto) -> None:
+    with pytest.raises(HmtValueException):
+        dummy_hmt.print_sequence([HmtStoredImage("logo")])
+
+
+def test_upload_once(dummy_hmt: Hanmoto) -> None:
+    dummy_hmt.store_image("logo", HmtImage(LOGO))
+    sequence = [HmtStoredImage("logo"), HmtText("thanks")]
+    upload = dummy_hmt.graphics.define(["logo"])
+    program = dummy_hmt.compile(sequence)
+
+    dummy_hmt.print_sequence(sequence)
+    dummy_hmt.print_sequence(sequence)
+
+    assert dummy_hmt.printer.output == upload + program + program
+    assert dummy_hmt.stats()["stored_graphics"]["uploads"] == 1
+
+
+def test_upload_after_reconnect() -> None:
+    with FakePrinterServer() as server:
+        hmt = Hanmoto.from_network(
+            HmtLocalizerEnum.en, host=server.host, port=server.port
+        )
+        hmt.store_image("logo", HmtImage(LOGO))
+        sequence = [HmtStoredImage("logo")]
+        upload = hmt.graphics.define(["logo"])
+        program = hmt.compile(sequence)
+
+        hmt.print_sequence(sequence)
+        hmt.print_sequence(sequence)
+        assert server.wait_for(len(upload) + 2 * len(program))
+
+        server.reset()
+        deadline = time.monotonic() + 5
+        while hmt.printer.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        hmt.print_sequence(sequence)
+        expected = upload + program + program + upload + program
+        assert server.wait_for(len(expected))
+        assert server.output == expected
+        assert server.connections == 2
+        hmt.printer.close()
+
+
+def test_async_upload_once() -> None:
+    hmt = AsyncHanmoto.from_dummy(HmtLocalizerEnum.en)
+    hmt.store_image("logo", HmtImage(LOGO))
+    sequence = [HmtStoredImage("logo")]
+
+    async def print_sequence() -> None:
+        await hmt.print_sequence(sequence)
+        await hmt.print_sequence(sequence)
+
+    asyncio.run(print_sequence())
+
+    assert isinstance(hmt.transport, HmtAsyncDummy)
+    program = hmt.compile(sequence)
+    assert hmt.transport.output == (
+        hmt.graphics.define(["logo"]) + program + program
+    )
+
+
+def test_stored_image_is_smaller() -> None:
+    logo = Image.fromarray(np.full((120, 384), 0, dtype=np.uint8))
+    hmt = Hanmoto.from_dummy(HmtLocalizerEnum.en)
+    hmt.store_image("logo", HmtImage(logo))
+
+    stored = hmt.compile([HmtStoredImage("logo")])
+    assert len(stored) < len(hmt.compile([HmtImage(logo)])) // 100
@@ -0,0 +1,117 @@
+import pytest
+from PIL import Image
+
+from hanmoto import (
+    Hanmoto,
+    HmtImage,
+    HmtRaw,
+    HmtStoredImage,
+    HmtText,
+    HmtTextStyle,
+)
+from hanmoto.exceptions import HmtValueException
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.templates import HmtTemplate, HmtTemplateSection
+from tests.hanmoto.fixtures import dummy_hmt
+
+LOGO = HmtImage(Image.new("L", (16, 16), 0))
+RECEIPT = HmtTemplate(
+    "receipt",
+    [
+        LOGO,
+        HmtText("Hanmoto store\n", HmtTextStyle(bold=True)),
+        HmtText("{{ receipt }}\n"),
+        HmtTemplateSection(
+            "items",
+            [HmtText("{name:<10}{price:>6}\n"), HmtText("-\n")],
+        ),
+        HmtText("total {total:>10}\n"),
+        HmtText("thanks\n"),
+    ],
+)
+
+
+def test_fill(dummy_hmt: Hanmoto) -> None:
+    sequence = RECEIPT.fill(
+        dummy_hmt.compiler,
+        {
+            "items": [
+                {"name": "apple", "price": 120},
+                {"name": "melon", "price": 980},
+            ],
+            "total": 1100,
+        },
+    )
+
+    header = dummy_hmt.compiler.compile_part(
+        [
+            LOGO,
+            HmtText("Hanmoto store\n", HmtTextStyle(bold=True)),
+            HmtText("{ receipt }\n"),
+        ]
+    )
+    separator = dummy_hmt.compiler.compile_part([HmtText("-\n")])
+    assert sequence == [
+        HmtRaw(header),
+        HmtText("apple        120\n"),
+        HmtRaw(separator),
+        HmtText("melon        980\n"),
+        HmtRaw(separator),
+        HmtText("total       1100\n"),
+        HmtRaw(dummy_hmt.compiler.compile_part([HmtText("thanks\n")])),
+    ]
+    assert RECEIPT.variables == {"items", "total"}
+
+
+def test_static_parts_compiled_once(dummy_hmt: Hanmoto) -> None:
+    template = HmtTemplate("static", [LOGO, HmtText("{name}\n")])
+    first = template.fill(dummy_hmt.compiler, {"name": "first"})
+    second = template.fill(dummy_hmt.compiler, {"name": "second"})
+
+    assert first[0] is second[0]
+    other = Hanmoto.from_dummy(HmtLocalizerEnum.jp)
+    assert template.fill(other.compiler, {"name": "third"})[0] is not (
+        first[0]
+    )
+
+
+def test_filled_program(dummy_hmt: Hanmoto) -> None:
+    template = HmtTemplate(
+        "styles",
+        [
+            HmtText("header\n", HmtTextStyle(bold=True)),
+            HmtText("{body}\n", HmtTextStyle(bold=True)),
+        ],
+    )
+    sequence = template.fill(dummy_hmt.compiler, {"body": "body"})
+
+    # texts after precompiled parts set every style again
+    program = dummy_hmt.compile(sequence)
+    expected = dummy_hmt.compile(
+        [
+            HmtText("header\n", HmtTextStyle(bold=True)),
+            HmtText("body\n", HmtTextStyle(bold=True)),
+        ]
+    )
+    assert program.startswith(expected[: expected.index(b"header")])
+    assert program.count(b"\x1bE\x01") == 2
+
+
+def test_stored_image_in_template(dummy_hmt: Hanmoto) -> None:
+    dummy_hmt.store_image("logo", LOGO)
+    template = HmtTemplate("stored", [HmtStoredImage("logo")])
+
+    dummy_hmt.print_sequence(template.fill(dummy_hmt.compiler, {}))
+
+    assert dummy_hmt.printer.output.startswith(
+        dummy_hmt.graphics.define(["logo"])
+    )
+
+
+def test_fill_errors(dummy_hmt: Hanmoto) -> None:
+    with pytest.raises(HmtValueException, match="total"):
+        RECEIPT.fill(dummy_hmt.compiler, {"items": []})
+    with pytest.raises(HmtValueException, match="list of objects"):
+        RECEIPT.fill(dummy_hmt.compiler, {"items": "apple", "total": 0})
+    with pytest.raises(HmtValueException):
+        HmtTemplate("broken", [HmtText("{name")])
@@ -0,0 +1,77 @@
+import time
+from typing import Generator
+
+import pytest
+
+from hanmoto import Hanmoto, HmtText
+from hanmoto.localizer import HmtLocalizerEnum
+from hanmoto.testing import FakePrinterServer
+
+
+@pytest.fixture
+def fake_printer() -> Generator[FakePrinterServer, None, None]:
+    with FakePrinterServer() as server:
+        yield server
+
+
+def test_record_stream(fake_printer: FakePrinterServer) -> None:
+    hmt = Hanmoto.from_network(
+        HmtLocalizerEnum.en, host=fake_printer.host, port=fake_printer.port
+    )
+    sequence = [HmtText("test_record_stream")]
+    program = hmt.compile(sequence)
+    with hmt:
+        hmt.print_sequence(sequence)
+
+    assert fake_printer.wait_for(len(program) + 3)
+    assert fake_printer.output.startswith(program)
+    assert fake_printer.connections == 1
+    hmt.printer.close()
+
+
+def test_bandwidth() -> None:
+    with FakePrinterServer(bandwidth=20_000, chunk_size=1000) as server:
+        hmt = Hanmoto.from_network(
+            HmtLocalizerEnum.en, host=server.host, port=server.port
+        )
+        start = time.monotonic()
+        hmt.printer._raw(b"x" * 4000)
+        assert server.wait_for(4000)
+        server.wait_for(4001, timeout=0.1)
+
+        assert time.monotonic() - start >= 0.15
+        hmt.printer.close()
+
+
+def test_reset(fake_printer: FakePrinterServer) -> None:
+    hmt = Hanmoto.from_network(
+        HmtLocalizerEnum.en, host=fake_printer.host, port=fake_printer.port
+    )
+    hmt.printer._raw(b"first")
+    assert fake_printer.wait_for(5)
+
+    fake_printer.reset()
+    time.sleep(0.1)
+    hmt.printer._raw(b"second")
+
+    assert fake_printer.wait_for(11)
+    assert fake_printer.output == b"firstsecond"
+    assert fake_printer.connections == 2
+    assert hmt.printer.reconnects == 1
+    hmt.printer.close()
+
+
+def test_stall(fake_printer: FakePrinterServer) -> None:
+    hmt = Hanmoto.from_network(
+        HmtLocalizerEnum.en, host=fake_printer.host, port=fake_printer.port
+    )
+    hmt.printer._raw(b"first")
+    assert fake_printer.wait_for(5)
+
+    fake_printer.stall(0.3)
+    time.sleep(0.05)
+    hmt.printer._raw(b"second")
+
+    assert not fake_printer.wait_for(11, timeout=0.1)
+    assert fake_printer.wait_for(11, timeout=1)
+    hmt.printer.close()
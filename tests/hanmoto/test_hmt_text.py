@@ -5,8 +5,9 @@ from pytest import FixtureRequest
 from pytest_mock import MockerFixture, MockFixture
 
 from hanmoto import Hanmoto, HmtText
+from hanmoto.localizer import HmtLocalizerEnum, HmtLocalizerJp
 from tests.hanmoto.fixtures import patched_escpos_printer
-from tests.util import create_test_hmtconf, include_list_with_order
+from tests.util import create_test_hmtconf, include_bytes_with_order
 
 
 @pytest.fixture
@@ -48,7 +49,7 @@ def test_text_style(dummy_hmt: Hanmoto) -> None:
     with dummy_hmt:
         dummy_hmt.print_sequence([text])
 
-        assert dummy_hmt.printer._output_list == print_expected
+        assert dummy_hmt.printer._output_list == [b"".join(print_expected)]
 
 
 @pytest.mark.parametrize("dummy_hmt", ["jp"], indirect=True)
@@ -59,8 +60,8 @@ def test_jp_text(dummy_hmt: Hanmoto) -> None:
         b"\x1c\x43\x02",  # FS C 2 (specify Shift_JIS-2004)
     ]
 
-    assert dummy_hmt.printer._output_list == init_expected
-    dummy_hmt.printer.clear()
+    assert dummy_hmt.printer._output_list == []
+    assert dummy_hmt.localizer_type is HmtLocalizerEnum.jp
 
     print_expected = [
         b"\x1c&",  # activate kanji mode
@@ -71,6 +72,43 @@ def test_jp_text(dummy_hmt: Hanmoto) -> None:
     with dummy_hmt:
         dummy_hmt.print_sequence([text])
 
-        assert include_list_with_order(
-            dummy_hmt.printer._output_list, print_expected
+        assert dummy_hmt.printer.output.startswith(b"".join(init_expected))
+        assert include_bytes_with_order(
+            dummy_hmt.printer.output, print_expected
         )
+
+
+@pytest.mark.parametrize("dummy_hmt", ["jp"], indirect=True)
+def test_jp_kanji_mode_kept_between_texts(dummy_hmt: Hanmoto) -> None:
+    program = dummy_hmt.compile(
+        [
+            HmtText("一行目"),
+            HmtText("二行目").double_width(),
+            HmtText("三行目"),
+        ]
+    )
+
+    assert program.count(b"\x1c&") == 1
+    assert program.count(b"\x1c.") == 1
+    assert include_bytes_with_order(
+        program,
+        [
+            b"\x1c&",
+            "一行目".encode("sjis_2004"),
+            b"\x1c!\x04",
+            "二行目".encode("sjis_2004"),
+            b"\x1c!\x00",
+            "三行目".encode("sjis_2004"),
+            b"\x1c.",
+        ],
+    )
+    assert program.endswith(b"\x1c.")
+
+
+@pytest.mark.parametrize("dummy_hmt", ["jp"], indirect=True)
+def test_jp_localizer(dummy_hmt: Hanmoto) -> None:
+    localizer = dummy_hmt.localizer
+
+    assert isinstance(localizer, HmtLocalizerJp)
+    assert dummy_hmt.localizer is localizer
+    assert dummy_hmt.printer._output_list == [b"\x1bt\x01", b"\x1c\x43\x02"]
@@ -154,3 +154,32 @@ def test_text_style_invert(dummy_hmt: Hanmoto) -> None:
     assert hmt_text.properties.invert
     expected = [b"\x1dB\x01"]
     assert_printed_with_command(dummy_hmt, [hmt_text], expected)
+
+
+def test_text_style_sent_only_when_changed(dummy_hmt: Hanmoto) -> None:
+    first = dummy_hmt.compile([HmtText("first")])
+    program = dummy_hmt.compile(
+        [HmtText("first"), HmtText("second"), HmtText("third").bold()]
+    )
+
+    assert program == first + b"second" + b"\x1bE\x01" + b"third"
+
+
+def test_text_style_sent_again_after_size(dummy_hmt: Hanmoto) -> None:
+    program = dummy_hmt.compile(
+        [
+            HmtText("A\n").bold().underline().font_b().double_width(),
+            HmtText("B\n").bold().underline().font_b(),
+        ]
+    )
+
+    # ESC ! of the normal size turns bold, underline and font b off
+    _, second = program.split(b"A\n")
+    assert second.startswith(b"\x1b!\x00")
+    assert second.endswith(b"\x1bE\x01" + b"\x1b-\x01" + b"\x1bM\x01" + b"B\n")
+
+
+def test_text_style_reset_for_each_program(dummy_hmt: Hanmoto) -> None:
+    hmt_text = HmtText("test_text_style").center()
+
+    assert dummy_hmt.compile([hmt_text]) == dummy_hmt.compile([hmt_text])
@@ -0,0 +1,81 @@
+import io
+import json
+from typing import Generator
+
+import pytest
+
+from hanmoto import Hanmoto, HmtText
+from hanmoto.tracing import (
+    NOOP_SPAN,
+    HmtJsonlSink,
+    HmtRingBufferSink,
+    parse_traceparent,
+    tracer,
+)
+from tests.hanmoto.fixtures import dummy_hmt
+
+
+@pytest.fixture
+def ring_buffer() -> Generator[HmtRingBufferSink, None, None]:
+    sink = HmtRingBufferSink()
+    tracer.enable(sink)
+    yield sink
+    tracer.disable()
+
+
+def test_disabled() -> None:
+    assert not tracer.enabled
+    span = tracer.span("compile")
+    assert span is NOOP_SPAN
+    with span:
+        assert tracer.current() is None
+
+
+def test_nested_spans(
+    ring_buffer: HmtRingBufferSink, dummy_hmt: Hanmoto
+) -> None:
+    with tracer.span("request") as root:
+        with dummy_hmt:
+            dummy_hmt.print_sequence([HmtText("test"), HmtText("tracing")])
+
+    traces = ring_buffer.traces()
+    assert len(traces) == 1
+    spans = {span["span_id"]: span for span in traces[0]["spans"]}
+    names = [span["name"] for span in traces[0]["spans"]]
+    assert names == ["request", "compile", "render", "render", "send", "cut"]
+    for span in spans.values():
+        assert span["trace_id"] == root.trace_id
+        if span["name"] == "render":
+            assert spans[span["parent_id"]]["name"] == "compile"
+        elif span["name"] != "request":
+            assert span["parent_id"] == root.span_id
+    assert traces[0]["spans"][-2]["attributes"]["bytes"] > 0
+
+
+def test_error(ring_buffer: HmtRingBufferSink) -> None:
+    with pytest.raises(ValueError):
+        with tracer.span("send"):
+            raise ValueError("offline")
+    assert ring_buffer.spans[0].error == "ValueError: offline"
+
+
+def test_join_trace() -> None:
+    header = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    parent = parse_traceparent(header)
+    assert parent == {
+        "trace_id": "0af7651916cd43dd8448eb211c80319c",
+        "parent_id": "b7ad6b7169203331",
+    }
+    assert parse_traceparent("invalid") is None
+
+    stream = io.StringIO()
+    tracer.enable(HmtJsonlSink(stream))
+    try:
+        with tracer.span("request", **parent, path="/print"):
+            pass
+    finally:
+        tracer.disable()
+    span = json.loads(stream.getvalue())
+    assert span["trace_id"] == parent["trace_id"]
+    assert span["parent_id"] == parent["parent_id"]
+    assert span["attributes"] == {"path": "/print"}
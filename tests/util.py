@@ -1,6 +1,10 @@
+import time
 from pathlib import Path
 from typing import List, Union
 
+from fastapi.testclient import TestClient
+from httpx import Response
+
 from hanmoto import Hanmoto, HmtPrinterConf, Printable
 from hanmoto.config import HmtConf, HmtPrinterType
 
@@ -28,10 +32,35 @@ def include_list_with_order(actual: list, included: list) -> bool:
     return len(included) == correct
 
 
+def include_bytes_with_order(actual: bytes, included: List[bytes]) -> bool:
+    position = 0
+    for included_elem in included:
+        found = actual.find(included_elem, position)
+        if found < 0:
+            return False
+        position = found + len(included_elem)
+    return True
+
+
 def assert_printed_with_command(
     hmt: Hanmoto, printables: List[Printable], commands: List[bytes]
 ) -> None:
     with hmt:
         hmt.print_sequence(printables)
-    assert include_list_with_order(hmt.printer._output_list, commands)
+    assert include_bytes_with_order(hmt.printer.output, commands)
     hmt.printer.clear()
+
+
+def wait_for_job(
+    client: TestClient, response: Union[Response, str], timeout: float = 5.0
+) -> dict:
+    job_id = (
+        response if isinstance(response, str) else response.json()["job_id"]
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"job {job_id} did not finish in {timeout} seconds")